@@ -0,0 +1,246 @@
+"""
+多序列績效分析：策略、基準、參數掃描結果等多條權益曲線一次處理（二維陣列，欄 = 序列）。
+
+- 滾動 CAGR / 波動率 / Sharpe / Sortino：以累積和相減取得每個視窗的和，O(n)，不逐視窗迴圈
+- 回撤持續期間與回復時間：以累積最大值與「最近一次創新高位置」的累積最大值一次掃描
+- 年化一律依實際資料頻率（月 12、週 52、日 252），不寫死 sqrt(12)
+"""
+import numpy as np
+import pandas as pd
+
+SUMMARY_COLUMNS = ('CAGR', 'Volatility', 'Sharpe Ratio', 'Sortino Ratio', 'MDD',
+                   'Max Drawdown Days', 'Recovery Days')
+
+
+def periods_per_year(index: pd.DatetimeIndex) -> float:
+    """
+    由日期間距的中位數推算每年期數：日線 252、週線 52、月線 12、季線 4、年線 1。
+    資料不足時回傳 12。
+    """
+    if len(index) < 2:
+        return 12.0
+    days = (index[1:] - index[:-1]).median() / pd.Timedelta(days=1)
+    if not days > 0:
+        return 12.0
+    for limit, per_year in ((4, 252.0), (10, 52.0), (45, 12.0), (135, 4.0)):
+        if days <= limit:
+            return per_year
+    return 1.0
+
+
+def _as_2d(data) -> pd.DataFrame:
+    return data.to_frame() if isinstance(data, pd.Series) else data
+
+
+def _window_sums(values: np.ndarray, window: int, rows: np.ndarray = None) -> np.ndarray:
+    """
+    沿 axis 0 的視窗和（不處理 NaN），前 window-1 列為 NaN；呼叫端需確保 1 <= window <= len(values)。
+    指定 rows 時只計算這些列（累積和仍掃描全部，但不配置完整大小的輸出）。
+    """
+    csum = np.cumsum(values, axis=0, dtype=float)
+    if rows is None:
+        out = np.empty(csum.shape)
+        out[:window - 1] = np.nan
+        out[window - 1] = csum[window - 1]
+        np.subtract(csum[window:], csum[:-window], out=out[window:])
+        return out
+    out = csum[rows]
+    previous = rows - window
+    full = previous >= 0
+    out[full] -= csum[previous[full]]
+    out[rows < window - 1] = np.nan
+    return out
+
+
+def _nan_windows(values: np.ndarray, window: int, rows: np.ndarray = None, inplace: bool = False):
+    """
+    回傳 (NaN 改為 0 的 values, 視窗內含 NaN 的布林矩陣)；沒有任何 NaN 時第二項為 None。
+    滾動平均與標準差共用同一份遮罩，不必各自重算。inplace=True 時直接改寫 values（呼叫端自有的暫存陣列）。
+    """
+    nan = np.isnan(values)
+    if not nan.any():
+        return values, None
+    csum = np.cumsum(nan, axis=0, dtype=np.int32)
+    if rows is None:
+        counts = np.empty(csum.shape, dtype=np.int32)
+        counts[:window] = csum[:window]
+        np.subtract(csum[window:], csum[:-window], out=counts[window:])
+    else:
+        counts = csum[rows]
+        previous = rows - window
+        full = previous >= 0
+        counts[full] -= csum[previous[full]]
+    if inplace:
+        np.putmask(values, nan, 0.0)
+    else:
+        values = np.where(nan, 0.0, values)
+    return values, counts > 0
+
+
+def rolling_sum(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    沿 axis 0 的滾動視窗和（含當期共 window 期），前 window-1 列為 NaN。
+    以一次累積和相減求得；視窗內有 NaN 時結果為 NaN。
+    """
+    values = np.asarray(values, dtype=float)
+    if not 1 <= window <= len(values):
+        return np.full(values.shape, np.nan)
+    filled, bad = _nan_windows(values, window)
+    out = _window_sums(filled, window)
+    if bad is not None:
+        np.putmask(out, bad, np.nan)
+    return out
+
+
+def rolling_mean_std(values: np.ndarray, window: int, rows=None) -> tuple:
+    """
+    滾動平均與樣本標準差（ddof=1）。先減去各欄整體平均再累加平方，
+    降低大數相減造成的精度損失（變異數不受平移影響）。
+    兩個累積和共用一份 NaN 遮罩，整個 日期 × 標的 矩陣只掃描數次，不逐欄 rolling().std()。
+    rows：只需要部分列（例如每個結算日）時傳入列位置，回傳 shape 為 (len(rows), 欄數)。
+    """
+    values = np.asarray(values, dtype=float)
+    rows = None if rows is None else np.asarray(rows, dtype=np.intp)
+    shape = values.shape if rows is None else (len(rows),) + values.shape[1:]
+    if not 1 <= window <= len(values):
+        return np.full(shape, np.nan), np.full(shape, np.nan)
+    # 平移量只需接近各欄平均即可，取等距抽樣的平均，不必掃描整個矩陣
+    with np.errstate(invalid='ignore'):
+        center = np.nan_to_num(np.nanmean(values[::max(1, len(values) // 256)], axis=0))
+    shifted, bad = _nan_windows(values - center, window, rows, inplace=True)
+    s1 = _window_sums(shifted, window, rows)
+    shifted *= shifted
+    s2 = _window_sums(shifted, window, rows)
+    if bad is not None:
+        np.putmask(s1, bad, np.nan)
+    mean = s1 / window + center
+    if window < 2:
+        return mean, np.full(shape, np.nan)
+    s1 *= s1
+    s1 /= window
+    s2 -= s1
+    s2 /= window - 1
+    np.maximum(s2, 0.0, out=s2)
+    return mean, np.sqrt(s2, out=s2)
+
+
+def rolling_metrics(returns, window: int = 12, per_year: float = None) -> dict:
+    """
+    逐期報酬（Series 或 DataFrame，欄 = 序列）的滾動指標，每項為與輸入同形狀的 DataFrame：
+    CAGR、Volatility（年化）、Sharpe Ratio、Sortino Ratio（下檔偏差以 0 為門檻）。
+    視窗未滿或含 NaN 的位置為 NaN。
+    """
+    returns = _as_2d(returns)
+    if per_year is None:
+        per_year = periods_per_year(returns.index)
+    r = returns.to_numpy(dtype=float)
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        growth = np.exp(rolling_sum(np.log1p(r), window))
+        cagr = growth ** (per_year / window) - 1
+        mean, std = rolling_mean_std(r, window)
+        downside = np.sqrt(rolling_sum(np.minimum(r, 0.0) ** 2, window) / window)
+        scale = np.sqrt(per_year)
+        sharpe = np.where(std > 0, mean / std * scale, np.where(np.isnan(std), np.nan, 0.0))
+        sortino = np.where(downside > 0, mean / downside * scale, np.where(np.isnan(downside), np.nan, 0.0))
+
+    def frame(values):
+        return pd.DataFrame(values, index=returns.index, columns=returns.columns)
+
+    return {
+        'CAGR': frame(cagr),
+        'Volatility': frame(std * scale),
+        'Sharpe Ratio': frame(sharpe),
+        'Sortino Ratio': frame(sortino),
+    }
+
+
+def drawdowns(values) -> pd.DataFrame:
+    """權益曲線（Series 或 DataFrame）的逐期回撤（<= 0）；序列開始前為 NaN。"""
+    values = _as_2d(values)
+    v = values.to_numpy(dtype=float)
+    with np.errstate(invalid='ignore'):
+        dd = v / np.fmax.accumulate(v, axis=0) - 1
+    return pd.DataFrame(dd, index=values.index, columns=values.columns)
+
+
+def drawdown_stats(values) -> pd.DataFrame:
+    """
+    每條權益曲線的回撤統計（列 = 序列）：
+    - MDD：最大回撤
+    - Max Drawdown Days：最長的水下期間（自前高起算的日曆天數，含尚未回復者）
+    - Recovery Days：最大回撤自谷底回到前高所需天數，尚未回復為 NaN
+    """
+    values = _as_2d(values)
+    v = values.to_numpy(dtype=float)
+    n, k = v.shape
+    days = ((values.index - values.index[0]) / pd.Timedelta(days=1)).to_numpy(dtype=float)
+    rows = np.arange(n)[:, None]
+
+    with np.errstate(invalid='ignore'):
+        peak = np.fmax.accumulate(v, axis=0)
+        dd = v / peak - 1
+        # 最近一次創新高的位置；序列開始前為 -1
+        peak_pos = np.maximum.accumulate(np.where(v >= peak, rows, -1), axis=0)
+
+    started = peak_pos >= 0
+    underwater = np.where(started, days[:, None] - days[np.maximum(peak_pos, 0)], np.nan)
+
+    has_data = started.any(axis=0)
+    dd_filled = np.where(np.isnan(dd), np.inf, dd)
+    trough = np.argmin(dd_filled, axis=0)
+    mdd = np.where(has_data, dd_filled[trough, np.arange(k)], np.nan)
+
+    # 谷底之後第一個回到前高的位置
+    recovered = (rows > trough) & (v >= peak[trough, np.arange(k)])
+    first = np.argmax(recovered, axis=0)
+    recovery = np.where(recovered.any(axis=0), days[first] - days[trough], np.nan)
+    recovery = np.where(mdd < 0, recovery, np.where(has_data, 0.0, np.nan))
+
+    with np.errstate(invalid='ignore'):
+        longest = np.where(has_data, np.nanmax(np.where(started, underwater, -np.inf), axis=0), np.nan)
+
+    return pd.DataFrame({
+        'MDD': np.minimum(mdd, 0.0),
+        'Max Drawdown Days': longest,
+        'Recovery Days': recovery,
+    }, index=values.columns)
+
+
+def performance_summary(values, per_year: float = None) -> pd.DataFrame:
+    """
+    多條權益曲線的完整指標表（列 = 序列，欄 = SUMMARY_COLUMNS），依實際頻率年化。
+    各序列可有不同的起始日（開頭為 NaN），CAGR 以各自的第一筆有效值起算。
+    """
+    values = _as_2d(values)
+    if per_year is None:
+        per_year = periods_per_year(values.index)
+    v = values.to_numpy(dtype=float)
+    n, k = v.shape
+    cols = np.arange(k)
+
+    valid = ~np.isnan(v)
+    first = np.argmax(valid, axis=0)
+    last = n - 1 - np.argmax(valid[::-1], axis=0)
+    days = ((values.index - values.index[0]) / pd.Timedelta(days=1)).to_numpy(dtype=float)
+    years = (days[last] - days[first]) / 365.25
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = v[1:] / v[:-1] - 1
+        count = (~np.isnan(r)).sum(axis=0)
+        mean = np.nanmean(r, axis=0) if n > 1 else np.full(k, np.nan)
+        std = np.sqrt(np.nansum((r - mean) ** 2, axis=0) / (count - 1))
+        downside = np.sqrt(np.nansum(np.minimum(r, 0.0) ** 2, axis=0) / count)
+        scale = np.sqrt(per_year)
+        cagr = (v[last, cols] / v[first, cols]) ** (1 / years) - 1
+        sharpe = np.where(std > 0, mean / std * scale, 0.0)
+        sortino = np.where(downside > 0, mean / downside * scale, 0.0)
+
+    table = pd.DataFrame({
+        'CAGR': np.where(years > 0, cagr, np.nan),
+        'Volatility': std * scale,
+        'Sharpe Ratio': np.where(count > 1, sharpe, np.nan),
+        'Sortino Ratio': np.where(count > 0, sortino, np.nan),
+    }, index=values.columns)
+    table = table.join(drawdown_stats(values))
+    return table[list(SUMMARY_COLUMNS)]
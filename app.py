@@ -1,10 +1,20 @@
+import json
+import os
+import time
 import streamlit as st
 import pandas as pd
-import plotly.graph_objects as go
 from datetime import timedelta
 from data import DataFetcher
-from strategy import MomentumStrategy
+from shared_prices import SharedPriceStore
+from strategy import MomentumStrategy, StreamingPeriodReturns
 from backtest import Backtest
+from sweep import build_grid, run_sweep
+from walk_forward import walk_forward, RANKABLE_METRICS
+from robustness import run_robustness
+from analytics import rolling_metrics, performance_summary
+from membership import MembershipHistory
+from run_cache import RunCache, fingerprint, price_fingerprint, run_key
+import tracing
 
 st.set_page_config(page_title="美股雙動能策略回測", layout="wide")
 st.title("美股雙動能策略回測工具")
@@ -16,6 +26,8 @@ st.sidebar.header("回測參數設定")
 
 if st.sidebar.button("清除快取", help="若遇到數據錯誤或想強制重新下載，請點此清除所有快取。"):
     st.cache_data.clear()
+    st.cache_resource.clear()
+    SharedPriceStore().expire()
     st.sidebar.success("快取已清除！")
     st.rerun()
 
@@ -52,8 +64,8 @@ col_title, col_btn = st.sidebar.columns([2, 1])
 col_title.markdown("**市值前 50 大**")
 update_placeholder = st.sidebar.empty()
 
-if col_btn.button("🔄 更新", help="使用 yfinance 查詢即時市值，依市值排序取前 50 大。約需 30-60 秒。"):
-    update_placeholder.info("⏳ 正在查詢 500 檔市值，請耐心等待（約 30-60 秒）...")
+if col_btn.button("🔄 更新", help="使用 yfinance 查詢即時市值，依市值排序取前 50 大。今日已查詢過則直接使用快照。"):
+    update_placeholder.info("⏳ 正在查詢 500 檔市值（首次約 30-60 秒，今日已查詢過則立即完成）...")
     try:
         fetcher = DataFetcher()
         top_50, source = fetcher.get_top_n_by_market_cap(50)
@@ -124,11 +136,39 @@ else:
         "攻擊型資產（逗號分隔）",
         value=st.session_state['risky_assets_str'],
         key='risky_assets_input',
-        help="輸入美股代碼（逗號分隔）。注意：使用當前市值排名回測存在倖存者偏差。",
+        help="輸入美股代碼（逗號分隔）。注意：使用當前市值排名回測存在倖存者偏差，可於下方指定歷史成分股事件檔修正。",
         on_change=lambda: st.session_state.update({'risky_assets_str': st.session_state.risky_assets_input})
     )
     risky_assets = [x.strip() for x in risky_assets_input.split(',') if x.strip()]
 
+# 歷史成分股（消除倖存者偏差）
+@st.cache_data(show_spinner=False)
+def load_membership(path: str, mtime: float) -> MembershipHistory:
+    # mtime 只作為快取鍵：檔案更新後自動重新編譯
+    return MembershipHistory.load(path)
+
+membership = None
+membership_path = st.sidebar.text_input(
+    "歷史成分股事件檔（選填）",
+    value=os.environ.get("MEMBERSHIP_FILE", ""),
+    help="CSV 欄位 date,ticker,action（add / remove）。指定後每個結算日只從當時的成分股中選股，消除倖存者偏差；不在檔案中的代碼不會被選入。"
+).strip()
+if membership_path:
+    if not os.path.exists(membership_path):
+        st.sidebar.error(f"❌ 找不到成分股事件檔：{membership_path}")
+    else:
+        try:
+            membership = load_membership(membership_path, os.path.getmtime(membership_path))
+            st.sidebar.caption(
+                f"✅ 歷史成分股：{len(membership.tickers)} 檔、{len(membership.event_dates)} 個異動日"
+                f"（{membership.event_dates[0].date()} ~ {membership.event_dates[-1].date()}）"
+            )
+            if st.sidebar.checkbox("以歷史上所有成分股為攻擊型資產池", value=False,
+                                   help="包含已被剔除的代碼；下載不到數據的代碼會自動略過。"):
+                risky_assets = membership.tickers
+        except ValueError as e:
+            st.sidebar.error(f"❌ 成分股事件檔格式錯誤：{e}")
+
 # ──────────────────────────────────────────────
 # 防禦型資產與回測參數
 # ──────────────────────────────────────────────
@@ -163,12 +203,42 @@ except ValueError as e:
     st.sidebar.error(f"❌ 格式錯誤（需為數字，逗號分隔）：{e}")
     st.stop()
 
+# 風險調整：動能排名、略過最近期數（12-1 動能）與持倉權重方式
+ranking_map = {"原始報酬": "return", "報酬 ÷ 波動率": "vol_adjusted"}
+weighting_map = {"等權重": "equal", "波動率倒數": "inverse_vol"}
+ranking = ranking_map[st.sidebar.selectbox("動能排名", list(ranking_map.keys()),
+                                           help="報酬 ÷ 波動率：以風險調整後的動能排序，正負號不變。")]
+momentum_skip = st.sidebar.number_input(
+    "略過最近期數", min_value=0, max_value=max(0, min(lookbacks) - 1), value=0,
+    help="動能不計入最近幾期，避開短期反轉。月線回顧期 12、略過 1 即 12-1 動能。"
+)
+weighting = weighting_map[st.sidebar.selectbox("持倉權重", list(weighting_map.keys()),
+                                             help="波動率倒數：Top N 名額依入選標的的 1 / 波動率分配。")]
+vol_window = st.sidebar.number_input(
+    "波動率視窗（交易日）", min_value=5, max_value=504, value=63, step=21,
+    disabled=ranking == "return" and weighting == "equal"
+)
+momentum_options = dict(skip=int(momentum_skip), ranking=ranking, weighting=weighting, vol_window=int(vol_window))
+
 top_n = st.sidebar.number_input("持有資產數量（Top N）", min_value=1, max_value=20, value=1)
 cash_protection = st.sidebar.checkbox(
     "啟用現金保護",
     value=False,
     help="當最佳防禦資產動能也為負時，持有現金（回報率 0%）。"
 )
+# 分散持倉：Top N > 1 時略過與已入選標的高度相關的候選（見 correlation.py）
+diversify = st.sidebar.checkbox(
+    "分散持倉（相關性過濾）", value=False, disabled=top_n == 1,
+    help="依動能由高到低選股時，候選標的與已入選標的的日報酬相關係數高於門檻就略過、改選下一名，"
+         "避免同時持有同一題材的多檔（例如 NVDA、AVGO、AMD）。候選不足 Top N 時空出的份額轉入防禦資產。"
+)
+col_corr, col_corr_window = st.sidebar.columns(2)
+max_correlation = col_corr.number_input("相關係數門檻", min_value=0.0, max_value=1.0, value=0.8, step=0.05,
+                                        disabled=not diversify or top_n == 1)
+corr_window = col_corr_window.number_input("相關係數視窗（交易日）", min_value=20, max_value=504, value=126, step=21,
+                                           disabled=not diversify or top_n == 1)
+momentum_options.update(max_correlation=float(max_correlation) if diversify and top_n > 1 else None,
+                        corr_window=int(corr_window))
 
 col_sd, col_ed = st.sidebar.columns(2)
 start_date = col_sd.date_input("開始日期", pd.to_datetime("2010-01-01"))
@@ -180,6 +250,10 @@ if end_date <= start_date:
 
 initial_capital = st.sidebar.number_input("初始資金（USD）", value=10000.0, min_value=100.0)
 benchmark_ticker = st.sidebar.text_input("對照基準", "SPY")
+rolling_window = st.sidebar.number_input(
+    "滾動指標視窗（期）", min_value=2, max_value=260, value=12, step=1,
+    help="滾動 CAGR / 夏普 / Sortino / 波動率的視窗長度，以再平衡期數計（月頻 12 = 一年、週頻 52 = 一年）。"
+)
 
 
 # ──────────────────────────────────────────────
@@ -191,32 +265,36 @@ benchmark = benchmark_ticker.strip()
 risky_assets = [t for t in risky_assets if t]
 all_tickers = tuple(sorted(set(risky_assets + safe_assets + [benchmark])))
 
-# ──────────────────────────────────────────────
-# 開始回測
-# ──────────────────────────────────────────────
-n_risky = len(risky_assets)
-if n_risky == 0:
-    st.warning("⚠️ 攻擊型資產清單為空，請先輸入或載入代碼。")
-    st.stop()
-
-if st.sidebar.button("🚀 開始回測", type="primary"):
-    # 大量標的時顯示預估時間
-    if n_risky > 100:
-        n_batches = (n_risky - 1) // 100 + 1
-        st.info(f"ℹ️ 攻擊型資產共 **{n_risky}** 檔，數據下載分 **{n_batches}** 批進行，預計需要數分鐘，請耐心等待。")
 
+@tracing.traced('app.load_prices')
+def load_prices(max_lb: int, stream: StreamingPeriodReturns = None):
+    """
+    下載回測所需價格並驗證攻擊型 / 防禦型資產，失敗時直接停止頁面。
+    下載期間逐批顯示進度；傳入 stream 時每批標的一到就先算好重新取樣與回報率（見 StreamingPeriodReturns）。
+    """
     # 計算緩衝起始日期（確保動能計算初期有足夠數據）
-    max_lb = max(lookbacks)
     buffer_days = int(max_lb * 35) + 365  # 保守估計多抓一年
     fetch_start = start_date - timedelta(days=buffer_days)
+    progress_slot = st.empty()
+
+    def on_ready(frame, progress):
+        if stream is not None:
+            stream.add(frame)
+        progress_slot.progress(
+            progress['tickers_ready'] / max(progress['tickers'], 1),
+            text=f"已完成 {progress['batches_done']}/{progress['batches']} 批下載，"
+                 f"{progress['tickers_ready']}/{progress['tickers']} 檔已計算"
+        )
 
     with st.spinner(f"下載 {len(all_tickers)} 檔數據（{fetch_start.strftime('%Y-%m-%d')} 至 {end_date.strftime('%Y-%m-%d')}）..."):
         try:
             fetcher = DataFetcher()
-            prices = fetcher.fetch_data(
+            # 唯讀的記憶體映射矩陣：所有 session 與掃描的工作行程共用同一份，不逐次複製
+            prices, fetch_report = fetcher.fetch_shared(
                 all_tickers,
                 start_date=fetch_start.strftime('%Y-%m-%d'),
-                end_date=end_date.strftime('%Y-%m-%d')
+                end_date=end_date.strftime('%Y-%m-%d'),
+                on_ready=on_ready
             )
         except ValueError as e:
             st.error(f"❌ 數據下載失敗：{e}")
@@ -224,6 +302,7 @@ if st.sidebar.button("🚀 開始回測", type="primary"):
         except Exception as e:
             st.error(f"❌ 未預期錯誤：{e}")
             st.stop()
+    progress_slot.empty()
 
     # 驗證下載結果
     missing = [t for t in risky_assets if t not in prices.columns]
@@ -240,120 +319,468 @@ if st.sidebar.button("🚀 開始回測", type="primary"):
         st.error("❌ 防禦型資產全部下載失敗，無法進行回測。請確認代碼是否正確。")
         st.stop()
 
+    tracing.annotate(rows=len(prices), cols=len(prices.columns))
     st.success(f"✅ 成功取得 {len(prices.columns)} 檔數據（共 {len(prices)} 個交易日）")
+    st.caption(
+        f"本機提供 {fetch_report['from_store']} 檔，下載 {len(fetch_report['batches'])} 批，"
+        f"重試 {len(fetch_report['retried'])} 檔，失敗 {len(fetch_report['failed'])} 檔，"
+        f"耗時 {fetch_report['elapsed']:.1f} 秒"
+    )
+    return prices, valid_risky, valid_safe
 
-    with st.spinner("計算動能信號與回測中..."):
-        strategy = MomentumStrategy(prices)
-        signals = strategy.generate_signals(
-            valid_risky, valid_safe,
-            top_n=top_n, frequency=selected_freq,
-            lookbacks=lookbacks, weights=weights,
-            cash_protection=cash_protection
-        )
 
-        # 切片至使用者指定的起訖日期
-        analysis_start = pd.Timestamp(start_date)
-        analysis_end = pd.Timestamp(end_date)
-        valid_start = max(analysis_start, signals.index[0]) if not signals.empty else analysis_start
-        signals_sliced = signals.loc[valid_start:analysis_end]
+# ──────────────────────────────────────────────
+# 參數掃描設定
+# ──────────────────────────────────────────────
+with st.sidebar.expander("🔬 參數掃描"):
+    st.caption("以同一份價格一次評估多組參數。多組之間以分號（;）分隔，組內以逗號分隔。"
+               "掃描與 Walk-forward 使用原始報酬排名與等權重。")
+    sweep_lookbacks_input = st.text_input("回顧期組合", f"{default_lookbacks}; 12; 1, 3, 6, 12")
+    sweep_weights_input = st.text_input("權重組合", "34, 33, 33; 1; 1, 1, 1, 1")
+    sweep_top_n_input = st.text_input("Top N 列表", "1, 2, 3")
+    sweep_freqs = st.multiselect("再平衡頻率", list(freq_map.keys()), default=[freq_option])
+    sweep_cash = st.multiselect("現金保護", ["關閉", "開啟"], default=["關閉", "開啟"])
+    sweep_rank_by = st.selectbox("排序依據", ["Sharpe Ratio", "CAGR", "MDD"])
+    run_sweep_clicked = st.button("🔬 開始掃描")
+    st.markdown("**Walk-forward 驗證**（以上述參數組合滾動挑選，再平衡頻率只能選一種）")
+    wf_in_sample = st.number_input("樣本內月數", min_value=6, max_value=120, value=36, step=6)
+    wf_out_sample = st.number_input("樣本外月數", min_value=1, max_value=60, value=12, step=1)
+    run_walk_forward_clicked = st.button("🔁 開始 Walk-forward")
 
-        if signals_sliced.empty:
-            st.error("❌ 回測結果為空：有效信號期間不足，請嘗試提前回測開始日期或縮短回顧期。")
-            st.stop()
+# ──────────────────────────────────────────────
+# 穩健性分析設定
+# ──────────────────────────────────────────────
+with st.sidebar.expander("🎲 穩健性分析"):
+    st.caption("回測後重組逐期報酬，產生上萬條模擬路徑，顯示 CAGR / MDD / 夏普比率的分布與淨值信賴區間。")
+    robustness_enabled = st.checkbox("回測後執行", value=False)
+    robustness_method = st.radio("抽樣方式", ["區塊自助法", "隨機起始日"], horizontal=True)
+    robustness_paths = st.number_input("路徑數", min_value=1000, max_value=100000, value=10000, step=1000)
+    robustness_block = st.number_input("區塊長度（期）", min_value=1, max_value=60, value=12)
+    robustness_seed = st.number_input("亂數種子", min_value=0, value=0, step=1)
 
-        backtest = Backtest(prices, signals_sliced, initial_capital)
-        results = backtest.run_backtest()
-        results = results.loc[valid_start:analysis_end]
+# ──────────────────────────────────────────────
+# 效能追蹤（選填）：記錄本次執行各階段的耗時、記憶體峰值與快取命中
+# ──────────────────────────────────────────────
+with st.sidebar.expander("⏱️ 效能追蹤"):
+    trace_enabled = st.checkbox("記錄各階段耗時", value=False,
+                                help="下載、動能、信號、回測與圖表渲染各自計時，可下載 JSON 與其他次執行比較。")
+    trace_memory = st.checkbox("同時記錄記憶體峰值（較慢）", value=False, disabled=not trace_enabled)
+    trace_panel = st.container()
 
+# 上一次執行若中途停止（st.stop），不沿用其未結束的 trace
+tracing.detach()
+tracer = tracing.Tracer("app", memory=trace_memory).begin() if trace_enabled else None
 
-        if results.empty:
-            st.error("❌ 回測結果為空，請確認日期範圍與數據是否完整。")
-            st.stop()
+try:
+    # ──────────────────────────────────────────────
+    # 開始回測
+    # ──────────────────────────────────────────────
+    n_risky = len(risky_assets)
+    if n_risky == 0:
+        st.warning("⚠️ 攻擊型資產清單為空，請先輸入或載入代碼。")
+        st.stop()
 
-        metrics = backtest.calculate_metrics(results['Portfolio Value'])
+    # 完整回測設定：與價格資料指紋一起雜湊成回測快取的鍵（見 run_cache.py）
+    run_config = {
+        'risky_assets': risky_assets, 'safe_assets': safe_assets, 'benchmark': benchmark,
+        'frequency': selected_freq, 'lookbacks': lookbacks, 'weights': weights,
+        'top_n': int(top_n), 'cash_protection': cash_protection, **momentum_options,
+        'start_date': str(start_date), 'end_date': str(end_date), 'initial_capital': float(initial_capital),
+        'membership': fingerprint(membership.event_dates, membership.tickers, membership.packed)
+        if membership is not None else None,
+    }
+
+
+    def run_label(config: dict) -> str:
+        freq_label = "月" if config['frequency'] == "ME" else "週"
+        return (f"{freq_label} · Top {config['top_n']} · 回顧 {', '.join(map(str, config['lookbacks']))} · "
+                f"{len(config['risky_assets'])} 檔 · {config['start_date']} ~ {config['end_date']}")
+
+
+    # ──────────────────────────────────────────────
+    # 已儲存的回測：瀏覽、載入與比較（不需重新計算）
+    # ──────────────────────────────────────────────
+    run_cache = RunCache()
+    run_names, compare_runs = {}, []
+    with st.sidebar.expander("🗂️ 已儲存的回測"):
+        saved_runs = run_cache.list_runs()
+        if not saved_runs:
+            st.caption("回測完成後自動儲存；相同設定與價格資料再次執行時直接載入。")
+        else:
+            run_names = {
+                m['key']: f"{time.strftime('%m-%d %H:%M', time.localtime(m['created']))} · {m['label']}" for m in saved_runs
+            }
+            selected_run = st.selectbox("檢視已儲存的回測", list(run_names), format_func=run_names.get)
+            if st.button("📂 載入"):
+                saved_payload, saved_meta = run_cache.get(selected_run), run_cache.meta(selected_run)
+                if saved_payload is None or saved_meta is None:
+                    st.warning("該回測已被淘汰，請重新執行。")
+                else:
+                    st.session_state['active_run'] = {'key': selected_run, 'config': saved_meta['config'],
+                                                      'payload': saved_payload}
+            compare_runs = st.multiselect("比較多筆回測", list(run_names), format_func=run_names.get, max_selections=6)
+            st.caption(f"共 {len(saved_runs)} 筆，{sum(m['bytes'] for m in saved_runs) / 1e6:.1f} MB"
+                       f"（上限 {run_cache.max_bytes / 1e6:.0f} MB，超過時淘汰最久未使用的回測）")
+            if st.button("🗑️ 清除已儲存的回測"):
+                run_cache.clear()
+                st.session_state.pop('active_run', None)
+                st.rerun()
 
-        # 計算基準表現
-        if benchmark in prices.columns:
-            bench_prices = prices[benchmark].reindex(results.index).dropna()
-            if not bench_prices.empty:
-                bench_series = bench_prices / bench_prices.iloc[0] * initial_capital
-            else:
-                bench_series = None
+    if st.sidebar.button("🚀 開始回測", type="primary"):
+        # 大量標的時顯示預估時間
+        if n_risky > 100:
+            n_batches = (n_risky - 1) // 100 + 1
+            st.info(f"ℹ️ 攻擊型資產共 **{n_risky}** 檔，數據下載分 **{n_batches}** 批並行進行（已存於本機的部分不會重新下載），請耐心等待。")
+
+        # 下載與計算管線化：每批價格一到就先算好重新取樣與各回顧期回報，回測時直接沿用
+        period_returns = StreamingPeriodReturns(selected_freq, lookbacks, momentum_options['skip'])
+        prices, valid_risky, valid_safe = load_prices(max(lookbacks), stream=period_returns)
+
+        with tracing.span('app.run_cache') as cache_span:
+            key = run_key(run_config, price_fingerprint(prices))
+            payload = run_cache.get(key)
+            cache_span.set(hit=payload is not None)
+        tracing.count(f"run_cache.{'hit' if payload is not None else 'miss'}")
+
+        if payload is not None:
+            st.caption("⚡ 相同設定與價格資料的回測已儲存，直接載入結果。")
         else:
-            bench_series = None
-
-    # ────────── 顯示指標 ──────────
-    col1, col2, col3 = st.columns(3)
-    col1.metric("📈 CAGR（年化報酬率）", f"{metrics['CAGR']:.2%}")
-    col2.metric("📉 最大回撤（MDD）", f"{metrics['MDD']:.2%}")
-    col3.metric("⚖️ 夏普比率", f"{metrics['Sharpe Ratio']:.2f}")
-
-    # ────────── 走勢圖 ──────────
-    st.subheader("資產淨值走勢")
-    fig = go.Figure()
-    fig.add_trace(go.Scatter(
-        x=results.index, y=results['Portfolio Value'],
-        name="投資組合", line=dict(color='#00C4FF', width=2)
-    ))
-    if bench_series is not None:
-        fig.add_trace(go.Scatter(
-            x=bench_series.index, y=bench_series,
-            name=f"對照基準（{benchmark}）",
-            line=dict(dash='dash', color='#FF6B6B', width=1.5)
-        ))
-    fig.update_layout(hovermode='x unified', height=450)
-    st.plotly_chart(fig, use_container_width=True)
-
-    # ────────── 最新信號 ──────────
-    st.subheader("📅 現在應操作的持倉（本期動能最新信號）")
-    st.caption("本期信號 = 用「最新一期結算日（上月底）」的動能計算，代表現在到下次結算日間應持有什麼。與歷史最後一筆不同，因為歷史表最後一筆是上期已結束的持倉。")
-    try:
-        latest_signal = strategy.get_latest_signal(
-            valid_risky, valid_safe,
-            top_n=top_n, frequency=selected_freq,
-            lookbacks=lookbacks, weights=weights,
-            cash_protection=cash_protection
-        )
-        if "Error" in latest_signal:
+            with st.spinner("計算動能信號與回測中..."):
+                strategy = MomentumStrategy(prices)
+                period_returns.prime(strategy)
+                signals = strategy.generate_signals(
+                    valid_risky, valid_safe,
+                    top_n=top_n, frequency=selected_freq,
+                    lookbacks=lookbacks, weights=weights,
+                    cash_protection=cash_protection, membership=membership, sparse=True, **momentum_options
+                )
+
+                # 切片至使用者指定的起訖日期
+                analysis_start = pd.Timestamp(start_date)
+                analysis_end = pd.Timestamp(end_date)
+                valid_start = max(analysis_start, signals.index[0]) if not signals.empty else analysis_start
+                signals_sliced = signals.slice(valid_start, analysis_end)
+
+                if signals_sliced.empty:
+                    st.error("❌ 回測結果為空：有效信號期間不足，請嘗試提前回測開始日期或縮短回顧期。")
+                    st.stop()
+
+                # 稀疏持倉：只取實際持有的 (結算日, 資產) 報酬，不展開 日期 × 全部資產 的矩陣
+                backtest = Backtest(prices, signals_sliced, initial_capital)
+                results = backtest.run_backtest().loc[valid_start:analysis_end]
+                # 基準：全程持有 benchmark
+                bench_signals = None
+                if benchmark in prices.columns:
+                    bench_signals = pd.DataFrame(1.0, index=signals_sliced.index, columns=[benchmark])
+
+                if results.empty:
+                    st.error("❌ 回測結果為空，請確認日期範圍與數據是否完整。")
+                    st.stop()
+
+                metrics = backtest.calculate_metrics(results['Portfolio Value'])
+                # 逐日盯市：持有期間隨每日價格漂移，期中的回撤也會反映在 MDD 上
+                daily = backtest.run_daily()
+                daily_mdd = backtest.calculate_metrics(daily['Portfolio Value'])['MDD'] if len(daily) > 1 else metrics['MDD']
+
+                # 計算基準表現：基準仍走 run_many 的批次路徑（策略的稀疏持倉留在 run_backtest，不展開成密集矩陣）
+                if bench_signals is not None:
+                    bench_batch = Backtest.run_many(prices, [bench_signals], initial_capital)
+                    bench_values = bench_batch['Portfolio Value'][0].reindex(results.index).dropna()
+                    bench_series = bench_values / bench_values.iloc[0] * initial_capital if not bench_values.empty else None
+                    bench_daily = Backtest(prices, bench_signals).run_daily()['Portfolio Value'].reindex(daily.index).dropna()
+                    bench_daily = bench_daily / bench_daily.iloc[0] * initial_capital if not bench_daily.empty else None
+                else:
+                    bench_series = None
+                    bench_daily = None
+
+                latest_signal, latest_error = None, None
+                try:
+                    latest_signal = strategy.get_latest_signal(
+                        valid_risky, valid_safe,
+                        top_n=top_n, frequency=selected_freq,
+                        lookbacks=lookbacks, weights=weights,
+                        cash_protection=cash_protection, membership=membership, **momentum_options
+                    )
+                except Exception as e:
+                    latest_error = str(e)
+
+            payload = {
+                'holdings': signals_sliced, 'results': results, 'daily': daily,
+                'bench_series': bench_series, 'bench_daily': bench_daily,
+                'metrics': metrics, 'daily_mdd': daily_mdd,
+                'latest_signal': latest_signal, 'latest_error': latest_error,
+            }
+            summary = {'CAGR': metrics['CAGR'], 'MDD': daily_mdd, 'Sharpe Ratio': metrics['Sharpe Ratio']}
+            with tracing.span('app.run_cache.put'):
+                run_cache.put(key, payload, config=run_config, summary=summary, label=run_label(run_config))
+
+        # 結果存在 session 中：之後調整任何側邊欄元件（觸發重跑）都不會遺失
+        st.session_state['active_run'] = {'key': key, 'config': run_config, 'payload': payload}
+
+    active_run = st.session_state.get('active_run')
+    if active_run is not None:
+        # plotly 只有回測結果的圖表需要，延遲到此才載入以縮短冷啟動
+        import plotly.graph_objects as go
+
+        payload = active_run['payload']
+        shown_config = active_run['config']
+        signals_sliced = payload['holdings']
+        results, daily = payload['results'], payload['daily']
+        bench_series, bench_daily = payload['bench_series'], payload['bench_daily']
+        metrics, daily_mdd = payload['metrics'], payload['daily_mdd']
+        # 基準與初始資金以該次回測的設定為準（側邊欄可能已改動）
+        run_benchmark = shown_config['benchmark']
+        run_capital = shown_config['initial_capital']
+        if shown_config != run_config:
+            st.info(f"ℹ️ 以下為已儲存的回測（{run_label(shown_config)}），與目前側邊欄設定不同；按「🚀 開始回測」以目前設定執行。")
+
+        # ────────── 顯示指標 ──────────
+        col1, col2, col3 = st.columns(3)
+        col1.metric("📈 CAGR（年化報酬率）", f"{metrics['CAGR']:.2%}")
+        col2.metric("📉 最大回撤（MDD，逐日）", f"{daily_mdd:.2%}",
+                    help=f"逐日盯市的最大回撤；只在結算日取樣時為 {metrics['MDD']:.2%}，會低估期中的跌幅。")
+        col3.metric("⚖️ 夏普比率", f"{metrics['Sharpe Ratio']:.2f}")
+
+        # ────────── 走勢圖 ──────────
+        st.subheader("資產淨值走勢")
+        st.caption("逐日盯市：持倉於結算日收盤配置，期間隨每日價格漂移，至下一個結算日再平衡。")
+        with tracing.span('app.plotly.equity', rows=len(daily)):
+            fig = go.Figure()
+            fig.add_trace(go.Scatter(
+                x=daily.index, y=daily['Portfolio Value'],
+                name="投資組合", line=dict(color='#00C4FF', width=2)
+            ))
+            if bench_daily is not None:
+                fig.add_trace(go.Scatter(
+                    x=bench_daily.index, y=bench_daily,
+                    name=f"對照基準（{run_benchmark}）",
+                    line=dict(dash='dash', color='#FF6B6B', width=1.5)
+                ))
+            fig.update_layout(hovermode='x unified', height=450)
+            st.plotly_chart(fig, use_container_width=True)
+
+        # ────────── 最新信號 ──────────
+        st.subheader("📅 現在應操作的持倉（本期動能最新信號）")
+        st.caption("本期信號 = 用「最新一期結算日（上月底）」的動能計算，代表現在到下次結算日間應持有什麼。與歷史最後一筆不同，因為歷史表最後一筆是上期已結束的持倉。")
+        latest_signal = payload['latest_signal']
+        if payload['latest_error'] is not None:
+            st.warning(f"計算最新信號時發生錯誤：{payload['latest_error']}")
+        elif "Error" in latest_signal:
             st.warning(f"無法計算最新信號：{latest_signal['Error']}")
         elif not latest_signal:
             st.info("📋 當期信號：**持有現金**")
         else:
             parts = [f"**{asset}** ({weight:.0%})" for asset, weight in latest_signal.items()]
             st.info(f"📋 建議持倉：{', '.join(parts)}")
-    except Exception as e:
-        st.warning(f"計算最新信號時發生錯誤：{e}")
-
-    # ────────── 歷史持倉紀錄 ──────────
-    with st.expander("📋 查看歷史持倉紀錄（已完結期間）"):
-        st.markdown("""
-        > **💡 日期說明**：日期為該期間的**結算/結束日**，僅顯示已完結的期間。
-        > - 例如 `2025-03-31` 持有 `NVDA`，代表 3 月份（2/28 至 3/31）持有 NVDA，決策於 2 月底做出。
-        > - 當期（進行中）不顯示於此，請看上方「現在應操作的持倉」。
-        """)
-
-        def get_held_assets(row):
-            held = [asset for asset, w in row.items() if w > 0]
-            return ", ".join(held) if held else "CASH"
-
-        # 排除當前尚未結束的期間（最後一行若屬於本月則不顯示）
-        today = pd.Timestamp.today()
-        historical_signals = signals_sliced.copy()
-        if not historical_signals.empty:
-            last_idx = historical_signals.index[-1]
-            if last_idx.year == today.year and last_idx.month == today.month:
-                historical_signals = historical_signals.iloc[:-1]
-
-        if historical_signals.empty:
-            st.info("尚無已完結的歷史期間可顯示。")
-        else:
-            historical = historical_signals.apply(get_held_assets, axis=1).to_frame("本期持倉")
-            st.dataframe(historical.sort_index(ascending=False), use_container_width=True)
 
+        # ────────── 歷史持倉紀錄 ──────────
+        with st.expander("📋 查看歷史持倉紀錄（已完結期間）"):
+            st.markdown("""
+            > **💡 日期說明**：日期為該期間的**結算/結束日**，僅顯示已完結的期間。
+            > - 例如 `2025-03-31` 持有 `NVDA`，代表 3 月份（2/28 至 3/31）持有 NVDA，決策於 2 月底做出。
+            > - 當期（進行中）不顯示於此，請看上方「現在應操作的持倉」。
+            """)
+
+            # 直接由稀疏持倉取出各期持有的資產（沒有持倉時為 CASH）
+            held_assets = signals_sliced.held_labels()
+
+            # 排除當前尚未結束的期間（最後一行若屬於本月則不顯示）
+            today = pd.Timestamp.today()
+            if not held_assets.empty:
+                last_idx = held_assets.index[-1]
+                if last_idx.year == today.year and last_idx.month == today.month:
+                    held_assets = held_assets.iloc[:-1]
+
+            if held_assets.empty:
+                st.info("尚無已完結的歷史期間可顯示。")
+            else:
+                historical = held_assets.to_frame("本期持倉")
+                st.dataframe(historical.sort_index(ascending=False), use_container_width=True)
+
+
+        # ────────── 每月回報 ──────────
+        st.subheader("每期回報率")
+        st.bar_chart(results['Portfolio Returns'])
+
+        # ────────── 滾動指標 ──────────
+        curves = pd.DataFrame({"投資組合": results['Portfolio Value']})
+        if bench_series is not None:
+            curves[f"對照基準（{run_benchmark}）"] = bench_series
+        st.subheader(f"📊 績效指標與滾動指標（視窗 {int(rolling_window)} 期）")
+        with tracing.span('app.analytics', rows=len(curves), cols=len(curves.columns)):
+            summary_table = performance_summary(curves)
+            st.dataframe(
+                summary_table.style.format({
+                    'CAGR': '{:.2%}', 'Volatility': '{:.2%}', 'Sharpe Ratio': '{:.2f}', 'Sortino Ratio': '{:.2f}',
+                    'MDD': '{:.2%}', 'Max Drawdown Days': '{:,.0f}', 'Recovery Days': '{:,.0f}',
+                }, na_rep="尚未回復"),
+                use_container_width=True
+            )
+            rolling = rolling_metrics(curves.pct_change().iloc[1:], int(rolling_window))
+            tabs = st.tabs(["夏普比率", "Sortino", "CAGR", "波動率"])
+            for tab, key in zip(tabs, ['Sharpe Ratio', 'Sortino Ratio', 'CAGR', 'Volatility']):
+                tab.line_chart(rolling[key].dropna(how='all'))
+
+        # ────────── 穩健性分析 ──────────
+        if robustness_enabled:
+            method = 'block' if robustness_method == "區塊自助法" else 'subsample'
+            with st.spinner(f"產生 {int(robustness_paths):,} 條模擬路徑..."), \
+                    tracing.span('app.robustness', paths=int(robustness_paths)):
+                try:
+                    # 第一期報酬為起點補上的 0，不納入抽樣
+                    robust = run_robustness(
+                        results['Portfolio Returns'].iloc[1:], n_paths=int(robustness_paths), method=method,
+                        block_size=int(robustness_block), seed=int(robustness_seed)
+                    )
+                except ValueError as e:
+                    robust = None
+                    st.warning(f"無法進行穩健性分析：{e}")
+
+            if robust is not None:
+                st.subheader(f"🎲 穩健性分析（{robustness_method}，{int(robustness_paths):,} 條路徑）")
+                summary = robust['summary'].copy()
+                summary.index = [f"{q:.0%} 分位" for q in summary.index]
+                st.dataframe(
+                    summary.style.format({'CAGR': '{:.2%}', 'MDD': '{:.2%}', 'Sharpe Ratio': '{:.2f}'}),
+                    use_container_width=True
+                )
+
+                bands = robust['bands'] * run_capital
+                band_fig = go.Figure()
+                for lower, upper, color in [(0.05, 0.95, 'rgba(0,196,255,0.15)'), (0.25, 0.75, 'rgba(0,196,255,0.3)')]:
+                    band_fig.add_trace(go.Scatter(x=bands.index, y=bands[upper], line=dict(width=0), showlegend=False))
+                    band_fig.add_trace(go.Scatter(
+                        x=bands.index, y=bands[lower], fill='tonexty', fillcolor=color, line=dict(width=0),
+                        name=f"{lower:.0%}–{upper:.0%} 區間"
+                    ))
+                band_fig.add_trace(go.Scatter(x=bands.index, y=bands[0.5], name="中位數", line=dict(color='#00C4FF', width=2)))
+                if method == 'block':
+                    band_fig.add_trace(go.Scatter(
+                        x=results.index[1:], y=results['Portfolio Value'].iloc[1:] / results['Portfolio Value'].iloc[0] * run_capital,
+                        name="實際回測", line=dict(color='#FF6B6B', dash='dash', width=1.5)
+                    ))
+                with tracing.span('app.plotly.robustness', rows=len(bands)):
+                    band_fig.update_layout(hovermode='x unified', height=400)
+                    st.plotly_chart(band_fig, use_container_width=True)
+
+    # ────────── 已儲存回測比較 ──────────
+    if compare_runs:
+        st.subheader(f"🗂️ 已儲存回測比較（{len(compare_runs)} 筆）")
+        compare_curves, compare_rows = {}, []
+        for number, compare_key in enumerate(compare_runs, 1):
+            compare_meta, compare_payload = run_cache.meta(compare_key), run_cache.get(compare_key)
+            if compare_meta is None or compare_payload is None:
+                st.warning(f"{run_names[compare_key]} 已被淘汰，略過。")
+                continue
+            # 圖表欄名不可含冒號（時間），以編號加設定摘要命名
+            name = f"#{number} {compare_meta['label']}"
+            value = compare_payload['daily']['Portfolio Value']
+            compare_curves[name] = value / value.iloc[0]
+            compare_rows.append({'回測': name, **compare_meta['summary']})
+        if compare_rows:
+            st.dataframe(
+                pd.DataFrame(compare_rows).set_index('回測').style.format(
+                    {'CAGR': '{:.2%}', 'MDD': '{:.2%}', 'Sharpe Ratio': '{:.2f}'}),
+                use_container_width=True
+            )
+            st.caption("淨值以起點 = 1 標準化（逐日盯市）。")
+            st.line_chart(pd.DataFrame(compare_curves))
 
-    # ────────── 每月回報 ──────────
-    st.subheader("每期回報率")
-    st.bar_chart(results['Portfolio Returns'])
+    if run_sweep_clicked or run_walk_forward_clicked:
+        try:
+            sweep_grid = build_grid(
+                [[int(x) for x in part.split(',') if x.strip()] for part in sweep_lookbacks_input.split(';') if part.strip()],
+                [[float(x) for x in part.split(',') if x.strip()] for part in sweep_weights_input.split(';') if part.strip()],
+                [int(x) for x in sweep_top_n_input.split(',') if x.strip()],
+                [freq_map[f] for f in sweep_freqs],
+                [c == "開啟" for c in sweep_cash],
+            )
+        except ValueError as e:
+            st.error(f"❌ 掃描參數格式錯誤（需為數字）：{e}")
+            st.stop()
+        if not sweep_grid:
+            st.error("❌ 沒有有效的參數組合（回顧期與權重數量需相同）。")
+            st.stop()
+
+        sweep_max_lb = max(max(c['lookbacks']) for c in sweep_grid)
+        prices, valid_risky, valid_safe = load_prices(sweep_max_lb)
+
+    if run_sweep_clicked:
+        with st.spinner(f"評估 {len(sweep_grid)} 組參數中..."), tracing.span('sweep.run_sweep', configs=len(sweep_grid)):
+            sweep_table = run_sweep(
+                prices, valid_risky, valid_safe, sweep_grid,
+                start_date=pd.Timestamp(start_date), end_date=pd.Timestamp(end_date),
+                initial_capital=initial_capital, rank_by=sweep_rank_by, membership=membership
+            )
+
+        st.subheader(f"🔬 參數掃描結果（共 {len(sweep_table)} 組，依 {sweep_rank_by} 排序）")
+        st.dataframe(
+            sweep_table.style.format({'CAGR': '{:.2%}', 'MDD': '{:.2%}', 'Sharpe Ratio': '{:.2f}'}),
+            use_container_width=True
+        )
+
+    if run_walk_forward_clicked:
+        wf_rank_by = sweep_rank_by if sweep_rank_by in RANKABLE_METRICS else 'Sharpe Ratio'
+        with st.spinner(f"Walk-forward：{len(sweep_grid)} 組參數，樣本內 {wf_in_sample} 個月 / 樣本外 {wf_out_sample} 個月..."), \
+                tracing.span('walk_forward', configs=len(sweep_grid)):
+            try:
+                wf = walk_forward(
+                    prices, valid_risky, valid_safe, sweep_grid,
+                    in_sample_months=int(wf_in_sample), out_sample_months=int(wf_out_sample),
+                    start_date=pd.Timestamp(start_date), end_date=pd.Timestamp(end_date),
+                    initial_capital=initial_capital, rank_by=wf_rank_by, membership=membership
+                )
+            except ValueError as e:
+                st.error(f"❌ Walk-forward 失敗：{e}")
+                st.stop()
+
+        st.subheader(f"🔁 Walk-forward 結果（{len(wf['windows'])} 個區間，依樣本內 {wf_rank_by} 挑選）")
+        if wf['metrics']:
+            col1, col2, col3 = st.columns(3)
+            col1.metric("樣本外 CAGR", f"{wf['metrics']['CAGR']:.2%}")
+            col2.metric("樣本外 MDD", f"{wf['metrics']['MDD']:.2%}")
+            col3.metric("樣本外夏普比率", f"{wf['metrics']['Sharpe Ratio']:.2f}")
+        st.line_chart(wf['equity'].rename("樣本外權益曲線"))
+        st.dataframe(
+            wf['windows'].style.format({f"IS {wf_rank_by}": '{:.2f}', 'OOS Return': '{:.2%}'}, na_rep=''),
+            use_container_width=True
+        )
+finally:
+    # st.stop / st.rerun 以例外中止腳本時也要結束 trace，否則 tracemalloc 會在整個伺服器上持續開啟
+    if tracer is not None:
+        tracer.end()
+
+if tracer is not None:
+    # 只保留有執行回測 / 掃描的 trace，前一次的保留下來供比較
+    if len(tracer.root.children) > 0:
+        st.session_state['trace_previous'] = st.session_state.get('trace_last')
+        st.session_state['trace_last'] = tracer.to_dict()
+    last_trace = st.session_state.get('trace_last')
+    with trace_panel:
+        if last_trace is None:
+            st.caption("執行回測、掃描或 Walk-forward 後顯示各階段耗時。")
+        else:
+            table = tracing.span_table(last_trace)
+            table['path'] = ['　' * d + p.rsplit('/', 1)[-1] for d, p in zip(table['depth'], table['path'])]
+            st.dataframe(
+                table.drop(columns='depth').style.format(
+                    {'wall': '{:.3f}', 'self': '{:.3f}', 'peak_mb': '{:.1f}'}, na_rep=''),
+                use_container_width=True, hide_index=True
+            )
+            if last_trace['counters']:
+                st.caption("計數器：" + "，".join(f"{k} = {v}" for k, v in sorted(last_trace['counters'].items())))
+            st.download_button("下載追蹤 JSON", json.dumps(last_trace, ensure_ascii=False, indent=2),
+                               file_name="trace.json", mime="application/json", on_click="ignore")
+
+            uploaded = st.file_uploader("與先前匯出的追蹤比較", type="json")
+            baseline = json.load(uploaded) if uploaded is not None else st.session_state.get('trace_previous')
+            if baseline is not None:
+                st.caption("與" + ("上傳的追蹤" if uploaded is not None else "前一次執行") + "比較（ratio = 本次 ÷ 先前）：")
+                st.dataframe(
+                    tracing.compare(baseline, last_trace).style.format(
+                        {c: '{:.3f}' for c in ['wall_before', 'wall_after', 'ratio']}, na_rep=''),
+                    use_container_width=True
+                )
 
 st.markdown("---")
 st.markdown("Developed by Antigravity.")
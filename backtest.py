@@ -1,16 +1,42 @@
 import pandas as pd
 import numpy as np
 
+from analytics import periods_per_year
+from holdings import SparseHoldings
+from price_matrix import as_frame
+from tracing import annotate, traced
+
+def prices_at(prices: pd.DataFrame, labels) -> pd.DataFrame:
+    """
+    各結算日標籤的收盤價，索引仍為標籤。
+    標籤不是交易日時（例如月底遇週末、假日）取該日之前最後一個交易日的價格，
+    不能直接略過該期：否則下一期的報酬會涵蓋兩期，卻套用依前一期表現決定的權重（前視偏差）。
+    早於第一個交易日、或晚於最後一個交易日（尚未結束的當期）的標籤不列入。
+    """
+    dates = prices.index
+    labels = pd.DatetimeIndex(labels)
+    if dates.empty:
+        return prices.iloc[:0]
+    labels = labels[(labels >= dates[0]) & (labels <= dates[-1])]
+    anchored = prices.iloc[dates.searchsorted(labels, side='right') - 1]
+    anchored.index = labels
+    return anchored
+
+
 class Backtest:
-    def __init__(self, prices: pd.DataFrame, signals: pd.DataFrame, initial_capital: float = 10000.0):
-        self.prices = prices
+    def __init__(self, prices: pd.DataFrame, signals, initial_capital: float = 10000.0):
+        # 也接受 PriceMatrix（取零複製的 DataFrame 視圖）；signals 可為密集 DataFrame 或 SparseHoldings
+        self.prices = as_frame(prices)
         self.signals = signals
         self.initial_capital = initial_capital
 
+    @traced('backtest.run_backtest')
     def run_backtest(self) -> pd.DataFrame:
         """
         計算隨時間變化的投資組合價值。
         """
+        if isinstance(self.signals, SparseHoldings):
+            return self._run_sparse()
         # 從信號索引確定頻率
         # 我們假設信號索引是再平衡頻率 (例如每週或每月)
         
@@ -21,17 +47,9 @@ class Backtest:
         # 我們將價格重新索引到信號日期。
         # 使用 'asfreq' 或 'reindex' 確保我們選取該特定日期的價格。
         # 注意：如果信號日期是例如週五，我們需要週五的價格。
-        # 我們的信號邏輯使用 resample().last()，所以日期應該與重新取樣的日期匹配。
-        
-        model_prices = self.prices.loc[self.prices.index.intersection(self.signals.index)]
-        
-        if model_prices.empty:
-            # 如果確切日期不匹配的備案 (例如由於假期偏移，如果不小心)
-            # 但由於信號來自價格，除非被操縱，否則它們應該匹配。
-            # 讓我們試著更穩健：如果我們傳遞了它，使用相同的邏輯重新取樣？
-            # 最好依賴交集。
-            pass
-            
+        # resample().last() 的標籤是日曆上的期末（例如 3/31），遇休市時取前一個交易日的價格（見 prices_at）
+        model_prices = prices_at(self.prices, self.signals.index)
+
         # 計算這些期間基礎資產的回報率
         returns = model_prices.pct_change()
         
@@ -54,12 +72,180 @@ class Backtest:
             'Portfolio Returns': portfolio_returns,
             'Portfolio Value': portfolio_value
         })
-        
+        annotate(rows=len(result), cols=len(signals.columns))
+        return result
+
+    def _run_sparse(self) -> pd.DataFrame:
+        """
+        run_backtest 的稀疏版本：只取出實際持倉的 (結算日, 資產) 兩端價格計算報酬，
+        不展開 日期 × 全部資產 的報酬矩陣，成本與持倉數成正比。逐期報酬與密集版本相同。
+        """
+        holdings = self.signals
+        dates = self.prices.index
+        labels = holdings.index
+        # 與 prices_at 相同：只保留價格期間內的結算日，錨點為當日或之前最後一個交易日
+        if dates.empty:
+            lo = hi = 0
+        else:
+            lo, hi = labels.searchsorted(dates[0], side='left'), labels.searchsorted(dates[-1], side='right')
+        kept = labels[lo:hi]
+        anchors = dates.searchsorted(kept, side='right') - 1
+        position = np.full(len(labels), -1, dtype=np.intp)
+        position[lo:hi] = np.arange(hi - lo)
+
+        # 每筆持倉在保留結算日中的位置；第一個保留結算日沒有前一期價格（報酬為 NaN → 0）
+        period = position[holdings.row_ids()]
+        use = period > 0
+        period = period[use]
+        columns = self.prices.columns.get_indexer(holdings.columns)[holdings.indices[use]]
+        in_prices = columns >= 0
+        # 只取出 結算日錨點 × 持有過的資產 的價格（價格表可能由多個區塊組成，整張 to_numpy 會複製全表）
+        held, c = np.unique(columns[in_prices], return_inverse=True)
+        values = self.prices.iloc[anchors, held].to_numpy(dtype=float)
+        p = period[in_prices]
+        asset_returns = np.full(len(period), np.nan)
+        asset_returns[in_prices] = values[p, c] / values[p - 1, c] - 1
+        # NaN 回報（IPO 前、不在價格表中的資產）貢獻 0，等同 sum(min_count=1).fillna(0)
+        contribution = np.nan_to_num(holdings.weights[use] * asset_returns, nan=0.0)
+        portfolio_returns = pd.Series(np.bincount(period, weights=contribution, minlength=len(kept)),
+                                      index=kept, dtype=float)
+
+        portfolio_value = self.initial_capital * (1 + portfolio_returns).cumprod()
+        result = pd.DataFrame({
+            'Portfolio Returns': portfolio_returns,
+            'Portfolio Value': portfolio_value
+        })
+        annotate(rows=len(result), cols=len(holdings.columns), nnz=holdings.nnz)
+        return result
+
+    @traced('backtest.run_daily')
+    def run_daily(self) -> pd.DataFrame:
+        """
+        逐日盯市的回測：每期權重在上一個結算日收盤建倉，持有期間隨各資產每日漲跌漂移（不逐日再平衡），
+        到下一個結算日收盤才重新配置，因此期中的回撤也會反映在權益曲線與 MDD 上。
+
+        結算日標籤不是交易日時（例如月底遇週末），以該日之前最後一個交易日為錨點。
+        持有期內每檔資產的淨值 = 建倉權重 × 當日價格 ÷ 建倉日價格（= 期內逐日報酬的分段累乘），
+        整個 日期 × 資產 矩陣一次向量化算出；權重合計不足 1 的部分為現金，
+        建倉日沒有價格（上市前）的資產視同現金，與 run_backtest 的 NaN 回報處理相同。
+
+        回傳欄位與 run_backtest 相同，但為逐日資料，從第一個結算日的錨點到最後一個結算日的錨點；
+        在各結算日（皆為交易日時）的淨值與 run_backtest 一致。
+        與 run_backtest 不同：最後一個結算日晚於最後一筆價格（尚未結束的當期）時，
+        run_backtest（prices_at）不列入該期，這裡則以最後一個交易日為錨點保留，權益曲線延伸到最新價格。
+        """
+        dates = self.prices.index
+        empty = pd.DataFrame({'Portfolio Returns': pd.Series(dtype=float), 'Portfolio Value': pd.Series(dtype=float)},
+                             index=pd.DatetimeIndex([]))
+
+        # 各結算日的錨點：當日或之前最後一個交易日；早於第一個交易日的結算期略過
+        anchors = dates.searchsorted(self.signals.index, side='right') - 1
+        keep = anchors >= 0
+        anchors = anchors[keep]
+        if len(anchors) == 0:
+            return empty
+        # 只有曾經持有的資產會影響淨值，其餘欄位不必展開成逐日矩陣
+        if isinstance(self.signals, SparseHoldings):
+            held_columns = self.signals.held_columns()
+            weights = self.signals.to_array(held_columns)[keep]
+        else:
+            weights = np.nan_to_num(self.signals.to_numpy(dtype=float)[keep], nan=0.0)
+            held = weights.any(axis=0)
+            weights = weights[:, held]
+            held_columns = self.signals.columns[held]
+        values = self.prices.reindex(columns=held_columns).ffill().to_numpy(dtype=float)
+        days = np.arange(anchors[0] + 1, anchors[-1] + 1)
+        # 每一天屬於第幾期（第一個 >= 該日的錨點），建倉日為前一期的錨點
+        period = np.searchsorted(anchors, days, side='left')
+        start = anchors[period - 1]
+
+        # 期內報酬 = Σ 權重 × (價格相對值 - 1)；沒有價格的資產貢獻 0（就地運算，只配置一個逐日矩陣）
+        growth = values[days]
+        growth /= values[start]
+        growth -= 1.0
+        growth *= weights[period]
+        period_return = np.nansum(growth, axis=1)
+
+        # 每期結束日的報酬串接成期初淨值，期內淨值 = 期初淨值 × (1 + 期內報酬)
+        factor = np.ones(len(anchors))
+        ends = days == anchors[period]
+        factor[period[ends]] = 1.0 + period_return[ends]
+        opening = self.initial_capital * np.cumprod(factor)
+        value = np.concatenate([[self.initial_capital], opening[period - 1] * (1.0 + period_return)])
+
+        index = dates[np.concatenate([[anchors[0]], days])]
+        portfolio_value = pd.Series(value, index=index)
+        result = pd.DataFrame({
+            'Portfolio Returns': portfolio_value.pct_change().fillna(0.0),
+            'Portfolio Value': portfolio_value,
+        })
+        annotate(rows=len(result), cols=len(self.signals.columns))
         return result
 
+    # 批次回測時每次相乘的暫存陣列上限（元素數），超過則分段計算
+    BATCH_CELLS = 4_000_000
+
+    @classmethod
+    @traced('backtest.run_many')
+    def run_many(cls, prices: pd.DataFrame, signals, initial_capital: float = 10000.0,
+                 index=None, columns=None, names: list = None) -> dict:
+        """
+        一次回測 K 組信號矩陣，所有組合共用同一個 日期 × 資產 網格。
+
+        signals 可為：
+        - DataFrame（或 SparseHoldings，展開後使用）清單：以第一個的日期為網格、所有清單的資產聯集為欄，其餘對齊後缺少的權重補 0
+        - shape (K, 日期數, 資產數) 的陣列：需同時提供 index（日期）與 columns（資產）
+        價格交集、pct_change 與索引對齊只做一次，K 組的逐期報酬以一次向量化的乘加算出，
+        逐期報酬與 run_backtest 相同（IPO 前 NaN 回報視為 0）。
+
+        回傳 {'Portfolio Returns': DataFrame, 'Portfolio Value': DataFrame}，欄為 names（預設 0..K-1）。
+        """
+        prices = as_frame(prices)
+        if isinstance(signals, np.ndarray):
+            if index is None or columns is None:
+                raise ValueError("以陣列傳入信號時必須提供 index 與 columns")
+            index, columns = pd.DatetimeIndex(index), pd.Index(columns)
+            weights = signals
+        else:
+            signals = [s.to_dense() if isinstance(s, SparseHoldings) else s for s in signals]
+            if not signals:
+                raise ValueError("信號清單為空")
+            index = signals[0].index
+            columns = signals[0].columns
+            for s in signals[1:]:
+                columns = columns.append(s.columns.difference(columns))
+            weights = np.stack([
+                s.reindex(index=index, columns=columns, fill_value=0.0).to_numpy(dtype=float) for s in signals
+            ])
+        if weights.ndim != 3 or weights.shape[1:] != (len(index), len(columns)):
+            raise ValueError(f"信號陣列形狀 {weights.shape} 與網格（{len(index)} 日 × {len(columns)} 資產）不符")
+        names = list(names) if names is not None else list(range(len(weights)))
+
+        # 與 run_backtest 相同的價格交集與對齊，只做一次
+        model_prices = prices_at(prices, index)
+        returns = model_prices.pct_change()
+        common_index = returns.index.intersection(index)
+        rows = index.get_indexer(common_index)
+        # NaN 回報（IPO 前、不在價格表中的資產）貢獻 0，等同 sum(min_count=1).fillna(0)
+        asset_returns = np.nan_to_num(returns.loc[common_index].reindex(columns=columns).to_numpy(dtype=float), nan=0.0)
+
+        portfolio_returns = np.empty((len(common_index), len(weights)))
+        step = max(1, cls.BATCH_CELLS // max(1, asset_returns.size))
+        for k in range(0, len(weights), step):
+            chunk = np.nan_to_num(weights[k:k + step, rows, :], nan=0.0)
+            portfolio_returns[:, k:k + step] = (chunk * asset_returns).sum(axis=2).T
+        portfolio_value = initial_capital * np.cumprod(1 + portfolio_returns, axis=0)
+        annotate(rows=len(common_index), cols=len(columns), configs=len(weights))
+
+        return {
+            'Portfolio Returns': pd.DataFrame(portfolio_returns, index=common_index, columns=names),
+            'Portfolio Value': pd.DataFrame(portfolio_value, index=common_index, columns=names),
+        }
+
     def calculate_metrics(self, portfolio_value: pd.Series):
         """
         計算 CAGR, MDD, 夏普比率 (Sharpe Ratio)。
+        夏普比率依權益曲線的實際頻率年化（月 12、週 52，見 analytics.periods_per_year）。
         """
         # CAGR
         start_val = portfolio_value.iloc[0]
@@ -73,10 +259,10 @@ class Backtest:
         mdd = drawdown.min()
         
         # 夏普比率 (假設無風險利率 ~ 0 以簡化，或使用超額回報)
-        monthly_returns = portfolio_value.pct_change().dropna()
-        mean_return = monthly_returns.mean()
-        std_return = monthly_returns.std()
-        sharpe = (mean_return / std_return) * np.sqrt(12) if std_return != 0 else 0
+        period_returns = portfolio_value.pct_change().dropna()
+        mean_return = period_returns.mean()
+        std_return = period_returns.std()
+        sharpe = (mean_return / std_return) * np.sqrt(periods_per_year(portfolio_value.index)) if std_return != 0 else 0
         
         return {
             'CAGR': cagr,
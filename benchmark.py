@@ -0,0 +1,203 @@
+"""
+效能基準：以可重現的合成價格面板量測各階段耗時與記憶體峰值。
+
+用法：
+    python benchmark.py                                  # 預設規模 50x10、500x20
+    python benchmark.py --scales 50x10,500x20,5000x50 --output bench_report.json
+    python benchmark.py --baseline old_report.json       # 與上次報告比較
+
+規模格式為「標的數x年數」。報告為 JSON，超過 benchmark_thresholds.json 門檻
+或相對 baseline 變慢超過容許倍數時，以結束碼 1 結束，可直接放進 CI。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from data import DataFetcher
+from providers import InMemoryProvider
+from strategy import MomentumStrategy
+from backtest import Backtest
+
+DEFAULT_SCALES = ['50x10', '500x20']
+DEFAULT_THRESHOLDS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_thresholds.json')
+SAFE_ASSETS = ['TLT', 'IEF', 'GLD', 'UUP']
+BENCHMARK = 'SPY'
+
+
+def random_walk_prices(names: list, dates: pd.DatetimeIndex, seed: int = 0,
+                       drift=0.0004, vol=0.012) -> pd.DataFrame:
+    """
+    產生可重現的簡單隨機漫步價格（起點 100，每日報酬 ~ N(drift, vol)），供測試使用。
+    drift / vol 可為純量或與 names 等長的陣列；上市日、停牌等情境由呼叫端自行填入 NaN。
+    """
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(drift, vol, (len(dates), len(names)))
+    return pd.DataFrame(100 * np.cumprod(1 + returns, axis=0), index=dates, columns=list(names))
+
+
+def make_synthetic_prices(n_tickers: int, years: int, seed: int = 0, ipo_fraction: float = 0.3,
+                          end_date: str = '2024-12-31') -> pd.DataFrame:
+    """
+    產生可重現的日線價格面板（幾何布朗運動，各標的漂移與波動不同）。
+    ipo_fraction 比例的攻擊型標的在期間內才上市（上市前為 NaN），模擬 UBER 的情況；
+    防禦型資產與基準保持完整歷史。
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end=end_date, periods=int(years * 252))
+    names = [f"T{i:04d}" for i in range(n_tickers)] + SAFE_ASSETS + [BENCHMARK]
+    n_rows, n_cols = len(dates), len(names)
+
+    drift = rng.normal(0.0003, 0.0002, n_cols)
+    vol = rng.uniform(0.008, 0.03, n_cols)
+    log_ret = rng.standard_normal((n_rows, n_cols)) * vol + drift
+    prices = 100 * np.exp(np.cumsum(log_ret, axis=0))
+
+    n_ipo = int(n_tickers * ipo_fraction)
+    ipo_cols = rng.choice(n_tickers, n_ipo, replace=False)
+    ipo_rows = rng.integers(1, n_rows - 252, n_ipo)
+    for col, row in zip(ipo_cols, ipo_rows):
+        prices[:row, col] = np.nan
+
+    return pd.DataFrame(prices, index=dates, columns=names)
+
+
+def _measure(func, repeat: int):
+    """回傳 (結果, 最佳耗時秒數, 記憶體峰值 MB)。耗時與記憶體分開量測，避免 tracemalloc 拖慢計時。"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - t0)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, best, peak / 1e6
+
+
+def run_scale(n_tickers: int, years: int, repeat: int = 3, seed: int = 0) -> list:
+    """執行單一規模的所有階段，回傳每階段一筆結果。"""
+    panel = make_synthetic_prices(n_tickers, years, seed=seed)
+    risky = [c for c in panel.columns if c.startswith('T')]
+    tickers = tuple(panel.columns)
+    start = panel.index[0].strftime('%Y-%m-%d')
+    end = (panel.index[-1] + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+    params = dict(top_n=min(10, n_tickers), frequency='W-FRI', lookbacks=[13, 26, 39], weights=[34, 33, 33])
+
+    fetcher = DataFetcher(InMemoryProvider(panel), store=None)
+    rows = []
+
+    def record(stage, func):
+        result, seconds, peak_mb = _measure(func, repeat)
+        rows.append({'scale': f"{n_tickers}x{years}", 'stage': stage, 'seconds': seconds, 'peak_mb': peak_mb})
+        return result
+
+    prices = record('fetch_data', lambda: fetcher.load_prices(tickers, start, end))
+    record('fetch_data_compact', lambda: fetcher.load_prices(tickers, start, end, compact=True))
+    # 每次都用新的策略物件，量到的是未命中快取的成本
+    record('calculate_momentum', lambda: MomentumStrategy(prices).calculate_momentum('W-FRI', params['lookbacks'], params['weights']))
+    signals = record('generate_signals', lambda: MomentumStrategy(prices).generate_signals(risky, SAFE_ASSETS, **params))
+    record('generate_signals_vol', lambda: MomentumStrategy(prices).generate_signals(
+        risky, SAFE_ASSETS, **params, ranking='vol_adjusted', weighting='inverse_vol'))
+    record('generate_signals_corr', lambda: MomentumStrategy(prices).generate_signals(
+        risky, SAFE_ASSETS, **params, max_correlation=0.7))
+    holdings = record('generate_holdings', lambda: MomentumStrategy(prices).generate_signals(
+        risky, SAFE_ASSETS, **params, sparse=True))
+    backtest = Backtest(prices, signals)
+    results = record('run_backtest', backtest.run_backtest)
+    record('run_backtest_sparse', Backtest(prices, holdings).run_backtest)
+    record('run_daily', backtest.run_daily)
+    record('calculate_metrics', lambda: backtest.calculate_metrics(results['Portfolio Value']))
+    return rows
+
+
+def check(rows: list, thresholds: dict = None, baseline: dict = None, tolerance: float = 1.5) -> list:
+    """
+    比對門檻與 baseline，回傳違規清單。
+    thresholds 格式：{"500x20": {"generate_signals": {"seconds": 1.0, "peak_mb": 300}}}
+    baseline 為先前的報告；耗時超過 baseline * tolerance 視為退步。
+    """
+    violations = []
+    base = {(r['scale'], r['stage']): r for r in (baseline or {}).get('results', [])}
+
+    for row in rows:
+        limits = (thresholds or {}).get(row['scale'], {}).get(row['stage'], {})
+        for metric, limit in limits.items():
+            if row[metric] > limit:
+                violations.append(f"{row['scale']} {row['stage']}: {metric}={row[metric]:.3f} > 門檻 {limit}")
+
+        prev = base.get((row['scale'], row['stage']))
+        if prev and row['seconds'] > prev['seconds'] * tolerance:
+            violations.append(
+                f"{row['scale']} {row['stage']}: {row['seconds']:.3f}s 較 baseline {prev['seconds']:.3f}s 慢 "
+                f"{row['seconds'] / prev['seconds']:.1f} 倍"
+            )
+    return violations
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="雙動能回測效能基準")
+    parser.add_argument('--scales', default=','.join(DEFAULT_SCALES), help="逗號分隔，格式 標的數x年數，例如 50x10,500x20")
+    parser.add_argument('--repeat', type=int, default=3, help="每階段重複次數（取最佳值）")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='bench_report.json')
+    parser.add_argument('--thresholds', default=DEFAULT_THRESHOLDS)
+    parser.add_argument('--baseline', default=None, help="先前的報告，用於比較退步")
+    parser.add_argument('--tolerance', type=float, default=1.5, help="相對 baseline 容許的變慢倍數")
+    args = parser.parse_args(argv)
+
+    rows = []
+    for scale in args.scales.split(','):
+        n_tickers, years = (int(x) for x in scale.strip().split('x'))
+        print(f"執行規模 {n_tickers} 檔 x {years} 年...")
+        for row in run_scale(n_tickers, years, repeat=args.repeat, seed=args.seed):
+            print(f"  {row['stage']:<21} {row['seconds']:>8.3f}s  {row['peak_mb']:>8.1f} MB")
+            rows.append(row)
+
+    thresholds = None
+    if args.thresholds and os.path.exists(args.thresholds):
+        with open(args.thresholds, 'r', encoding='utf-8') as f:
+            thresholds = json.load(f)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    violations = check(rows, thresholds, baseline, args.tolerance)
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'seed': args.seed,
+        },
+        'results': rows,
+        'violations': violations,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"報告已寫入 {args.output}")
+
+    if violations:
+        print("效能退步：")
+        for v in violations:
+            print(f"  - {v}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""
+與執行環境無關的快取裝飾器。
+
+在 Streamlit 中執行時等同 st.cache_data / st.cache_resource（跨 session 共用、可由「清除快取」清空）；
+在命令列、測試或批次伺服器上則改用行程內的 TTL 快取，完全不需載入 Streamlit。
+兩者的快取鍵規則相同：以底線開頭的參數（例如 _self）不列入。
+因此快取的方法不會區分實例：第一個參數為 _self 時，第二個參數必須是 source，
+由呼叫端傳入該實例資料來源的識別（例如 DataFetcher.cache_source），否則裝飾時即拋出 TypeError。
+行程內快取由整個行程共用，CLI、benchmark 與測試中同時存在的多個實例也靠 source 區分。
+每次呼叫會在進行中的 trace 記下 cache.<函式名>.hit / miss（函式名去掉開頭的底線，見 tracing.py）。
+
+cache_data 在 Streamlit 中每次命中都會反序列化出一份新複本；
+cache_resource 則回傳同一個物件，適合唯讀的共用資源（例如記憶體映射的價格矩陣）。
+快取函式執行途中需要更新畫面（例如下載進度）時，以 live_callback 包裝回呼。
+"""
+import functools
+import inspect
+import pickle
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from tracing import count
+
+_REGISTRY = []
+# 被裝飾的函式本體是否真的執行（= 未命中），依執行緒記錄
+_MISSED = threading.local()
+
+
+def _streamlit_runtime():
+    """目前是否在 Streamlit 執行環境內；未載入 streamlit 時不主動 import。"""
+    st = sys.modules.get('streamlit')
+    if st is None:
+        return None
+    try:
+        from streamlit import runtime
+        return st if runtime.exists() else None
+    except ImportError:
+        return None
+
+
+class _LocalCache:
+    """行程內的 TTL + LRU 快取。回傳的是同一個物件，呼叫端不可就地修改。"""
+
+    def __init__(self, func, ttl: float = None, max_entries: int = None):
+        self.func = func
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.signature = inspect.signature(func)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, args, kwargs) -> bytes:
+        bound = self.signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        items = [(name, value) for name, value in bound.arguments.items() if not name.startswith('_')]
+        return pickle.dumps(items, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def __call__(self, *args, **kwargs):
+        key = self.key(args, kwargs)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (self.ttl is None or now - entry[0] < self.ttl):
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        value = self.func(*args, **kwargs)
+        with self._lock:
+            self._entries[key] = (now, value)
+            self._entries.move_to_end(key)
+            while self.max_entries is not None and len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _decorator(streamlit_name: str, ttl: float = None, max_entries: int = None):
+    """每次呼叫時判斷執行環境：Streamlit 內交給 st.<streamlit_name>，其他情況使用 _LocalCache。"""
+    def decorator(func):
+        params = list(inspect.signature(func).parameters)
+        if params[:1] == ['_self'] and params[1:2] != ['source']:
+            raise TypeError(f"{func.__qualname__}：快取的方法不以 _self 區分實例，第二個參數必須是 source（資料來源識別）")
+
+        @functools.wraps(func)
+        def compute(*args, **kwargs):
+            _MISSED.value = True
+            return func(*args, **kwargs)
+
+        local = _LocalCache(compute, ttl, max_entries)
+        streamlit_cached = {}
+
+        def call(*args, **kwargs):
+            st = _streamlit_runtime()
+            if st is None:
+                return local(*args, **kwargs)
+            if 'func' not in streamlit_cached:
+                factory = getattr(st, streamlit_name)
+                streamlit_cached['func'] = factory(ttl=ttl, max_entries=max_entries)(compute)
+            return streamlit_cached['func'](*args, **kwargs)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            outer = getattr(_MISSED, 'value', False)
+            _MISSED.value = False
+            try:
+                value = call(*args, **kwargs)
+                count(f"cache.{func.__name__.lstrip('_')}.{'miss' if _MISSED.value else 'hit'}")
+                return value
+            finally:
+                _MISSED.value = outer
+
+        def clear():
+            local.clear()
+            if 'func' in streamlit_cached:
+                streamlit_cached['func'].clear()
+
+        wrapper.clear = clear
+        _REGISTRY.append(wrapper)
+        return wrapper
+
+    return decorator
+
+
+def cache_data(ttl: float = None, max_entries: int = None):
+    """
+    取代 @st.cache_data(ttl=...)。
+    被裝飾的函式多了 clear() 方法，清除兩種快取。
+    """
+    return _decorator('cache_data', ttl, max_entries)
+
+
+def cache_resource(ttl: float = None, max_entries: int = None):
+    """取代 @st.cache_resource(ttl=...)：所有 session 共用同一個回傳物件，呼叫端不可修改。"""
+    return _decorator('cache_resource', ttl, max_entries)
+
+
+def live_callback(func):
+    """
+    包裝在快取函式執行途中呼叫的回呼（例如更新函式外建立的進度條）。
+    Streamlit 會把快取函式內產生的元素記錄下來、命中時重播，並拒絕更新函式外建立的元素；
+    回呼執行期間暫時標記為不在快取函式內，因此不被記錄，只在實際計算（未命中）時即時更新畫面。
+    該標記是 Streamlit 的內部 API（以 1.65 驗證）；找不到時直接呼叫回呼。
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _streamlit_runtime() is None:
+            return func(*args, **kwargs)
+        try:
+            from streamlit.runtime.scriptrunner_utils.script_run_context import in_cached_function
+        except ImportError:
+            return func(*args, **kwargs)
+        token = in_cached_function.set(False)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            in_cached_function.reset(token)
+    return wrapper
+
+
+def clear_all():
+    """清除所有以 cache_data / cache_resource 裝飾的函式的快取。"""
+    for wrapper in _REGISTRY:
+        wrapper.clear()
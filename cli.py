@@ -0,0 +1,245 @@
+"""
+命令列批次回測：不啟動 Streamlit，讀取工作檔中的多組回測設定，
+以同一份價格資料在多個工作行程中平行執行，將指標、權益曲線與持倉寫成 Parquet / JSON。
+
+用法：
+    python cli.py jobs.json --output results/ --workers 4
+
+工作檔（JSON）：
+    {
+      "risky_assets": ["AAPL", "MSFT", "NVDA"],
+      "safe_assets": ["TLT", "IEF"],
+      "start_date": "2015-01-01",
+      "end_date": "2024-12-31",              # 選填，預設今天
+      "initial_capital": 10000,              # 選填
+      "membership_file": "sp500_events.csv", # 選填，見 membership.py
+      "jobs": [
+        {"name": "12m", "lookbacks": [12], "weights": [1], "top_n": 1, "frequency": "ME"},
+        {"name": "blend", "lookbacks": [3, 6, 12], "weights": [1, 1, 1], "top_n": 2, "cash_protection": true}
+      ],                                     # 工作欄位只限上例所列，其他欄位會被拒絕
+      "grid": {                              # 選填，展開為 build_grid 的所有組合
+        "lookbacks": [[6], [12]], "weights": [[1]],
+        "top_n": [1, 2], "frequency": ["ME"], "cash_protection": [false]
+      }
+    }
+
+輸出目錄：
+- metrics.parquet / metrics.json：每個工作一列（參數、CAGR、波動率、Sharpe、Sortino、MDD、回撤天數、錯誤）
+- equity.parquet：權益曲線（欄 = 工作名稱）
+- holdings.parquet：持倉（date, job, asset, weight，只列出權重 > 0 者）
+- run.json：執行摘要
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from analytics import performance_summary
+from data import DataFetcher
+from membership import MembershipHistory
+from sweep import _init_worker, _prepare_context, batch_results, build_grid, config_row
+
+JOB_DEFAULTS = {'lookbacks': [12], 'top_n': 1, 'frequency': 'ME', 'cash_protection': False}
+# 批次回測支援的設定欄位；其他欄位（例如 skip / ranking / weighting 或拼錯的欄位）直接拒絕，
+# 避免工作檔看起來跑了某個變體，實際上卻被忽略
+JOB_KEYS = {'name', 'weights', *JOB_DEFAULTS}
+GRID_KEYS = {'lookbacks', 'weights', 'top_n', 'frequency', 'cash_protection'}
+
+
+def load_job_file(path: str) -> dict:
+    with open(path, 'r', encoding='utf-8') as f:
+        spec = json.load(f)
+    for key in ('risky_assets', 'safe_assets', 'start_date'):
+        if not spec.get(key):
+            raise ValueError(f"工作檔缺少欄位：{key}")
+    return spec
+
+
+def expand_jobs(spec: dict) -> list:
+    """展開 jobs 與 grid 為回測設定清單，每項含 name。"""
+    configs = []
+    for i, job in enumerate(spec.get('jobs', [])):
+        unknown = sorted(set(job) - JOB_KEYS)
+        if unknown:
+            raise ValueError(f"工作 {job.get('name', i)}：不支援的欄位 {unknown}（可用：{sorted(JOB_KEYS)}）")
+        config = {**JOB_DEFAULTS, **job}
+        config.setdefault('weights', [1.0] * len(config['lookbacks']))
+        if len(config['weights']) != len(config['lookbacks']):
+            raise ValueError(f"工作 {job.get('name', i)}：回顧期與權重數量需相同")
+        config.setdefault('name', f"job{i:03d}")
+        configs.append(config)
+
+    grid = spec.get('grid')
+    if grid:
+        unknown = sorted(set(grid) - GRID_KEYS)
+        if unknown:
+            raise ValueError(f"grid：不支援的欄位 {unknown}（可用：{sorted(GRID_KEYS)}）")
+        for config in build_grid(grid['lookbacks'], grid['weights'], grid.get('top_n', [1]),
+                                 grid.get('frequency', ['ME']), grid.get('cash_protection', [False])):
+            row = config_row(config)
+            config['name'] = (f"lb[{row['lookbacks']}] w[{row['weights']}] top{row['top_n']} "
+                              f"{row['frequency']}{' cash' if row['cash_protection'] else ''}")
+            configs.append(config)
+
+    names = [c['name'] for c in configs]
+    duplicated = sorted({n for n in names if names.count(n) > 1})
+    if duplicated:
+        raise ValueError(f"工作名稱重複：{duplicated}")
+    if not configs:
+        raise ValueError("工作檔中沒有任何回測設定（jobs 或 grid）")
+    return configs
+
+
+def fetch_start(start_date: str, max_lookback: int) -> str:
+    """與 app.py 相同的緩衝：動能計算初期需要 max_lookback 個月以上的歷史。"""
+    buffer_days = int(max_lookback * 35) + 365
+    return (pd.Timestamp(start_date) - timedelta(days=buffer_days)).strftime('%Y-%m-%d')
+
+
+def _run_chunk(configs: list, context: dict = None) -> list:
+    """在工作行程中批次回測一組設定，回傳 (權益曲線, 持倉) 或例外。"""
+    outputs = []
+    for item in batch_results(configs, context, with_signals=True):
+        if isinstance(item, Exception):
+            outputs.append(item)
+        else:
+            results, signals = item
+            outputs.append((results['Portfolio Value'], signals))
+    return outputs
+
+
+def run_jobs(spec: dict, fetcher: DataFetcher = None, max_workers: int = None) -> dict:
+    """
+    執行工作檔內容，回傳 dict：metrics（DataFrame）、equity（DataFrame）、holdings（長表）、report。
+    價格只載入一次；max_workers > 1 時各工作行程共用同一份（由 initializer 傳入一次）。
+    """
+    t_start = time.perf_counter()
+    configs = expand_jobs(spec)
+    risky, safe = list(spec['risky_assets']), list(spec['safe_assets'])
+    end_date = spec.get('end_date') or datetime.now().strftime('%Y-%m-%d')
+    initial_capital = float(spec.get('initial_capital', 10000.0))
+    membership = MembershipHistory.load(spec['membership_file']) if spec.get('membership_file') else None
+
+    fetcher = fetcher if fetcher is not None else DataFetcher()
+    max_lb = max(max(c['lookbacks']) for c in configs)
+    prices, fetch_report = fetcher.fetch_data(
+        tuple(sorted(set(risky + safe))), fetch_start(spec['start_date'], max_lb), end_date, return_report=True
+    )
+    valid_risky = [t for t in risky if t in prices.columns]
+    valid_safe = [t for t in safe if t in prices.columns]
+    if not valid_risky or not valid_safe:
+        raise ValueError("攻擊型或防禦型資產全部下載失敗，無法回測")
+
+    context = _prepare_context(prices, valid_risky, valid_safe, configs, spec['start_date'], end_date,
+                               initial_capital, membership)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(configs)))
+
+    print(f"開始批次回測：{len(configs)} 組，{max_workers} 個行程")
+    if max_workers == 1:
+        outputs = _run_chunk(configs, context)
+    else:
+        # 依頻率排序後切塊，同頻率的設定盡量落在同一塊以便批次回測
+        order = sorted(range(len(configs)), key=lambda i: configs[i]['frequency'])
+        size = max(1, -(-len(configs) // (max_workers * 4)))
+        chunks = [order[i:i + size] for i in range(0, len(order), size)]
+        outputs = [None] * len(configs)
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers, initializer=_init_worker, initargs=(context,)
+        ) as executor:
+            for chunk, part in zip(chunks, executor.map(_run_chunk, [[configs[i] for i in c] for c in chunks])):
+                for i, output in zip(chunk, part):
+                    outputs[i] = output
+
+    curves, holdings, errors = {}, [], {}
+    for config, output in zip(configs, outputs):
+        if isinstance(output, Exception):
+            errors[config['name']] = str(output)
+            continue
+        value, signals = output
+        curves[config['name']] = value
+        held = signals.stack()
+        held = held[held > 0]
+        holdings.append(pd.DataFrame({
+            'date': held.index.get_level_values(0), 'job': config['name'],
+            'asset': held.index.get_level_values(1), 'weight': held.to_numpy(),
+        }))
+
+    equity = pd.DataFrame(curves)
+    # 不同頻率的權益曲線日期不同，各自計算指標
+    summaries = []
+    for frequency in dict.fromkeys(c['frequency'] for c in configs):
+        names = [c['name'] for c in configs if c['frequency'] == frequency and c['name'] in curves]
+        if names:
+            summaries.append(performance_summary(equity[names].dropna(how='all')))
+    summary = pd.concat(summaries) if summaries else pd.DataFrame()
+
+    rows = []
+    for config in configs:
+        row = {'job': config['name'], **config_row(config)}
+        if config['name'] in summary.index:
+            row.update(summary.loc[config['name']].to_dict())
+        row['Error'] = errors.get(config['name'], '')
+        rows.append(row)
+
+    report = {
+        'jobs': len(configs),
+        'failed': errors,
+        'prices': {'tickers': len(prices.columns), 'days': len(prices), 'missing': fetch_report['missing']},
+        'elapsed': round(time.perf_counter() - t_start, 3),
+    }
+    return {
+        'metrics': pd.DataFrame(rows),
+        'equity': equity,
+        'holdings': pd.concat(holdings, ignore_index=True) if holdings else
+        pd.DataFrame(columns=['date', 'job', 'asset', 'weight']),
+        'report': report,
+    }
+
+
+def write_outputs(result: dict, output_dir: str):
+    os.makedirs(output_dir, exist_ok=True)
+    result['metrics'].to_parquet(os.path.join(output_dir, 'metrics.parquet'), index=False)
+    result['metrics'].to_json(os.path.join(output_dir, 'metrics.json'), orient='records', force_ascii=False, indent=2)
+    result['equity'].to_parquet(os.path.join(output_dir, 'equity.parquet'))
+    result['holdings'].to_parquet(os.path.join(output_dir, 'holdings.parquet'), index=False)
+    with open(os.path.join(output_dir, 'run.json'), 'w', encoding='utf-8') as f:
+        json.dump(result['report'], f, ensure_ascii=False, indent=2)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="雙動能策略批次回測（不需 Streamlit）")
+    parser.add_argument('job_files', nargs='+', help="工作檔（JSON），可一次指定多個")
+    parser.add_argument('--output', default='results', help="輸出目錄；多個工作檔時各寫入同名子目錄")
+    parser.add_argument('--workers', type=int, default=None, help="工作行程數，預設為 CPU 數")
+    args = parser.parse_args(argv)
+
+    fetcher = DataFetcher()
+    status = 0
+    for path in args.job_files:
+        output_dir = args.output
+        if len(args.job_files) > 1:
+            output_dir = os.path.join(args.output, os.path.splitext(os.path.basename(path))[0])
+        try:
+            result = run_jobs(load_job_file(path), fetcher, args.workers)
+        except (ValueError, OSError) as e:
+            print(f"{path}：執行失敗：{e}")
+            status = 1
+            continue
+        write_outputs(result, output_dir)
+        report = result['report']
+        print(f"{path}：完成 {report['jobs'] - len(report['failed'])}/{report['jobs']} 組，"
+              f"耗時 {report['elapsed']:.1f} 秒，結果寫入 {output_dir}")
+        if len(report['failed']) == report['jobs']:
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
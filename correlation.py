@@ -0,0 +1,80 @@
+"""
+滾動共變異數引擎：在結算日之間逐日增量更新，只計算當期需要的相關係數列。
+
+視窗為截至結算日（含）的 window 個日報酬。引擎維護：
+- 每檔標的的 Σx、Σx² 與視窗內缺值數，每推進一日的成本是 O(標的數)
+- 已請求過的標的 a 的交叉乘積列 Σ x_a·x_j（j = 全部標的），每推進一日每列的成本也是 O(標的數)
+視窗往後推進 k 日時只加入 k 個新日、移除 k 個舊日；k >= window 時直接由新視窗重算。
+推進時捨棄上一期之後沒有再被請求的列，因此每期只為持有與考慮中的少數標的付費，
+不建立 標的數 × 標的數 的矩陣（500 檔時每期 25 萬個元素）。
+視窗未滿或含缺值（上市未滿 window 日、停牌）時相關係數為 NaN。
+"""
+import numpy as np
+
+
+class RollingCovariance:
+    def __init__(self, returns: np.ndarray, window: int):
+        """returns：shape (日數, 標的數) 的日報酬，可含 NaN；window：視窗長度（日數，至少 2）。"""
+        if window < 2:
+            raise ValueError(f"相關係數視窗至少需要 2 日（收到 {window}）")
+        returns = np.asarray(returns, dtype=float)
+        self.window = int(window)
+        self._missing = np.isnan(returns)
+        # 與 analytics.rolling_mean_std 相同：先減去各欄（抽樣）平均，降低累加平方時的精度損失；
+        # 共變異數不受平移影響。缺值以 0 計入，另以缺值數判斷視窗是否有效
+        with np.errstate(invalid='ignore'):
+            center = np.nan_to_num(np.nanmean(returns[::max(1, len(returns) // 256)], axis=0))
+        self._values = np.where(self._missing, 0.0, returns - center)
+        n = returns.shape[1]
+        self.end = 0  # 目前視窗為 [end - window, end)
+        self._s1 = np.zeros(n)
+        self._s2 = np.zeros(n)
+        self._nan = np.zeros(n, dtype=np.int64)
+        # 每次推進後算一次：Σx / n 與 1 / √(Σ(x - x̄)²)，無效的標的為 NaN
+        self._mean = np.zeros(n)
+        self._scale = np.full(n, np.nan)
+        self._rows = {}
+        self._used = set()
+
+    def advance(self, end: int):
+        """把視窗移到 [end - window, end)；只能往後推進。"""
+        if end < self.end:
+            raise ValueError(f"視窗只能往後推進（目前 {self.end}，要求 {end}）")
+        # 上一期之後沒有再被請求的列不再更新
+        kept = [a for a in self._rows if a in self._used]
+        self._used = set()
+        if end - self.end >= self.window:
+            block = self._values[max(0, end - self.window):end]
+            self._s1 = block.sum(axis=0)
+            self._s2 = np.einsum('ij,ij->j', block, block)
+            self._nan = self._missing[max(0, end - self.window):end].sum(axis=0)
+            self._rows = dict(zip(kept, block[:, kept].T @ block))
+        else:
+            added = self._values[self.end:end]
+            lo, hi = max(0, self.end - self.window), max(0, end - self.window)
+            removed = self._values[lo:hi]
+            self._s1 += added.sum(axis=0) - removed.sum(axis=0)
+            self._s2 += np.einsum('ij,ij->j', added, added) - np.einsum('ij,ij->j', removed, removed)
+            self._nan += self._missing[self.end:end].sum(axis=0) - self._missing[lo:hi].sum(axis=0)
+            # 所有保留的列一次以矩陣乘法更新
+            delta = added[:, kept].T @ added - removed[:, kept].T @ removed
+            self._rows = {a: self._rows[a] + d for a, d in zip(kept, delta)}
+        self.end = end
+        self._mean = self._s1 / self.window
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self._scale = 1.0 / np.sqrt(self._s2 - self._s1 * self._mean)
+        self._scale[(self._nan > 0) | ~np.isfinite(self._scale)] = np.nan
+        if end < self.window:
+            self._scale[:] = np.nan
+
+    def correlations(self, asset: int) -> np.ndarray:
+        """標的位置 asset 與全部標的在目前視窗的相關係數（長度 = 標的數）。"""
+        row = self._rows.get(asset)
+        if row is None:
+            block = self._values[max(0, self.end - self.window):self.end]
+            row = self._rows[asset] = block[:, asset] @ block
+        self._used.add(asset)
+        # Σ(x_a - x̄_a)(x_j - x̄_j) 除以兩者的 √Σ(x - x̄)²；(n - 1) 在分子分母中相消
+        corr = row - self._s1[asset] * self._mean
+        corr *= self._scale[asset] * self._scale
+        return np.clip(corr, -1.0, 1.0, out=corr)
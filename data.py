@@ -1,11 +1,18 @@
-import yfinance as yf
-import streamlit as st
 import pandas as pd
-import requests
-import concurrent.futures
+import numpy as np
 from datetime import datetime
-from io import StringIO
+import concurrent.futures
+import time
 import ssl
+import os
+
+from cache import cache_data, cache_resource, live_callback
+from tracing import annotate, current_span, span, traced
+from price_store import PriceStore
+from price_matrix import PriceMatrix
+from shared_prices import SharedPriceStore
+from market_cap import MarketCapFetcher
+from providers import default_provider
 
 # SSL 憑證驗證繞過（針對 macOS Python 環境常見問題）
 try:
@@ -14,144 +21,464 @@ except AttributeError:
     pass
 
 
+class _ReadyStream:
+    """
+    load_prices 的 on_ready 串流：追蹤每檔標的尚未完成的下載批次，
+    所有批次都完成（且本輪沒有失敗）時就把該標的的收盤價交給回呼，讓呼叫端在其他批次下載時先行計算。
+    只在呼叫 load_prices 的執行緒中使用（由 _run_jobs 的 as_completed 迴圈呼叫），不需加鎖。
+    """
+
+    def __init__(self, store, tickers: tuple, segments: dict, start_date: str, end_date: str, on_ready,
+                 matrix: PriceMatrix = None, chunk: int = 100):
+        self.store = store
+        self.tickers = tickers
+        self.start_date = start_date
+        self.end_date = end_date
+        self.on_ready = on_ready
+        # 緊湊模式：交出的價格轉成矩陣的 dtype；有本機價格庫時同時寫入矩陣，之後不必再讀一次
+        self.matrix = matrix
+        self.chunk = max(1, chunk)
+        downloading = {t for seg in segments.values() for t in seg}
+        self.stored = [t for t in tickers if t not in downloading]
+        self.pending = {}
+        self.round_failed = set()
+        self.emitted = set()
+        self.batches_done = 0
+        self.batches = 0
+
+    def start_round(self, jobs: list):
+        """開始一輪下載（第一輪或重試）：重新計算每檔標的在本輪的批次數。"""
+        self.pending = {}
+        self.round_failed = set()
+        for _, batch, _ in jobs:
+            for t in batch:
+                self.pending[t] = self.pending.get(t, 0) + 1
+        self.batches += len(jobs)
+
+    def emit_stored(self):
+        """本機價格庫已完整涵蓋、不需下載的標的，分塊讀出後交出。"""
+        for i in range(0, len(self.stored), self.chunk):
+            chunk = self.stored[i:i + self.chunk]
+            self._emit(self.store.read(chunk, self.start_date, self.end_date))
+
+    def batch_done(self, batch: list, failed: set, part):
+        """
+        一批下載完成。part 為未使用本機價格庫時該批有數據的欄（已交給 sink）；
+        使用本機價格庫時為 None，已確定的標的改由本機讀出（頭尾區段已合併）。
+        """
+        self.batches_done += 1
+        self.round_failed |= failed
+        ready = []
+        for t in batch:
+            self.pending[t] -= 1
+            if self.pending[t] == 0 and t not in self.round_failed and t not in self.emitted:
+                ready.append(t)
+        if not ready:
+            frame = pd.DataFrame()
+        elif self.store is not None:
+            frame = self.store.read(ready, self.start_date, self.end_date)
+        else:
+            frame = part[[t for t in part.columns if t in set(ready)]]
+        self._emit(frame)
+
+    def _emit(self, frame: pd.DataFrame):
+        if not frame.columns.empty:
+            if self.matrix is not None:
+                if self.store is not None:
+                    self.matrix.write(frame)
+                frame = frame.astype(self.matrix.dtype)
+            self.emitted.update(frame.columns)
+        with span('fetch.on_ready', tickers=len(frame.columns)):
+            self.on_ready(frame, {
+                'batches_done': self.batches_done,
+                'batches': self.batches,
+                'tickers_ready': len(self.emitted),
+                'tickers': len(self.tickers),
+            })
+
+
 class DataFetcher:
-    def __init__(self):
-        pass
+    BATCH_SIZE = 100
+    # 緊湊模式的批次上限：同時在途的 float64 批次越小，記憶體峰值越接近 float32 矩陣本身
+    # （yfinance 本來就逐檔請求，小批不會增加請求數）
+    COMPACT_BATCH_SIZE = 10
+
+    def __init__(self, provider=None, store: PriceStore = None, max_concurrency: int = 5,
+                 shared: SharedPriceStore = None):
+        """
+        provider：資料源（價格、成分股、市值），預設依環境變數選擇，見 providers.default_provider。
+        store：本機價格庫，只下載缺少的標的與缺少的頭尾日期，其餘直接由磁碟提供。
+               線上資料源預設啟用；離線資料源本身就在本機，預設不另存一份。
+        max_concurrency：同時下載的批次數上限。
+        shared：跨 session / 行程共用的唯讀價格矩陣（見 fetch_shared），預設位置見 shared_prices。
+        """
+        self.provider = provider if provider is not None else default_provider()
+        if store is None and self.provider.persistent_cache:
+            store = PriceStore()
+        self.store = store
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.shared = shared if shared is not None else SharedPriceStore()
+
+    @property
+    def cache_source(self) -> tuple:
+        """
+        快取鍵中代表資料來源的部分：資料源的 cache_key、本機價格庫與共用矩陣的位置。
+        快取層不把 self 列入鍵（見 cache.py），不同資料源或價格庫的 fetcher 靠此區分快取。
+        """
+        store_root = os.path.abspath(self.store.root) if self.store is not None else None
+        return self.provider.cache_key, store_root, os.path.abspath(self.shared.root)
 
-    @st.cache_data(ttl=3600)
-    def fetch_data(_self, tickers: tuple, start_date: str, end_date: str = None) -> pd.DataFrame:
+    def fetch_data(self, tickers: tuple, start_date: str, end_date: str = None, return_report: bool = False,
+                   compact: bool = False):
         """
-        分批下載調整後收盤價，支援大量標的（自動分批 100 檔/批）。
+        分批並行下載調整後收盤價，支援大量標的（最多 100 檔/批）。
         tickers 必須傳入 tuple（可雜湊），以確保快取 key 穩定。
+        return_report=True 時回傳 (data, report)，report 格式見 load_prices。
+        compact=True 時回傳 float32 的 PriceMatrix，見 load_prices。
+        """
+        return self._fetch_data(self.cache_source, tickers, start_date, end_date, return_report, compact)
+
+    @cache_data(ttl=3600)
+    def _fetch_data(_self, source: tuple, tickers: tuple, start_date: str, end_date: str, return_report: bool,
+                    compact: bool):
+        return _self.load_prices(tickers, start_date, end_date, return_report=return_report, compact=compact)
+
+    def fetch_shared(self, tickers: tuple, start_date: str, end_date: str = None, dtype: str = 'float64',
+                     on_ready=None):
+        """
+        回傳 (SharedPriceMatrix, report)：記憶體映射的唯讀價格矩陣，所有 session 共用同一個物件
+        （cache_resource 不複製），其他行程也直接映射同一份檔案。
+        共用目錄中已有一小時內發布的相同面板時直接映射，否則經 load_prices 下載後發布新版本。
+        dtype 預設 float64，與 fetch_data 的結果逐位元一致。
+        on_ready 見 load_prices（不列入快取鍵）；命中快取或共用矩陣時不會呼叫。
+        """
+        if end_date is None:
+            end_date = datetime.now().strftime('%Y-%m-%d')
+        tickers = tuple(sorted(set(tickers)))
+        return self._fetch_shared(self.cache_source, tickers, start_date, end_date, dtype, _on_ready=on_ready)
+
+    @cache_resource(ttl=3600)
+    def _fetch_shared(_self, source: tuple, tickers: tuple, start_date: str, end_date: str, dtype: str,
+                      _on_ready=None):
+        # 共用目錄跨行程使用，鍵以資料源的 cache_key 區分（價格庫位置不影響面板內容）
+        key = SharedPriceStore.make_key(source[0], tickers, start_date, end_date, dtype)
+
+        matrix = _self.shared.attach(key, max_age=3600)
+        if matrix is None:
+            data, report = _self.load_prices(tickers, start_date, end_date, return_report=True,
+                                             compact=True, dtype=np.dtype(dtype),
+                                             on_ready=live_callback(_on_ready) if _on_ready else None)
+            _self.shared.publish(key, data, meta={'report': report})
+            _self.shared.prune(key)
+            _self.shared.evict()
+            matrix = _self.shared.attach(key)
+        return matrix, matrix.meta['report']
+
+    @traced('fetch.load_prices')
+    def load_prices(self, tickers, start_date: str, end_date: str = None, return_report: bool = False,
+                    compact: bool = False, dtype=np.float32, on_ready=None):
+        """
+        fetch_data 的實作（不經 Streamlit 快取）。
+        先查本機價格庫，只下載缺少的標的與缺少的頭尾區段，合併後再由本機讀出。
+
+        compact=True 時改為回傳 PriceMatrix：依營業日曆預先配置 dtype（預設 float32）的
+        欄優先陣列，每批結果直接寫入對應欄位，不經過 concat / 去重 / dropna 的整表複製，
+        記憶體峰值不到 DataFrame 路徑的一半。
+
+        各批次在 max_concurrency 的上限內並行下載，總耗時約等於最慢的一批；
+        整批失敗、缺漏或全為 NaN 的標的會重新切批再重試一輪。
+
+        on_ready(frame, progress)：邊下載邊計算的回呼，在呼叫端的執行緒中執行，其他批次同時在工作執行緒下載。
+        本機價格庫已完整提供的標的在送出下載後先分塊傳入；之後每完成一批呼叫一次，傳入所有批次都已完成的標的。
+        frame 為這些標的在 [start, end) 的收盤價（欄為代碼，compact 時已轉成 dtype），與最終結果中對應欄位的數值相同；
+        該批沒有新確定的標的時 frame 沒有欄位。失敗的標的在重試成功時才傳入，最終失敗的標的不傳入。
+        progress = {'batches_done', 'batches', 'tickers_ready', 'tickers'}（批數含重試）。
+
+        report 內容：
+        - requested / from_store：請求檔數、完全由本機提供的檔數
+        - batches：每批的區段、檔數、耗時、是否成功、是否為重試
+        - retried / failed：重試過的代碼、重試後仍失敗的代碼與原因
+        - missing：最終結果中沒有數據的代碼
+        - coverage：每檔實際取得數據的 [首日, 末日]
+        - elapsed：總耗時（秒）
         """
+        t_start = time.perf_counter()
         if end_date is None:
             end_date = datetime.now().strftime('%Y-%m-%d')
 
         # 去重並排序，確保相同清單的 cache key 一致
         tickers = tuple(sorted(set(tickers)))
-        ticker_list = list(tickers)
-        n = len(ticker_list)
+        n = len(tickers)
+        annotate(tickers=n, compact=compact)
 
-        print(f"開始下載 {n} 檔數據，期間：{start_date} ~ {end_date}")
+        print(f"開始取得 {n} 檔數據，期間：{start_date} ~ {end_date}")
+
+        if self.store is not None:
+            with span('fetch.store_plan'):
+                segments = self.store.plan(tickers, start_date, end_date)
+            if not segments:
+                print("全部由本機價格庫提供，無需下載。")
+        else:
+            segments = {(start_date, end_date): list(tickers)}
 
-        BATCH_SIZE = 100
-        batches_input = [ticker_list[i:i + BATCH_SIZE] for i in range(0, n, BATCH_SIZE)]
         all_parts = []
+        batch_limit = self.COMPACT_BATCH_SIZE if compact else self.BATCH_SIZE
+        if compact:
+            # 營業日曆涵蓋所有交易日；休市日之後由 compact() 移除
+            calendar = pd.bdate_range(start_date, pd.Timestamp(end_date) - pd.Timedelta(days=1))
+            matrix = PriceMatrix.allocate(calendar, list(tickers), dtype=dtype)
+            sink = matrix.write
+        else:
+            sink = all_parts.append
 
-        for idx, batch in enumerate(batches_input):
-            batch_label = f"第 {idx+1}/{len(batches_input)} 批（{len(batch)} 檔）"
-            print(f"下載 {batch_label}...")
-            try:
-                df = yf.download(
-                    batch, start=start_date, end=end_date,
-                    auto_adjust=True, threads=True, progress=False
-                )
-                if df.empty:
-                    print(f"{batch_label} 回傳空資料，跳過。")
-                    continue
-
-                # 提取 Close 欄位，相容單標的（Series）和多標的（DataFrame）
-                if isinstance(df.columns, pd.MultiIndex):
-                    # 多標的：columns = (指標, 代碼)
-                    if 'Close' in df.columns.get_level_values(0):
-                        part = df['Close']
-                    else:
-                        print(f"{batch_label} 找不到 Close 欄位，可用：{df.columns.get_level_values(0).unique().tolist()}")
-                        continue
-                else:
-                    # 單標的：columns = ['Close', 'Open', ...]
-                    if 'Close' in df.columns:
-                        part = df[['Close']].rename(columns={'Close': batch[0]})
-                    else:
-                        print(f"{batch_label} 找不到 Close 欄位。")
-                        continue
+        report = {
+            'requested': n,
+            'from_store': n - len({t for seg in segments.values() for t in seg}),
+            'batches': [],
+            'retried': [],
+            'failed': {},
+        }
 
-                if isinstance(part, pd.Series):
-                    part = part.to_frame(name=batch[0] if len(batch) == 1 else 'unknown')
+        # 第一輪：依標的數自適應切批，並行下載
+        jobs = []
+        for (seg_start, seg_end), seg_tickers in segments.items():
+            print(f"需下載 {len(seg_tickers)} 檔，區段：{seg_start} ~ {seg_end}")
+            jobs += self._make_jobs(seg_start, seg_end, seg_tickers, self._batch_size(len(seg_tickers), batch_limit))
+        stream = None
+        if on_ready is not None:
+            stream = _ReadyStream(self.store, tickers, segments, start_date, end_date, on_ready,
+                                  matrix=matrix if compact else None, chunk=batch_limit)
+        failed = self._run_jobs(jobs, sink, report, retry=False, stream=stream)
 
-                all_parts.append(part)
+        # 第二輪：只重試失敗或回傳全 NaN 的標的，依檔數重新切批（失敗的大批會拆成數個小批）
+        if failed:
+            report['retried'] = sorted({t for _, t in failed})
+            print(f"重試 {len(report['retried'])} 檔...")
+            retry_jobs = []
+            by_segment = {}
+            for seg, t in failed:
+                by_segment.setdefault(seg, []).append(t)
+            for (seg_start, seg_end), seg_tickers in by_segment.items():
+                retry_jobs += self._make_jobs(seg_start, seg_end, seg_tickers, self._batch_size(len(seg_tickers), batch_limit))
+            for _, t in self._run_jobs(retry_jobs, sink, report, retry=True, stream=stream):
+                report['failed'][t] = report['_errors'].get(t, '無數據')
+        report.pop('_errors', None)
+
+        if compact:
+            if self.store is not None:
+                with span('fetch.store_read', tickers=n):
+                    # 串流時已寫入矩陣的標的不必再讀一次
+                    remaining = [t for t in tickers if t not in stream.emitted] if stream is not None else tickers
+                    for ticker, series in self.store.iter_series(remaining, start_date, end_date):
+                        matrix.write(series.rename(ticker))
+            with span('fetch.compact') as s:
+                data = matrix.compact()
+                s.set(rows=len(data), cols=len(data.columns))
+            if data.empty:
+                raise ValueError("所有批次下載均失敗，請確認代碼是否正確或重試。")
+            coverage = data.coverage()
+        else:
+            data = self._assemble_frame(tickers, start_date, end_date, all_parts)
+            # 一次算出所有代碼的首末有效日（逐欄 first_valid_index 在數百檔時很慢）
+            present = data.notna().to_numpy()
+            first = present.argmax(axis=0)
+            last = len(data) - 1 - present[::-1].argmax(axis=0)
+            coverage = {
+                t: [data.index[first[j]].strftime('%Y-%m-%d'), data.index[last[j]].strftime('%Y-%m-%d')]
+                for j, t in enumerate(data.columns) if present[first[j], j]
+            }
+
+        report['missing'] = [t for t in tickers if t not in data.columns]
+        report['coverage'] = coverage
+        report['elapsed'] = time.perf_counter() - t_start
+        annotate(rows=len(data), cols=len(data.columns), batches=len(report['batches']))
+
+        print(f"取得完成：{len(data.columns)} 檔，共 {len(data)} 筆交易日數據（{report['elapsed']:.1f} 秒）。")
+        if return_report:
+            return data, report
+        return data
 
-            except Exception as e:
-                print(f"{batch_label} 下載失敗：{e}")
+    @traced('fetch.assemble')
+    def _assemble_frame(self, tickers: tuple, start_date: str, end_date: str, all_parts: list) -> pd.DataFrame:
+        """DataFrame 路徑：由本機價格庫讀出，或合併記憶體中的各批次。"""
+        if self.store is not None:
+            with span('fetch.store_read', tickers=len(tickers)):
+                data = self.store.read(tickers, start_date, end_date)
+        elif all_parts:
+            # 合併所有批次
+            data = pd.concat(all_parts, axis=1)
+            # 移除重複欄（不同批次可能有重疊代碼），並依代碼排序（批次完成順序不固定）
+            data = data.loc[:, ~data.columns.duplicated()]
+            ordered = [t for t in tickers if t in data.columns]
+            data = data[ordered + [c for c in data.columns if c not in set(ordered)]]
+        else:
+            data = pd.DataFrame()
 
-        if not all_parts:
+        if data.columns.empty:
             raise ValueError("所有批次下載均失敗，請確認代碼是否正確或重試。")
 
-        # 合併所有批次
-        data = pd.concat(all_parts, axis=1)
-        # 移除重複欄（不同批次可能有重疊代碼）
-        data = data.loc[:, ~data.columns.duplicated()]
         # 刪除全空行（休市日）
         data.dropna(how='all', inplace=True)
 
         if data.empty:
             raise ValueError("數據合併後為空，請確認日期範圍是否有效。")
-
-        print(f"下載完成：{len(data.columns)} 檔，共 {len(data)} 筆交易日數據。")
+        annotate(rows=len(data), cols=len(data.columns), parts=len(all_parts))
         return data
 
-    @st.cache_data(ttl=86400)  # 每日快取一次
-    def fetch_sp500_tickers(_self) -> list:
+    def _batch_size(self, n: int, limit: int = None) -> int:
+        """自適應批次大小：標的少時切小批，讓每個並行槽都有工作；上限 limit（預設 BATCH_SIZE）。"""
+        return max(1, min(limit or self.BATCH_SIZE, -(-n // self.max_concurrency)))
+
+    @staticmethod
+    def _make_jobs(seg_start: str, seg_end: str, seg_tickers: list, batch_size: int) -> list:
+        batches = [seg_tickers[i:i + batch_size] for i in range(0, len(seg_tickers), batch_size)]
+        return [
+            ((seg_start, seg_end), batch, f"第 {idx+1}/{len(batches)} 批（{len(batch)} 檔）")
+            for idx, batch in enumerate(batches)
+        ]
+
+    def _run_jobs(self, jobs: list, sink, report: dict, retry: bool, stream=None) -> list:
         """
-        從 GitHub 公開 CSV 取得完整 S&P 500 成分股清單（約 503 檔）。
-        此來源不受雲端環境封鎖，穩定可用。
+        並行執行下載工作，回傳失敗的 [(segment, ticker)]，並把每批結果記入 report。
+        未使用本機價格庫時，成功的批次由工作執行緒交給 sink（收集成清單或直接寫入 PriceMatrix）。
+        stream（_ReadyStream）：工作送出後先交出本機已有的標的，之後每完成一批就在本執行緒交出已確定的標的。
         """
-        url = "https://raw.githubusercontent.com/datasets/s-and-p-500-companies/main/data/constituents.csv"
+        if not jobs:
+            if stream is not None and not retry:
+                stream.emit_stored()
+            return []
+        errors = report.setdefault('_errors', {})
+        failed = []
+        # 工作執行緒不繼承 context，批次的 span 明確掛在呼叫端目前的 span 下
+        parent = current_span()
+
+        def run(job):
+            (seg_start, seg_end), batch, batch_label = job
+            print(f"{'重試' if retry else '下載'} {batch_label}...")
+            t0 = time.perf_counter()
+            with span('fetch.retry_batch' if retry else 'fetch.batch', parent=parent, tickers=len(batch)) as s:
+                try:
+                    part = self._download_batch(batch, seg_start, seg_end, batch_label)
+                    if part is None:
+                        return set(), '', time.perf_counter() - t0, None
+                    has_data = part.notna().any()
+                    got = set(has_data.index[has_data.to_numpy()])
+                    s.set(rows=len(part), cols=len(got))
+                    # 在工作執行緒內就寫入，批次資料用完即釋放，不必等到全部完成
+                    if self.store is not None:
+                        self.store.write(part, seg_start, seg_end, requested=batch)
+                        kept = None
+                    else:
+                        kept = part if len(got) == len(part.columns) else part[[t for t in part.columns if t in got]]
+                        sink(kept)
+                        # 只有串流時才把批次交回本執行緒，否則寫入後即可釋放
+                        kept = kept if stream is not None else None
+                    return got, '', time.perf_counter() - t0, kept
+                except Exception as e:
+                    print(f"{batch_label} 下載失敗：{e}")
+                    s.set(error=str(e))
+                    return set(), str(e), time.perf_counter() - t0, None
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(jobs))) as executor:
+            if stream is not None:
+                stream.start_round(jobs)
+            futures = {executor.submit(run, job): job for job in jobs}
+            if stream is not None and not retry:
+                # 下載在工作執行緒進行時，先處理本機價格庫已完整提供的標的
+                stream.emit_stored()
+            for future in concurrent.futures.as_completed(futures):
+                segment, batch, _ = futures.pop(future)
+                got, error, seconds, kept = future.result()
+                report['batches'].append({
+                    'segment': f"{segment[0]} ~ {segment[1]}", 'size': len(batch),
+                    'seconds': seconds, 'ok': not error, 'retry': retry,
+                })
+
+                batch_failed = set()
+                for t in batch:
+                    if t in got or self._before_listing(t, segment):
+                        continue
+                    failed.append((segment, t))
+                    batch_failed.add(t)
+                    errors[t] = error or '無數據'
+                if stream is not None:
+                    stream.batch_done(batch, batch_failed, kept)
+        return failed
+
+    def _before_listing(self, ticker: str, segment: tuple) -> bool:
+        """
+        已收錄的標的補抓頭段，且整段早於本機首筆數據（上市前）時沒有數據屬正常，不算失敗。
+        尾段或與既有數據重疊的頭段全為 NaN 則照常重試並回報。
+        """
+        if self.store is None:
+            return False
+        first = self.store.first_date(ticker)
+        return first is not None and segment[1] <= first
+
+    def _download_batch(self, batch: list, start_date: str, end_date: str, batch_label: str):
+        """透過資料源下載單一批次的收盤價，無資料時回傳 None。"""
+        part = self.provider.download_prices(batch, start_date, end_date)
+        if part is None or part.empty:
+            print(f"{batch_label} 回傳空資料，跳過。")
+            return None
+
+        # 移除重複欄（同批次可能有重疊代碼）
+        return part.loc[:, ~part.columns.duplicated()]
+
+    def fetch_sp500_tickers(self) -> list:
+        """
+        從資料源取得完整 S&P 500 成分股清單（約 503 檔）。
+        預設來源為 GitHub 公開 CSV，此來源不受雲端環境封鎖，穩定可用。
+        """
+        return self._fetch_sp500_tickers(self.cache_source)
+
+    @cache_data(ttl=86400)  # 每日快取一次
+    def _fetch_sp500_tickers(_self, source: tuple) -> list:
         try:
-            r = requests.get(url, timeout=15, verify=False)
-            r.raise_for_status()
-            df = pd.read_csv(StringIO(r.text))
-            if 'Symbol' not in df.columns:
-                raise ValueError(f"CSV 格式異常，找不到 Symbol 欄位。可用欄位：{df.columns.tolist()}")
-            tickers = [t.replace('.', '-') for t in df['Symbol'].tolist()]
+            tickers = _self.provider.fetch_constituents()
             if not tickers:
                 raise ValueError("CSV 解析後清單為空。")
             print(f"成功取得 S&P 500 成分股清單：{len(tickers)} 檔。")
             return tickers
-        except requests.RequestException as e:
-            raise RuntimeError(f"網路請求失敗（{url}）：{e}") from e
+        except RuntimeError:
+            raise
         except Exception as e:
             raise RuntimeError(f"解析 S&P 500 清單失敗：{e}") from e
 
-    @st.cache_data(ttl=86400)  # 每日快取一次
-    def get_top_n_by_market_cap(_self, n: int = 50):
+    def get_top_n_by_market_cap(self, n: int = 50):
         """
         使用 yfinance 查詢 S&P 500 成分股即時市值，依市值排序後回傳前 N 大。
         回傳 (tickers: list, summary: str) 元組。
 
-        注意：500 檔並行查詢約需 30-60 秒，此為正確且必要的延遲。
+        查詢透過 MarketCapFetcher（自適應並行、限速、重試），結果寫入每日快照：
+        今日已查過的標的直接取自快照，只重新查詢過期或失敗的標的。
         """
+        return self._get_top_n_by_market_cap(self.cache_source, n)
+
+    @cache_data(ttl=86400)  # 每日快取一次
+    def _get_top_n_by_market_cap(_self, source: tuple, n: int):
         # 步驟 1：取得完整成分股清單
         all_tickers = _self.fetch_sp500_tickers()
 
-        # 步驟 2：並行查詢市值（20 執行緒）
-        print(f"開始並行查詢 {len(all_tickers)} 檔市值（20 執行緒）...")
-
-        def _fetch_market_cap(ticker):
-            try:
-                mc = yf.Ticker(ticker).fast_info.market_cap
-                if mc and mc > 0:
-                    return (ticker, mc)
-            except Exception:
-                pass
-            return None
-
-        results = []
-        with concurrent.futures.ThreadPoolExecutor(max_workers=20) as executor:
-            futures = {executor.submit(_fetch_market_cap, t): t for t in all_tickers}
-            for future in concurrent.futures.as_completed(futures):
-                result = future.result()
-                if result:
-                    results.append(result)
+        # 步驟 2：查詢市值（優先使用今日快照）
+        report = MarketCapFetcher(
+            _self.provider.fetch_market_cap, use_snapshot=_self.provider.persistent_cache
+        ).fetch(all_tickers)
+        results = list(report['market_caps'].items())
 
         if not results:
-            raise RuntimeError("市值查詢全部失敗，請確認 yfinance 可正常連線。")
+            raise RuntimeError(f"市值查詢全部失敗，請確認資料源（{_self.provider.name}）可正常連線。")
+        if report['failed']:
+            print(f"以下 {len(report['failed'])} 檔市值查詢失敗：{sorted(report['failed'])[:10]}")
 
         # 步驟 3：依市值排序，取前 N 大
         results.sort(key=lambda x: x[1], reverse=True)
         top_tickers = [t for t, _ in results[:n]]
         success_rate = f"{len(results)}/{len(all_tickers)}"
 
-        summary = f"yfinance 即時市值排序（成功查詢 {success_rate} 檔）"
+        summary = f"yfinance 即時市值排序（成功查詢 {success_rate} 檔"
+        if report['from_snapshot']:
+            summary += f"，{report['from_snapshot']} 檔取自今日快照"
+        summary += "）"
         print(f"完成！前 {n} 大：{top_tickers[:5]}...")
         return top_tickers, summary
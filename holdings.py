@@ -0,0 +1,113 @@
+"""
+稀疏持倉：每個結算日只記錄非零權重的 (資產位置, 權重)，以 CSR 格式存放。
+
+雙動能策略每期最多持有 top_n 檔攻擊型資產加一檔防禦資產，
+密集的 日期 × 全部資產 信號矩陣在 500 檔時幾乎全是 0。
+SparseHoldings 的記憶體與回測成本只和實際持倉數成正比：
+- indptr[i]:indptr[i+1] 為第 i 個結算日的持倉範圍
+- indices / weights 為持倉的資產位置（對應 columns）與權重
+需要時可用 to_dense() 取回與 generate_signals 相同的 DataFrame。
+"""
+import numpy as np
+import pandas as pd
+
+
+class SparseHoldings:
+    def __init__(self, index, columns, indptr, indices, weights):
+        self.index = pd.DatetimeIndex(index)
+        self.columns = pd.Index(columns)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        if (len(self.indptr) != len(self.index) + 1 or self.indptr[-1] != len(self.indices)
+                or len(self.indices) != len(self.weights)):
+            raise ValueError("稀疏持倉的 indptr / indices / weights 長度不一致")
+
+    @classmethod
+    def from_array(cls, values: np.ndarray, index, columns) -> 'SparseHoldings':
+        """由 shape (日期數, 資產數) 的權重陣列建立，只保留非零（且非 NaN）的權重。"""
+        values = np.asarray(values, dtype=np.float64)
+        rows, cols = np.nonzero(np.nan_to_num(values, nan=0.0))
+        indptr = np.zeros(len(values) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(values)), out=indptr[1:])
+        return cls(index, columns, indptr, cols, values[rows, cols])
+
+    @classmethod
+    def from_dense(cls, frame: pd.DataFrame) -> 'SparseHoldings':
+        return cls.from_array(frame.to_numpy(dtype=np.float64), frame.index, frame.columns)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    @property
+    def empty(self) -> bool:
+        return len(self.index) == 0
+
+    @property
+    def nnz(self) -> int:
+        return len(self.indices)
+
+    @property
+    def nbytes(self) -> int:
+        return self.indptr.nbytes + self.indices.nbytes + self.weights.nbytes
+
+    def row_ids(self) -> np.ndarray:
+        """每筆持倉所屬的列位置（與 indices / weights 對齊）。"""
+        return np.repeat(np.arange(len(self.index)), np.diff(self.indptr))
+
+    def shift(self, periods: int = 1) -> 'SparseHoldings':
+        """與 DataFrame.shift(periods).fillna(0) 相同：持倉往後移，前 periods 列為空倉。"""
+        if periods <= 0:
+            raise ValueError("只支援往後移（periods >= 1）")
+        n = len(self.index)
+        periods = min(periods, n)
+        end = self.indptr[n - periods]
+        indptr = np.concatenate([np.zeros(periods, dtype=np.int64), self.indptr[:n - periods + 1]])
+        return SparseHoldings(self.index, self.columns, indptr, self.indices[:end], self.weights[:end])
+
+    def slice(self, start=None, end=None) -> 'SparseHoldings':
+        """依日期切片（含兩端），等同 DataFrame.loc[start:end]。"""
+        lo = 0 if start is None else self.index.searchsorted(pd.Timestamp(start), side='left')
+        hi = len(self.index) if end is None else self.index.searchsorted(pd.Timestamp(end), side='right')
+        hi = max(lo, hi)
+        a, b = self.indptr[lo], self.indptr[hi]
+        return SparseHoldings(self.index[lo:hi], self.columns, self.indptr[lo:hi + 1] - a,
+                              self.indices[a:b], self.weights[a:b])
+
+    def to_array(self, columns=None) -> np.ndarray:
+        """密集權重陣列；指定 columns 時只展開這些資產（不在持倉欄位中的資產為 0）。"""
+        if columns is None:
+            out = np.zeros((len(self.index), len(self.columns)))
+            out[self.row_ids(), self.indices] = self.weights
+            return out
+        columns = pd.Index(columns)
+        position = columns.get_indexer(self.columns)
+        keep = position[self.indices] >= 0
+        out = np.zeros((len(self.index), len(columns)))
+        out[self.row_ids()[keep], position[self.indices[keep]]] = self.weights[keep]
+        return out
+
+    def to_dense(self) -> pd.DataFrame:
+        """與 generate_signals 相同格式的 DataFrame（日期 × 全部資產）。"""
+        return pd.DataFrame(self.to_array(), index=self.index, columns=self.columns)
+
+    def held_columns(self) -> pd.Index:
+        """曾經持有（權重非零）的資產。"""
+        return self.columns[np.unique(self.indices)]
+
+    def held_labels(self, cash_label: str = "CASH") -> pd.Series:
+        """每個結算日持有的資產（依欄位順序以「, 」串接），沒有持倉時為 cash_label。"""
+        names = self.columns.to_numpy()
+        labels = [
+            ", ".join(names[self.indices[a:b]]) if b > a else cash_label
+            for a, b in zip(self.indptr[:-1], self.indptr[1:])
+        ]
+        return pd.Series(labels, index=self.index)
+
+    def stack(self) -> pd.DataFrame:
+        """長表格式 (date, asset, weight)，只列出非零權重。"""
+        return pd.DataFrame({
+            'date': self.index[self.row_ids()],
+            'asset': self.columns[self.indices],
+            'weight': self.weights,
+        })
@@ -0,0 +1,146 @@
+import numpy as np
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+
+
+def signal_from_momentum_row(use_mom: pd.Series, risky_assets: list, safe_assets: list, top_n: int = 1,
+                             cash_protection: bool = False) -> dict:
+    """
+    由單一結算期的動能（index = 代碼）算出持倉 {代碼: 權重}。
+    選股直接沿用 generate_signals 的 _signals_from_momentum，兩者規則相同：
+    有效動能不足 Top N 時，空出的名額與未通過絕對動能的名額一樣轉入最佳防禦資產（或現金）。
+    權重合計不足 1 的部分記為 "CASH"；無法計算時回傳 {"Error": 原因}。
+    """
+    # 與 strategy 互相引用，延後到呼叫時才 import
+    from strategy import _signal_dict, _signals_from_momentum
+
+    # 檢查動能是否全為 NaN
+    if use_mom.isnull().all():
+        return {"Error": "動能數據不足（可能回顧期過長）"}
+
+    risky = [r for r in risky_assets if r in use_mom.index]
+    if use_mom[risky].isnull().all():
+        return {"Error": "攻擊型資產動能均為 NaN"}
+
+    all_assets = sorted(set(risky + list(safe_assets)))
+    weights_row = _signals_from_momentum(use_mom.to_frame().T, risky, safe_assets, all_assets, top_n,
+                                         cash_protection)[0]
+    return _signal_dict(all_assets, weights_row, top_n)
+
+
+class LiveSignalEngine:
+    """
+    增量式最新信號引擎：只保留最近 max(lookbacks) + 2 期的結算期收盤價（環狀緩衝區），
+    每收到一根新 K 線以 O(標的數) 更新，隨時可讀出當期複合動能與持倉。
+
+    - 同一結算期內的新 K 線覆蓋該期收盤價（等同 resample().last()，NaN 不覆蓋）
+    - 跨入新結算期時緩衝區前進；中間若有整期無資料，補上空白期（與 resample 相同）
+    結果與 MomentumStrategy.calculate_momentum / get_latest_signal 的整段重算逐位元一致。
+    """
+
+    def __init__(self, tickers, frequency: str = 'ME', lookbacks: list = [12], weights: list = [1.0],
+                 dtype=np.float64):
+        self.tickers = pd.Index(list(tickers))
+        self.frequency = frequency
+        self.lookbacks = list(lookbacks)
+        self.weights = list(weights)
+        self._offset = to_offset(frequency)
+        # 當期與上一期都要能回看 max(lookbacks) 期
+        self.depth = max(self.lookbacks) + 2
+        # 與價格相同的精度（PriceMatrix 為 float32），確保與批次計算逐位元一致
+        self._closes = np.full((self.depth, len(self.tickers)), np.nan, dtype=dtype)
+        self.n_periods = 0
+        self.period = None
+
+    @classmethod
+    def from_period_closes(cls, closes: pd.DataFrame, frequency: str = 'ME', lookbacks: list = [12],
+                           weights: list = [1.0]) -> 'LiveSignalEngine':
+        """以已重新取樣的結算期收盤價（resample().last() 的結果）初始化，只讀取最後 depth 期。"""
+        n = len(closes)
+        tail = closes.iloc[max(0, n - max(lookbacks) - 2):].to_numpy()
+        if tail.dtype.kind != 'f':
+            tail = tail.astype(np.float64)
+        engine = cls(closes.columns, frequency, lookbacks, weights, dtype=tail.dtype)
+        for i, p in enumerate(range(n - len(tail), n)):
+            engine._closes[p % engine.depth] = tail[i]
+        engine.n_periods = n
+        engine.period = closes.index[-1] if n else None
+        return engine
+
+    def _label(self, date) -> pd.Timestamp:
+        """日期所屬結算期的標籤（與 resample 的右端標籤相同）。"""
+        return self._offset.rollforward(pd.Timestamp(date).normalize())
+
+    def _advance(self, steps: int):
+        for _ in range(min(steps, self.depth)):
+            self._closes[self.n_periods % self.depth] = np.nan
+            self.n_periods += 1
+        self.n_periods += max(0, steps - self.depth)
+
+    def update(self, date, closes) -> 'LiveSignalEngine':
+        """
+        加入一根 K 線。closes 為 {代碼: 收盤價} 或 Series；不在標的清單內的代碼略過。
+        日期不可早於目前的結算期。
+        """
+        label = self._label(date)
+        if self.period is None:
+            self._advance(1)
+        elif label < self.period:
+            raise ValueError(f"K 線日期 {pd.Timestamp(date).date()} 早於目前結算期 {self.period.date()}")
+        elif label > self.period:
+            self._advance(len(pd.date_range(self.period, label, freq=self._offset)) - 1)
+        self.period = label
+
+        closes = pd.Series(closes, dtype=self._closes.dtype)
+        cols = self.tickers.get_indexer(closes.index)
+        values = closes.to_numpy()
+        keep = (cols >= 0) & ~np.isnan(values)
+        self._closes[(self.n_periods - 1) % self.depth, cols[keep]] = values[keep]
+        return self
+
+    def momentum(self, periods_ago: int = 0) -> pd.Series:
+        """目前（或 periods_ago 期前）的複合動能，算法與 composite_momentum_from_returns 相同。"""
+        composite = np.zeros(len(self.tickers))
+        total_weight = sum(self.weights)
+        if total_weight == 0:
+            return pd.Series(composite, index=self.tickers)
+
+        current = self.n_periods - 1 - periods_ago
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for lb, w in zip(self.lookbacks, self.weights):
+                if current - lb < 0:
+                    composite += np.nan
+                    continue
+                returns = self._closes[current % self.depth] / self._closes[(current - lb) % self.depth] - 1
+                composite += returns * w
+        composite /= total_weight
+        return pd.Series(composite, index=self.tickers)
+
+    def latest_signal(self, risky_assets: list, safe_assets: list, top_n: int = 1, cash_protection: bool = False,
+                      today=None, membership=None) -> dict:
+        """
+        與 MomentumStrategy.get_latest_signal 相同：若目前結算期與今天同年同月（尚未結束），
+        改用上一個完整結算期的動能。傳入 membership 時只從該結算期的成分股中選股。
+        """
+        if self.n_periods == 0:
+            return {"Error": "動能數據為空"}
+
+        if isinstance(safe_assets, str):
+            safe_assets = [safe_assets]
+
+        today = pd.Timestamp.today() if today is None else pd.Timestamp(today)
+        if self.period.year == today.year and self.period.month == today.month:
+            if self.n_periods < 2:
+                return {"Error": "數據不足以計算信號（需至少兩個完整結算期）"}
+            use_mom = self.momentum(periods_ago=1)
+            period = self.period - self._offset
+        else:
+            use_mom = self.momentum()
+            period = self.period
+
+        if membership is not None:
+            risky = [r for r in risky_assets if r in use_mom.index]
+            ineligible = [r for r, ok in zip(risky, membership.mask([period], risky)[0]) if not ok]
+            use_mom[ineligible] = np.nan
+
+        return signal_from_momentum_row(use_mom, risky_assets, safe_assets, top_n, cash_protection)
@@ -0,0 +1,180 @@
+import os
+import json
+import time
+import random
+import threading
+import concurrent.futures
+from datetime import datetime
+
+# 預設快照位置：專案目錄下的 .cache/market_caps.json
+DEFAULT_SNAPSHOT_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '.cache', 'market_caps.json'
+)
+
+
+class TokenBucket:
+    """
+    令牌桶限速：平均每秒最多 rate 次請求，允許短暫爆量至 capacity 次。
+    多執行緒共用同一個實例。
+    """
+
+    def __init__(self, rate: float, capacity: float = None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                # 容許浮點誤差，避免等待時間小到時鐘無法前進而空轉
+                if self._tokens >= 1 - 1e-9:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            self._sleep(wait)
+
+
+class AdaptiveLimiter:
+    """
+    AIMD 自適應並行數：成功時緩慢加大上限（每輪約 +1），
+    失敗（逾時、被限流）時上限減半，避免持續撞上資料源的限流。
+    """
+
+    def __init__(self, initial: int = 8, minimum: int = 1, maximum: int = 32):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self._active = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self._active >= int(self.limit):
+                self._cond.wait()
+            self._active += 1
+
+    def release(self, success: bool):
+        with self._cond:
+            self._active -= 1
+            if success:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            else:
+                self.limit = max(self.minimum, self.limit / 2)
+            self._cond.notify_all()
+
+
+class MarketCapFetcher:
+    """
+    市值查詢器：自適應並行 + 令牌桶限速 + 逐檔重試（指數退避），
+    並將結果寫入帶日期的本機快照。
+
+    - 今日已成功查詢的標的直接取自快照，只重新查詢過期或先前失敗的標的
+    - 全部標的皆有今日快照時，不發出任何請求，立即回傳
+    provider 為 `provider(ticker) -> market_cap` 的可呼叫物件，測試時可換成本機替身；
+    離線資料源不需快照，可設 use_snapshot=False。
+    """
+
+    def __init__(self, provider=None, snapshot_path: str = None, rate: float = 10.0,
+                 max_workers: int = 32, initial_workers: int = 8, max_retries: int = 3,
+                 backoff: float = 0.5, today=None, use_snapshot: bool = True):
+        if provider is None:
+            from providers import YFinanceProvider
+            provider = YFinanceProvider().fetch_market_cap
+        self.provider = provider
+        self.snapshot_path = snapshot_path or DEFAULT_SNAPSHOT_PATH
+        self.use_snapshot = use_snapshot
+        self.bucket = TokenBucket(rate)
+        self.max_workers = max_workers
+        self.initial_workers = initial_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._today = today or (lambda: datetime.now().strftime('%Y-%m-%d'))
+
+    # ──────────────── 快照 ────────────────
+    def load_snapshot(self) -> dict:
+        if not self.use_snapshot:
+            return {}
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_snapshot(self, snapshot: dict):
+        if not self.use_snapshot:
+            return
+        os.makedirs(os.path.dirname(self.snapshot_path) or '.', exist_ok=True)
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.snapshot_path)
+
+    # ──────────────── 查詢 ────────────────
+    def _fetch_one(self, ticker: str, limiter: AdaptiveLimiter):
+        """查詢單一標的，失敗時以指數退避重試；回傳 (ticker, market_cap 或 None, 錯誤訊息)。"""
+        error = ''
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                time.sleep(self.backoff * (2 ** (attempt - 1)) * (1 + random.random()))
+            self.bucket.acquire()
+            limiter.acquire()
+            success = False
+            try:
+                mc = self.provider(ticker)
+                if mc and mc > 0:
+                    success = True
+                    return ticker, float(mc), ''
+                error = f"無效市值：{mc}"
+            except Exception as e:
+                error = str(e)
+            finally:
+                limiter.release(success)
+        return ticker, None, error
+
+    def fetch(self, tickers: list, refresh: bool = False) -> dict:
+        """
+        取得各標的市值，回傳 {'market_caps': {ticker: cap}, 'failed': {ticker: error},
+        'from_snapshot': int, 'queried': int}。
+        refresh=True 時忽略今日快照、全部重新查詢。
+        """
+        today = self._today()
+        snapshot = self.load_snapshot()
+
+        caps = {}
+        pending = []
+        for t in dict.fromkeys(tickers):
+            entry = snapshot.get(t)
+            if not refresh and entry and entry.get('date') == today:
+                caps[t] = entry['market_cap']
+            else:
+                pending.append(t)
+        from_snapshot = len(caps)
+
+        failed = {}
+        if pending:
+            print(f"查詢 {len(pending)} 檔市值（{from_snapshot} 檔取自今日快照）...")
+            limiter = AdaptiveLimiter(self.initial_workers, maximum=self.max_workers)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = [executor.submit(self._fetch_one, t, limiter) for t in pending]
+                for future in concurrent.futures.as_completed(futures):
+                    ticker, mc, error = future.result()
+                    if mc is None:
+                        failed[ticker] = error
+                    else:
+                        caps[ticker] = mc
+                        snapshot[ticker] = {'market_cap': mc, 'date': today}
+            self._save_snapshot(snapshot)
+
+        return {
+            'market_caps': caps,
+            'failed': failed,
+            'from_snapshot': from_snapshot,
+            'queried': len(pending),
+        }
@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+
+
+class PriceMatrix:
+    """
+    緊湊的價格容器：預先配置、欄優先（Fortran order）的連續陣列，
+    搭配日期索引與 代碼→欄位 對照表。預設 float32，記憶體約為 float64 DataFrame 的一半。
+
+    各批次下載結果直接寫入對應欄位，不需 pd.concat；
+    MomentumStrategy 與 Backtest 可直接接受此物件（透過 to_frame 取得零複製視圖）。
+    """
+
+    def __init__(self, values: np.ndarray, index: pd.DatetimeIndex, tickers: list):
+        if values.shape != (len(index), len(tickers)):
+            raise ValueError(f"陣列形狀 {values.shape} 與索引（{len(index)}）/ 代碼數（{len(tickers)}）不符")
+        self.values = values
+        self.index = pd.DatetimeIndex(index)
+        self.columns = pd.Index(list(tickers))
+        self._col = {t: i for i, t in enumerate(self.columns)}
+
+    @classmethod
+    def allocate(cls, index, tickers: list, dtype=np.float32) -> 'PriceMatrix':
+        """配置一個全為 NaN 的矩陣，之後以 write() 逐批填入。"""
+        values = np.full((len(index), len(tickers)), np.nan, dtype=dtype, order='F')
+        return cls(values, index, tickers)
+
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame, dtype=np.float32) -> 'PriceMatrix':
+        return cls(np.asfortranarray(frame.to_numpy(dtype=dtype)), frame.index, list(frame.columns))
+
+    @property
+    def shape(self) -> tuple:
+        return self.values.shape
+
+    @property
+    def dtype(self):
+        return self.values.dtype
+
+    @property
+    def nbytes(self) -> int:
+        return self.values.nbytes
+
+    @property
+    def empty(self) -> bool:
+        return self.values.size == 0
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, ticker) -> bool:
+        return ticker in self._col
+
+    def column(self, ticker: str) -> np.ndarray:
+        """回傳單一標的的價格視圖（不複製）。"""
+        return self.values[:, self._col[ticker]]
+
+    def write(self, part) -> int:
+        """
+        將一批結果（DataFrame 或 Series，欄 = 代碼）寫入對應欄位。
+        不在日期索引內的日期（例如週末資料）會略過，回傳略過的筆數。
+        """
+        if isinstance(part, pd.Series):
+            part = part.to_frame()
+        rows = self.index.get_indexer(part.index)
+        valid = rows >= 0
+        skipped = int((~valid).sum())
+        if skipped:
+            rows = rows[valid]
+        for ticker in part.columns:
+            j = self._col.get(ticker)
+            if j is None:
+                continue
+            col = part[ticker].to_numpy()
+            self.values[rows, j] = col[valid] if skipped else col
+        return skipped
+
+    def compact(self) -> 'PriceMatrix':
+        """
+        就地移除全為 NaN 的列（休市日）與欄（無數據的代碼）。
+        有效資料逐欄往底層緩衝區的前端搬移，只需一欄的暫存空間，
+        結果仍是連續的欄優先陣列（與原矩陣共用記憶體，尾端空間不釋放）。
+        """
+        # 逐欄檢查，避免配置與整個矩陣等大的布林陣列
+        keep_rows = np.zeros(len(self.index), dtype=bool)
+        keep_cols = []
+        for j in range(self.values.shape[1]):
+            present = ~np.isnan(self.values[:, j])
+            if present.any():
+                keep_rows |= present
+                keep_cols.append(j)
+
+        n_rows, n_cols = int(keep_rows.sum()), len(keep_cols)
+        flat = self.values.reshape(-1, order='F')
+        # 目的區段永遠不晚於尚未搬移的來源欄，依序搬移不會覆蓋未讀取的資料
+        for new_j, j in enumerate(keep_cols):
+            flat[new_j * n_rows:(new_j + 1) * n_rows] = self.values[keep_rows, j]
+
+        self.values = flat[:n_rows * n_cols].reshape((n_rows, n_cols), order='F')
+        self.index = self.index[keep_rows]
+        self.columns = self.columns[keep_cols]
+        self._col = {t: i for i, t in enumerate(self.columns)}
+        return self
+
+    def coverage(self) -> dict:
+        """每檔實際有數據的 [首日, 末日]。"""
+        coverage = {}
+        for j, t in enumerate(self.columns):
+            rows = np.flatnonzero(~np.isnan(self.values[:, j]))
+            if len(rows):
+                coverage[t] = [self.index[rows[0]].strftime('%Y-%m-%d'), self.index[rows[-1]].strftime('%Y-%m-%d')]
+        return coverage
+
+    def to_frame(self) -> pd.DataFrame:
+        """零複製的 DataFrame 視圖（欄優先陣列轉置後即為 pandas 區塊的記憶體配置）。"""
+        return pd.DataFrame(self.values, index=self.index, columns=self.columns, copy=False)
+
+
+def as_frame(prices) -> pd.DataFrame:
+    """讓策略與回測同時接受 DataFrame 與 PriceMatrix。"""
+    if isinstance(prices, PriceMatrix):
+        return prices.to_frame()
+    return prices
@@ -0,0 +1,200 @@
+import os
+import json
+import threading
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+# 預設存放位置：專案目錄下的 .cache/prices（可用環境變數 PRICE_STORE_DIR 覆寫）
+DEFAULT_STORE_DIR = os.environ.get(
+    'PRICE_STORE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'prices')
+)
+
+# 補抓頭尾資料時與既有資料重疊的天數，用來對齊調整後價格的基準
+OVERLAP_DAYS = 10
+
+# 同一目錄的寫入需互斥（Streamlit 多個 session 共用同一個行程）
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _lock_for(root: str) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(os.path.abspath(root), threading.Lock())
+
+
+def _to_date(value) -> str:
+    return pd.Timestamp(value).strftime('%Y-%m-%d')
+
+
+class PriceStore:
+    """
+    本機欄式價格庫：每檔標的一個 Parquet 檔（單欄 Close），
+    並以 manifest.json 記錄每檔已涵蓋的請求區間 [start, end)。
+
+    涵蓋區間記錄的是「已向資料源請求過」的範圍，而非實際有數據的範圍，
+    因此 IPO 較晚的標的（例如 UBER）不會每次都重新下載上市前的空白期間。
+    """
+
+    def __init__(self, root: str = None):
+        self.root = root or DEFAULT_STORE_DIR
+        self._manifest_path = os.path.join(self.root, 'manifest.json')
+        self._lock = _lock_for(self.root)
+        self._manifest = self._load_manifest()
+
+    # ──────────────── manifest ────────────────
+    def _load_manifest(self) -> dict:
+        try:
+            with open(self._manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_manifest(self):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self._manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self._manifest_path)
+
+    def _path(self, ticker: str) -> str:
+        return os.path.join(self.root, f"{ticker.replace(os.sep, '_')}.parquet")
+
+    def coverage(self, ticker: str):
+        """回傳 (start, end) 已涵蓋區間，未收錄則回傳 None。"""
+        span = self._manifest.get(ticker)
+        return tuple(span) if span else None
+
+    def first_date(self, ticker: str):
+        """回傳本機已存的首筆數據日期（YYYY-MM-DD），無數據則回傳 None。"""
+        s = self._read_one(ticker)
+        if s is None or s.empty:
+            return None
+        return _to_date(s.index[0])
+
+    # ──────────────── 規劃缺漏區段 ────────────────
+    def plan(self, tickers, start_date: str, end_date: str) -> dict:
+        """
+        比對請求區間與已涵蓋區間，回傳需要下載的區段：
+        {(seg_start, seg_end): [tickers...]}，相同區段的標的歸為一組以便批次下載。
+
+        - 未收錄的標的：下載整段 [start, end)
+        - 請求早於已涵蓋起點：補抓頭段（與既有資料重疊 OVERLAP_DAYS 天）
+        - 請求晚於已涵蓋終點：補抓尾段（與既有資料重疊 OVERLAP_DAYS 天）
+        子集合或較短的期間會完全由本機提供，不產生任何區段。
+        """
+        start_date, end_date = _to_date(start_date), _to_date(end_date)
+        overlap = timedelta(days=OVERLAP_DAYS)
+        segments = {}
+
+        for ticker in tickers:
+            span = self.coverage(ticker)
+            if span is None:
+                segments.setdefault((start_date, end_date), []).append(ticker)
+                continue
+
+            cov_start, cov_end = span
+            if start_date < cov_start:
+                head_end = _to_date(pd.Timestamp(cov_start) + overlap)
+                segments.setdefault((start_date, head_end), []).append(ticker)
+            if end_date > cov_end:
+                tail_start = _to_date(pd.Timestamp(cov_end) - overlap)
+                segments.setdefault((tail_start, end_date), []).append(ticker)
+
+        return segments
+
+    # ──────────────── 寫入 ────────────────
+    def write(self, part: pd.DataFrame, start_date: str, end_date: str, requested: list = None) -> list:
+        """
+        將一批下載結果（欄 = 代碼）合併進本機庫，並擴充各標的的涵蓋區間。
+        全為 NaN 的欄視為下載失敗，不寫入也不記錄涵蓋區間，下次請求會重試。
+        例外：requested 中已收錄過的標的若補抓的頭段整段早於既有首筆數據（上市前），
+        代表該區段本來就沒有交易，仍往前擴充涵蓋起點，避免每次重抓。
+        尾段沒有數據則不擴充涵蓋終點，下次請求會再補抓。
+        回傳實際寫入的代碼清單。
+        """
+        start_date = _to_date(start_date)
+        # 未來日期尚未有數據，涵蓋終點不可超過今天
+        end_date = min(_to_date(end_date), datetime.now().strftime('%Y-%m-%d'))
+        written = []
+
+        with self._lock:
+            os.makedirs(self.root, exist_ok=True)
+            # 其他 session 可能已更新 manifest，寫入前重新讀取
+            self._manifest = self._load_manifest()
+
+            for ticker in part.columns:
+                new = part[ticker].dropna()
+                if new.empty:
+                    continue
+
+                old = self._read_one(ticker)
+                merged = self._merge(old, new) if old is not None else new
+                merged.rename('Close').to_frame().to_parquet(self._path(ticker))
+
+                span = self.coverage(ticker)
+                if span is None:
+                    self._manifest[ticker] = [start_date, end_date]
+                else:
+                    self._manifest[ticker] = [min(span[0], start_date), max(span[1], end_date)]
+                written.append(ticker)
+
+            for ticker in requested or []:
+                span = self.coverage(ticker)
+                if ticker in written or span is None or start_date >= span[0]:
+                    continue
+                first = self.first_date(ticker)
+                if first is not None and end_date <= first:
+                    self._manifest[ticker] = [start_date, span[1]]
+
+            self._save_manifest()
+
+        return written
+
+    @staticmethod
+    def _merge(old: pd.Series, new: pd.Series) -> pd.Series:
+        """
+        合併新舊數據。調整後收盤價會因配息、分割而整段重新縮放，
+        因此以重疊日的比值將較舊基準的一側對齊到最新基準：
+        - 尾段（新資料較晚）：以新資料為準，整段舊資料乘上比值
+        - 頭段（新資料較早）：以既有資料為準，新頭段除以比值換算回既有基準
+        """
+        common = old.index.intersection(new.index)
+        if len(common) > 0:
+            is_tail = new.index[-1] >= old.index[-1]
+            anchor = common[-1] if is_tail else common[0]
+            ratio = new.loc[anchor] / old.loc[anchor]
+            if pd.notna(ratio) and ratio > 0 and abs(ratio - 1) > 1e-9:
+                if is_tail:
+                    old = old * ratio
+                else:
+                    new = new / ratio
+
+        merged = pd.concat([old[~old.index.isin(new.index)], new]).sort_index()
+        return merged
+
+    # ──────────────── 讀取 ────────────────
+    def _read_one(self, ticker: str):
+        path = self._path(ticker)
+        if not os.path.exists(path):
+            return None
+        return pd.read_parquet(path)['Close']
+
+    def iter_series(self, tickers, start_date: str, end_date: str):
+        """逐檔產生 (代碼, [start, end) 收盤價)，未收錄或區間內無數據的標的略過。"""
+        start_ts, end_ts = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        for ticker in tickers:
+            s = self._read_one(ticker)
+            if s is None:
+                continue
+            s = s[(s.index >= start_ts) & (s.index < end_ts)]
+            if not s.empty:
+                yield ticker, s
+
+    def read(self, tickers, start_date: str, end_date: str) -> pd.DataFrame:
+        """讀取指定標的在 [start, end) 的收盤價，欄順序與 tickers 相同；未收錄的標的略過。"""
+        series = dict(self.iter_series(tickers, start_date, end_date))
+        if not series:
+            return pd.DataFrame()
+        return pd.concat(series, axis=1)
@@ -0,0 +1,215 @@
+import os
+import glob
+import threading
+import uuid
+from io import StringIO
+
+import pandas as pd
+
+SP500_CSV_URL = "https://raw.githubusercontent.com/datasets/s-and-p-500-companies/main/data/constituents.csv"
+
+
+class YFinanceProvider:
+    """
+    線上資料源：價格與市值來自 yfinance，成分股清單來自 GitHub 公開 CSV。
+    每個資料源需提供 download_prices / fetch_constituents / fetch_market_cap 三個方法，
+    以及 cache_key：回傳內容相同的資料源才可共用同一個值（DataFetcher 以此區分快取）。
+    yfinance 與 requests 載入約需 0.2 秒，延遲到第一次實際連線時才 import，不拖慢 App 啟動。
+    """
+    name = 'yfinance'
+    # 所有實例取得的都是同一份線上資料，可共用快取
+    cache_key = 'yfinance'
+    # 線上資料較慢，DataFetcher 會在前面加上本機價格庫與市值快照
+    persistent_cache = True
+
+    def download_prices(self, tickers: list, start_date: str, end_date: str) -> pd.DataFrame:
+        """
+        下載調整後收盤價，回傳欄 = 代碼的 DataFrame；無資料時回傳 None。
+        找不到 Close 欄位時拋出 ValueError。
+        """
+        import yfinance as yf
+
+        df = yf.download(
+            tickers, start=start_date, end=end_date,
+            auto_adjust=True, threads=True, progress=False
+        )
+        if df is None or df.empty:
+            return None
+
+        # 提取 Close 欄位，相容單標的（Series）和多標的（DataFrame）
+        if isinstance(df.columns, pd.MultiIndex):
+            # 多標的：columns = (指標, 代碼)
+            if 'Close' not in df.columns.get_level_values(0):
+                raise ValueError(f"找不到 Close 欄位，可用：{df.columns.get_level_values(0).unique().tolist()}")
+            part = df['Close']
+        else:
+            # 單標的：columns = ['Close', 'Open', ...]
+            if 'Close' not in df.columns:
+                raise ValueError("找不到 Close 欄位。")
+            part = df[['Close']].rename(columns={'Close': tickers[0]})
+
+        if isinstance(part, pd.Series):
+            part = part.to_frame(name=tickers[0] if len(tickers) == 1 else 'unknown')
+        return part
+
+    def fetch_constituents(self) -> list:
+        """從 GitHub 公開 CSV 取得 S&P 500 成分股代碼（此來源不受雲端環境封鎖）。"""
+        import requests
+
+        try:
+            r = requests.get(SP500_CSV_URL, timeout=15, verify=False)
+            r.raise_for_status()
+        except requests.RequestException as e:
+            raise RuntimeError(f"網路請求失敗（{SP500_CSV_URL}）：{e}") from e
+
+        df = pd.read_csv(StringIO(r.text))
+        if 'Symbol' not in df.columns:
+            raise ValueError(f"CSV 格式異常，找不到 Symbol 欄位。可用欄位：{df.columns.tolist()}")
+        return [t.replace('.', '-') for t in df['Symbol'].tolist()]
+
+    def fetch_market_cap(self, ticker: str) -> float:
+        import yfinance as yf
+
+        return yf.Ticker(ticker).fast_info.market_cap
+
+
+class InMemoryProvider:
+    """以記憶體中的價格表提供資料，適合測試與效能基準（結果完全可重現）。"""
+    name = 'memory'
+    persistent_cache = False
+
+    def __init__(self, prices: pd.DataFrame, constituents: list = None, market_caps: dict = None):
+        # 每個實例的價格表各不相同，不與其他實例共用快取
+        self.cache_key = f"memory-{uuid.uuid4().hex}"
+        self.prices = prices
+        self.constituents = list(constituents) if constituents is not None else list(prices.columns)
+        self.market_caps = dict(market_caps or {})
+
+    def download_prices(self, tickers: list, start_date: str, end_date: str) -> pd.DataFrame:
+        # 與 yf.download 相同：end_date 不含當日
+        index = self.prices.index
+        start_ts, end_ts = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        if index.is_monotonic_increasing:
+            # 已排序時以切片取區間（視圖），不複製整張表
+            window = self.prices.iloc[index.searchsorted(start_ts):index.searchsorted(end_ts)]
+        else:
+            window = self.prices[(index >= start_ts) & (index < end_ts)]
+        available = [t for t in tickers if t in window.columns]
+        if window.empty or not available:
+            return None
+        # 與線上資料源相同，每次回傳新配置的資料（效能基準才量得到真實的複製成本）
+        return window[available].copy()
+
+    def fetch_constituents(self) -> list:
+        return list(self.constituents)
+
+    def fetch_market_cap(self, ticker: str) -> float:
+        if ticker not in self.market_caps:
+            raise KeyError(f"無 {ticker} 的市值資料")
+        return self.market_caps[ticker]
+
+
+class LocalProvider(InMemoryProvider):
+    """
+    離線資料源，讀取以下檔案（格式與 RecordingProvider 寫出的相同）：
+    - prices/<代碼>.parquet 或 prices/<代碼>.csv：日期索引 + Close 欄
+    - constituents.csv：Symbol 欄
+    - market_caps.csv：Symbol、market_cap 欄
+    """
+    name = 'local'
+    persistent_cache = False
+
+    def __init__(self, root: str):
+        self.root = root
+        super().__init__(self._load_prices(), self._load_constituents(), self._load_market_caps())
+        # 同一目錄的離線資料在各行程中相同
+        self.cache_key = f"local:{os.path.abspath(root)}"
+
+    def _load_prices(self) -> pd.DataFrame:
+        series = {}
+        for path in sorted(glob.glob(os.path.join(self.root, 'prices', '*'))):
+            ticker, ext = os.path.splitext(os.path.basename(path))
+            if ext == '.parquet':
+                df = pd.read_parquet(path)
+            elif ext == '.csv':
+                df = pd.read_csv(path, index_col=0, parse_dates=True)
+            else:
+                continue
+            series[ticker] = df['Close']
+        if not series:
+            return pd.DataFrame()
+        return pd.concat(series, axis=1).sort_index()
+
+    def _load_constituents(self):
+        path = os.path.join(self.root, 'constituents.csv')
+        if not os.path.exists(path):
+            return None
+        return pd.read_csv(path)['Symbol'].tolist()
+
+    def _load_market_caps(self) -> dict:
+        path = os.path.join(self.root, 'market_caps.csv')
+        if not os.path.exists(path):
+            return {}
+        df = pd.read_csv(path)
+        return dict(zip(df['Symbol'], df['market_cap']))
+
+
+class RecordingProvider:
+    """
+    包裝另一個資料源，把每次取得的回應寫成 LocalProvider 的檔案格式，
+    之後即可用 LocalProvider(root) 離線重播。同一代碼多次錄製時會合併日期。
+    """
+    persistent_cache = False
+
+    def __init__(self, inner, root: str):
+        self.inner = inner
+        self.root = root
+        self.name = f"recording-{inner.name}"
+        self.cache_key = f"recording-{inner.cache_key}:{os.path.abspath(root)}"
+        self._lock = threading.Lock()
+
+    def download_prices(self, tickers: list, start_date: str, end_date: str) -> pd.DataFrame:
+        part = self.inner.download_prices(tickers, start_date, end_date)
+        if part is not None:
+            os.makedirs(os.path.join(self.root, 'prices'), exist_ok=True)
+            for ticker in part.columns:
+                new = part[ticker].dropna().rename('Close')
+                path = os.path.join(self.root, 'prices', f"{ticker}.parquet")
+                if os.path.exists(path):
+                    old = pd.read_parquet(path)['Close']
+                    new = pd.concat([old[~old.index.isin(new.index)], new]).sort_index()
+                new.to_frame().to_parquet(path)
+        return part
+
+    def fetch_constituents(self) -> list:
+        tickers = self.inner.fetch_constituents()
+        os.makedirs(self.root, exist_ok=True)
+        pd.DataFrame({'Symbol': tickers}).to_csv(os.path.join(self.root, 'constituents.csv'), index=False)
+        return tickers
+
+    def fetch_market_cap(self, ticker: str) -> float:
+        mc = self.inner.fetch_market_cap(ticker)
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, 'market_caps.csv')
+        # 市值查詢為多執行緒，以附加模式逐行寫入，讀取時取最後一筆
+        with self._lock, open(path, 'a', encoding='utf-8') as f:
+            if f.tell() == 0:
+                f.write("Symbol,market_cap\n")
+            f.write(f"{ticker},{mc}\n")
+        return mc
+
+
+def default_provider():
+    """
+    依環境變數選擇資料源：
+    - MOMENTUM_DATA_DIR：使用該目錄的離線資料（LocalProvider）
+    - MOMENTUM_RECORD_DIR：連線取得資料，同時錄製到該目錄
+    - 皆未設定：yfinance
+    """
+    data_dir = os.environ.get('MOMENTUM_DATA_DIR')
+    if data_dir:
+        return LocalProvider(data_dir)
+    record_dir = os.environ.get('MOMENTUM_RECORD_DIR')
+    if record_dir:
+        return RecordingProvider(YFinanceProvider(), record_dir)
+    return YFinanceProvider()
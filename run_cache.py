@@ -0,0 +1,186 @@
+"""
+完整回測結果的持久快取（以內容定址）。
+
+鍵 = 完整回測設定 + 價格資料指紋 的雜湊：設定相同、價格資料逐位元相同時必定得到相同的鍵，
+因此相同的回測可直接從磁碟還原；價格更新（新的交易日、調整後價格變動）會自然得到新鍵，不需要手動失效。
+
+目錄結構（root 預設為專案目錄下的 .cache/runs，可用環境變數 RUN_CACHE_DIR 覆寫）：
+    <root>/<key>.pkl    回測結果（pickle：持倉、逐期 / 逐日結果、指標、最新信號…）
+    <root>/<key>.json   設定、摘要、建立時間與檔案大小；瀏覽清單時只讀這些小檔
+
+兩個檔案都先寫到暫存名稱再 os.replace，讀取端不會看到寫到一半的結果。
+總大小超過 max_bytes（預設 500 MB，環境變數 RUN_CACHE_MAX_MB）時，依最近使用時間淘汰最舊的回測。
+"""
+import hashlib
+import json
+import os
+import pickle
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from price_matrix import PriceMatrix
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    'RUN_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'runs')
+)
+DEFAULT_MAX_BYTES = int(float(os.environ.get('RUN_CACHE_MAX_MB', 500)) * 1e6)
+# 回測結果的格式或計算方式改變時遞增，舊的項目自然不再命中
+FORMAT_VERSION = 1
+
+
+def fingerprint(*parts) -> str:
+    """
+    任意 NumPy 陣列、pandas 索引 / DataFrame / Series 與一般值的內容雜湊。
+    陣列以原始位元組（含 dtype 與形狀）計入，其他值以 repr 計入。
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        if isinstance(part, (pd.DataFrame, pd.Series)):
+            labels = part.columns if isinstance(part, pd.DataFrame) else part.name
+            digest.update(fingerprint(part.index, labels, part.to_numpy()).encode())
+            continue
+        if isinstance(part, pd.Index):
+            part = part.to_numpy() if isinstance(part, pd.DatetimeIndex) else np.asarray(list(part), dtype=str)
+        if isinstance(part, np.ndarray) and part.dtype == object:
+            part = part.astype(str)
+        if isinstance(part, np.ndarray):
+            # 一律以欄優先的順序計入，與記憶體配置無關；欄優先的陣列（PriceMatrix、單一區塊的 DataFrame）不需複製
+            digest.update(f"{part.dtype.str}{part.shape}".encode())
+            digest.update(np.ascontiguousarray(part.T).reshape(-1).view(np.uint8))
+        else:
+            digest.update(repr(part).encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+def price_fingerprint(prices) -> str:
+    """價格資料（DataFrame 或 PriceMatrix）的指紋：日期、代碼與所有價格。"""
+    values = prices.values if isinstance(prices, PriceMatrix) else prices.to_numpy()
+    return fingerprint(prices.index, prices.columns, values)
+
+
+def run_key(config: dict, prices_fingerprint: str) -> str:
+    """由回測設定（可 JSON 序列化的 dict）與價格指紋產生固定長度的鍵；dict 的鍵順序不影響結果。"""
+    payload = json.dumps({'config': config, 'prices': prices_fingerprint, 'version': FORMAT_VERSION},
+                         sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+
+class RunCache:
+    def __init__(self, root: str = None, max_bytes: int = None):
+        self.root = root or DEFAULT_CACHE_DIR
+        self.max_bytes = DEFAULT_MAX_BYTES if max_bytes is None else int(max_bytes)
+
+    def _path(self, key: str, ext: str) -> str:
+        return os.path.join(self.root, f"{key}.{ext}")
+
+    def _write(self, path: str, data: bytes):
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def get(self, key: str):
+        """取出回測結果；不存在或無法讀取（例如寫入途中被淘汰、格式損毀）時回傳 None。"""
+        try:
+            with open(self._path(key, 'pkl'), 'rb') as f:
+                payload = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"回測快取 {key} 無法讀取，將重新計算：{e}")
+            self.delete(key)
+            return None
+        # 以 .json 的修改時間記錄最近使用，淘汰時依此排序
+        try:
+            os.utime(self._path(key, 'json'))
+        except FileNotFoundError:
+            pass
+        return payload
+
+    def meta(self, key: str):
+        try:
+            with open(self._path(key, 'json'), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def put(self, key: str, payload, config: dict = None, summary: dict = None, label: str = '') -> dict:
+        """
+        寫入一次回測結果與說明，回傳說明（meta）。
+        summary 為清單上顯示的摘要（例如 CAGR / MDD），label 為簡短的名稱。
+        寫入後若超過容量上限即淘汰最久未使用的其他項目。
+        """
+        os.makedirs(self.root, exist_ok=True)
+        data = pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+        self._write(self._path(key, 'pkl'), data)
+        meta = {
+            'key': key,
+            'label': label,
+            'created': time.time(),
+            'bytes': len(data),
+            'config': config or {},
+            'summary': summary or {},
+        }
+        self._write(self._path(key, 'json'),
+                    json.dumps(meta, ensure_ascii=False, indent=1, default=str).encode('utf-8'))
+        self.evict(keep=key)
+        return meta
+
+    def list_runs(self) -> list:
+        """所有已儲存回測的說明，依建立時間由新到舊排序。"""
+        if not os.path.isdir(self.root):
+            return []
+        runs = []
+        for name in os.listdir(self.root):
+            if name.endswith('.json'):
+                meta = self.meta(name[:-len('.json')])
+                if meta is not None:
+                    runs.append(meta)
+        return sorted(runs, key=lambda m: m['created'], reverse=True)
+
+    def total_bytes(self) -> int:
+        return sum(m['bytes'] for m in self.list_runs())
+
+    def delete(self, key: str):
+        for ext in ('pkl', 'json'):
+            try:
+                os.remove(self._path(key, ext))
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        for meta in self.list_runs():
+            self.delete(meta['key'])
+
+    def evict(self, keep: str = None) -> list:
+        """總大小超過 max_bytes 時，依最近使用時間由舊到新刪除（keep 除外），回傳刪除的鍵。"""
+        entries = []
+        for meta in self.list_runs():
+            try:
+                used = os.path.getmtime(self._path(meta['key'], 'json'))
+            except FileNotFoundError:
+                continue
+            entries.append((used, meta['key'], meta['bytes']))
+        total = sum(size for _, _, size in entries)
+        removed = []
+        for _, key, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            self.delete(key)
+            total -= size
+            removed.append(key)
+        if removed:
+            print(f"回測快取超過 {self.max_bytes / 1e6:.0f} MB，已淘汰 {len(removed)} 筆最久未使用的結果。")
+        return removed
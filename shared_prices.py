@@ -0,0 +1,194 @@
+"""
+跨 session、跨行程共用的唯讀價格矩陣。
+
+每份價格面板寫成 NumPy .npy 檔（欄優先陣列），讀取端以 np.load(mmap_mode='r') 映射到記憶體：
+同一台機器上的所有 Streamlit session 與工作行程共用作業系統的同一份分頁快取，不需反序列化或複製。
+
+目錄結構（root 預設為 /dev/shm 下的目錄，可用環境變數 SHARED_PRICES_DIR 覆寫）：
+    <root>/<key>/CURRENT             目前版本名稱
+    <root>/<key>/<version>/values.npy, index.npy, meta.json
+
+不可變更的保證：
+- 版本目錄先寫在暫存名稱下，完整寫入後才 rename 成正式名稱，之後永不修改
+- 新資料發布為新版本，再以 os.replace 原子性地改寫 CURRENT；讀取端不會看到寫到一半的檔案
+- 映射的陣列為唯讀（寫入會拋出 ValueError）；舊版本由 prune 刪除、過期的鍵由 evict 整個刪除，
+  已映射的讀取端不受影響
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from price_matrix import PriceMatrix
+
+
+def _default_root() -> str:
+    if os.environ.get('SHARED_PRICES_DIR'):
+        return os.environ['SHARED_PRICES_DIR']
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(base, 'momentum_shared_prices')
+
+
+class SharedPriceMatrix(PriceMatrix):
+    """
+    由 SharedPriceStore.attach 取得的唯讀 PriceMatrix。
+    pickle 時只傳送 (root, key, version)，在另一個行程中重新映射同一個檔案，
+    因此可直接放進 ProcessPoolExecutor 的 initargs，不會複製整個價格矩陣。
+    """
+
+    def __init__(self, values, index, tickers, root: str, key: str, version: str, meta: dict):
+        super().__init__(values, index, tickers)
+        self.root = root
+        self.key = key
+        self.version = version
+        self.meta = meta
+
+    def __reduce__(self):
+        return _attach_version, (self.root, self.key, self.version)
+
+    def write(self, part):
+        raise ValueError("共用價格矩陣為唯讀，請發布新版本")
+
+    def compact(self):
+        raise ValueError("共用價格矩陣為唯讀，請發布新版本")
+
+
+def _attach_version(root: str, key: str, version: str) -> SharedPriceMatrix:
+    return SharedPriceStore(root)._load(key, version)
+
+
+class SharedPriceStore:
+    def __init__(self, root: str = None):
+        self.root = root or _default_root()
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """由任意可轉成字串的參數（資料源、代碼、期間、精度…）產生固定長度的鍵。"""
+        return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:20]
+
+    def _dir(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def current_version(self, key: str):
+        try:
+            with open(os.path.join(self._dir(key), 'CURRENT'), 'r', encoding='utf-8') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def publish(self, key: str, prices, meta: dict = None) -> str:
+        """
+        寫入新版本並原子性地切換 CURRENT，回傳版本名稱。
+        prices 為 PriceMatrix 或 DataFrame（保留原本的 dtype）。
+        """
+        if not isinstance(prices, PriceMatrix):
+            prices = PriceMatrix.from_frame(prices, dtype=np.result_type(*prices.dtypes))
+        matrix = prices
+        # 版本名稱依時間排序（到奈秒），prune 以名稱判斷新舊
+        ns = time.time_ns()
+        version = f"{time.strftime('%Y%m%d%H%M%S', time.localtime(ns // 10**9))}{ns % 10**9:09d}-{uuid.uuid4().hex[:6]}"
+        key_dir = self._dir(key)
+        os.makedirs(key_dir, exist_ok=True)
+
+        tmp_dir = os.path.join(key_dir, f".tmp-{version}")
+        os.makedirs(tmp_dir)
+        try:
+            np.save(os.path.join(tmp_dir, 'values.npy'), np.asfortranarray(matrix.values))
+            np.save(os.path.join(tmp_dir, 'index.npy'), matrix.index.to_numpy())
+            with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+                json.dump({'tickers': list(matrix.columns), 'created': time.time(), **(meta or {})}, f,
+                          ensure_ascii=False, default=str)
+            os.rename(tmp_dir, os.path.join(key_dir, version))
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        pointer = os.path.join(key_dir, f".CURRENT-{version}")
+        with open(pointer, 'w', encoding='utf-8') as f:
+            f.write(version)
+        os.replace(pointer, os.path.join(key_dir, 'CURRENT'))
+        return version
+
+    def _load(self, key: str, version: str) -> SharedPriceMatrix:
+        path = os.path.join(self._dir(key), version)
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        values = np.load(os.path.join(path, 'values.npy'), mmap_mode='r')
+        index = pd.DatetimeIndex(np.load(os.path.join(path, 'index.npy')))
+        return SharedPriceMatrix(values, index, meta.pop('tickers'), self.root, key, version, meta)
+
+    def attach(self, key: str, max_age: float = None):
+        """
+        映射目前版本，回傳 SharedPriceMatrix；不存在或超過 max_age 秒時回傳 None。
+        讀取途中版本被 prune 刪除時重讀一次 CURRENT。
+        """
+        for _ in range(2):
+            version = self.current_version(key)
+            if version is None:
+                return None
+            try:
+                matrix = self._load(key, version)
+            except FileNotFoundError:
+                continue
+            if max_age is not None and time.time() - matrix.meta['created'] > max_age:
+                return None
+            return matrix
+        return None
+
+    def expire(self):
+        """
+        讓所有鍵的目前版本失效（移除 CURRENT）並刪除其版本目錄，下次 attach 回傳 None；
+        已映射的讀取端不受影響。
+        """
+        if not os.path.isdir(self.root):
+            return
+        for key in os.listdir(self.root):
+            try:
+                os.remove(os.path.join(self._dir(key), 'CURRENT'))
+            except (FileNotFoundError, NotADirectoryError):
+                pass
+            self.prune(key, keep=0)
+
+    def evict(self, max_age: float = 86400) -> list:
+        """
+        刪除整個鍵目錄：其中最新的項目（版本、寫入中的暫存目錄、CURRENT）已超過 max_age 秒未更新。
+        鍵包含結束日期，每天都會產生新鍵，不定期清除的話 /dev/shm 會持續成長。
+        預設保留一天，遠長於 attach 的時效，仍持有舊版本的 pickle 控制代碼不會立刻失效。
+        回傳刪除的鍵。
+        """
+        if not os.path.isdir(self.root):
+            return []
+        now = time.time()
+        removed = []
+        for key in os.listdir(self.root):
+            key_dir = self._dir(key)
+            try:
+                entries = [os.path.join(key_dir, name) for name in os.listdir(key_dir)]
+                newest = max([os.stat(path).st_mtime for path in entries] + [os.stat(key_dir).st_mtime])
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            if now - newest > max_age:
+                shutil.rmtree(key_dir, ignore_errors=True)
+                removed.append(key)
+        return removed
+
+    def prune(self, key: str, keep: int = 2) -> list:
+        """
+        刪除較舊的版本，只保留最新 keep 個（含 CURRENT）；keep=0 時刪除 CURRENT 以外的所有版本。
+        回傳刪除的版本名稱。
+        """
+        key_dir = self._dir(key)
+        if not os.path.isdir(key_dir):
+            return []
+        current = self.current_version(key)
+        versions = sorted(v for v in os.listdir(key_dir) if not v.startswith('.') and v != 'CURRENT')
+        removed = [v for v in (versions[:-keep] if keep > 0 else versions) if v != current]
+        for v in removed:
+            shutil.rmtree(os.path.join(key_dir, v), ignore_errors=True)
+        return removed
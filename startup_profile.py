@@ -0,0 +1,120 @@
+"""
+冷啟動分析：在全新的 Python 行程中量測各模組的 import 耗時，以及 App 第一次渲染所需時間。
+
+    python startup_profile.py              # 各套件的 import 耗時（依自身耗時排序）
+    python startup_profile.py --render     # 另外量測 app.py 第一次渲染
+    python startup_profile.py --top 30
+
+每次量測都是新的子行程（等同新容器冷啟動），不受目前行程已載入模組的影響。
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# App 啟動時會載入的本專案模組（app.py 本身是 Streamlit 腳本，不能直接 import）
+APP_MODULES = ('data', 'strategy', 'backtest', 'sweep', 'walk_forward', 'robustness', 'analytics', 'membership')
+# 只有特定操作才需要、不應在啟動時載入的重量級套件
+# （plotly 的套件外殼由 streamlit 本身載入，成本集中在第一次建立 go.Figure，已延遲到回測之後）
+HEAVY_MODULES = ('yfinance', 'requests', 'curl_cffi')
+# 冷啟動預算（秒）：本專案模組（含 pandas / numpy）的 import，與 app.py 第一次渲染
+IMPORT_BUDGET_SECONDS = 2.0
+RENDER_BUDGET_SECONDS = 10.0
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def parse_importtime(stderr: str) -> pd.DataFrame:
+    """解析 python -X importtime 的輸出：module / depth / self_ms / cumulative_ms，依載入順序。"""
+    rows = []
+    for line in stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append({
+                'module': module,
+                'depth': (len(indent) - 1) // 2,
+                'self_ms': int(self_us) / 1000,
+                'cumulative_ms': int(cumulative_us) / 1000,
+            })
+    return pd.DataFrame(rows, columns=['module', 'depth', 'self_ms', 'cumulative_ms'])
+
+
+def _run(code: str, importtime: bool = False, timeout: float = 120) -> subprocess.CompletedProcess:
+    args = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', code]
+    result = subprocess.run(args, capture_output=True, text=True, cwd=HERE, timeout=timeout)
+    if result.returncode != 0:
+        raise RuntimeError(f"子行程執行失敗：{result.stderr.strip().splitlines()[-1:]}")
+    return result
+
+
+def import_profile(modules=APP_MODULES) -> dict:
+    """
+    在新行程中 import modules，回傳 dict：
+    - seconds：import 總耗時（牆鐘時間）
+    - loaded：載入的所有模組名稱
+    - modules：parse_importtime 的逐模組明細
+    - packages：依頂層套件彙總的自身耗時（DataFrame，依耗時排序）
+    """
+    code = (
+        "import json, sys, time\n"
+        "t0 = time.perf_counter()\n"
+        f"import {', '.join(modules)}\n"
+        "print(json.dumps({'seconds': time.perf_counter() - t0, 'loaded': sorted(sys.modules)}))\n"
+    )
+    result = _run(code, importtime=True)
+    summary = json.loads(result.stdout.strip().splitlines()[-1])
+    detail = parse_importtime(result.stderr)
+    packages = (detail.assign(package=detail['module'].str.split('.').str[0])
+                .groupby('package')['self_ms'].agg(['sum', 'count'])
+                .rename(columns={'sum': 'self_ms', 'count': 'modules'})
+                .sort_values('self_ms', ascending=False))
+    return {'seconds': summary['seconds'], 'loaded': summary['loaded'], 'modules': detail, 'packages': packages}
+
+
+def render_profile(script: str = 'app.py', timeout: float = 120) -> dict:
+    """
+    在新行程中以 Streamlit 的 AppTest 執行 script 一次（等同使用者第一次開啟頁面），
+    回傳 seconds（含 import）、exception（渲染錯誤訊息）與 heavy（已被載入的重量級套件）。
+    """
+    code = (
+        "import json, sys, time\n"
+        "t0 = time.perf_counter()\n"
+        "from streamlit.testing.v1 import AppTest\n"
+        f"at = AppTest.from_file({script!r}, default_timeout={timeout}).run()\n"
+        "print(json.dumps({'seconds': time.perf_counter() - t0,\n"
+        "                  'exception': [e.value for e in at.exception],\n"
+        f"                  'heavy': [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))\n"
+    )
+    result = _run(code, timeout=timeout)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="冷啟動 import / 首次渲染耗時分析")
+    parser.add_argument('--top', type=int, default=15, help="列出耗時最高的前幾個套件")
+    parser.add_argument('--render', action='store_true', help="另外量測 app.py 第一次渲染")
+    args = parser.parse_args(argv)
+
+    profile = import_profile()
+    print(f"import {', '.join(APP_MODULES)}：{profile['seconds']:.2f} 秒（預算 {IMPORT_BUDGET_SECONDS} 秒）")
+    heavy = [m for m in HEAVY_MODULES if m in profile['loaded']]
+    print(f"啟動時載入的重量級套件：{heavy or '無'}")
+    print(profile['packages'].head(args.top).to_string(float_format=lambda x: f"{x:.1f}"))
+
+    if args.render:
+        render = render_profile()
+        print(f"\napp.py 第一次渲染：{render['seconds']:.2f} 秒（預算 {RENDER_BUDGET_SECONDS} 秒），"
+              f"重量級套件：{render['heavy'] or '無'}")
+        if render['exception']:
+            print(f"渲染錯誤：{render['exception']}")
+
+
+if __name__ == "__main__":
+    main()
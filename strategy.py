@@ -1,44 +1,410 @@
 import pandas as pd
 import numpy as np
+from collections import OrderedDict
+
+from analytics import rolling_mean_std
+from correlation import RollingCovariance
+from holdings import SparseHoldings
+from price_matrix import as_frame
+from live_signal import LiveSignalEngine
+from tracing import annotate, count, span, traced
+
+# 排名方式：原始複合報酬，或除以年化波動率（風險調整後動能）
+RANKINGS = ('return', 'vol_adjusted')
+# 持倉權重：每個名額 1 / top_n，或依波動率倒數分配
+WEIGHTINGS = ('equal', 'inverse_vol')
+# 波動率視窗（交易日）預設約三個月
+DEFAULT_VOL_WINDOW = 63
+# 分散持倉過濾的相關係數視窗（交易日）預設約半年
+DEFAULT_CORR_WINDOW = 126
+
+
+def _top_n_mask(values: np.ndarray, top_n: int) -> np.ndarray:
+    """
+    逐列選出與 Series.sort_values(ascending=False).head(top_n) 相同的位置集合。
+    NaN 排在最後；同值時依原欄位順序（與 pandas 穩定排序結果一致）。
+    以 argpartition 找出每列第 top_n 名的門檻值，不需整列排序。
+    """
+    n_rows, n_cols = values.shape
+    if top_n >= n_cols:
+        return np.ones((n_rows, n_cols), dtype=bool)
+
+    # 越小越好：NaN 給 +inf 排最後
+    keys = np.where(np.isnan(values), np.inf, -values)
+    kth_pos = np.argpartition(keys, top_n - 1, axis=1)[:, top_n - 1:top_n]
+    kth = np.take_along_axis(keys, kth_pos, axis=1)
+
+    better = keys < kth
+    need = top_n - better.sum(axis=1, keepdims=True)
+    ties = keys == kth
+    return better | (ties & (np.cumsum(ties, axis=1) <= need))
+
+
+def _diversified_selection(risky_mom: np.ndarray, top_n: int, max_correlation: float, engine: RollingCovariance,
+                           ends: np.ndarray) -> np.ndarray:
+    """
+    分散持倉過濾：每列依動能由高到低逐一考慮攻擊型資產，與已入選者任一檔的滾動相關係數高於
+    max_correlation 時略過，直到選滿 top_n 檔或候選用盡，回傳入選位置的布林矩陣。
+    排序與 _top_n_mask 相同（NaN 不是候選；同值依欄位順序），沒有任何略過時入選結果相同。
+    engine 的欄位與 risky_mom 相同；ends[i] 為第 i 列相關係數視窗的結束位置（日報酬的列，不含）。
+    每列只需入選者的相關係數列（engine 在結算日之間增量更新），相關係數為 NaN（視窗未滿或含缺值）時不過濾。
+    """
+    picked_mask = np.zeros(risky_mom.shape, dtype=bool)
+    valid = ~np.isnan(risky_mom)
+    order = np.argsort(np.where(valid, -risky_mom, np.inf), axis=1, kind='stable')
+    for i in range(len(risky_mom)):
+        if not valid[i].any():
+            continue
+        engine.advance(max(engine.end, ends[i]))
+        picked, rows = [], []
+        for c in order[i]:
+            if not valid[i, c]:
+                break
+            if any(row[c] > max_correlation for row in rows):
+                continue
+            picked.append(c)
+            if len(picked) == top_n:
+                break
+            rows.append(engine.correlations(c))
+        picked_mask[i, picked] = True
+    return picked_mask
+
+
+def _signals_from_momentum(momentum: pd.DataFrame, risky_assets: list, safe_assets: list, all_assets: list,
+                           top_n: int, cash_protection: bool, eligible: np.ndarray = None,
+                           volatility: np.ndarray = None) -> np.ndarray:
+    """
+    向量化的雙動能選股核心，一次處理整個動能矩陣（列 = 結算日）。
+    回傳 shape (日期數, len(all_assets)) 的權重陣列（尚未 shift）。
+    eligible 為 shape (日期數, len(risky_assets)) 的布林矩陣（例如歷史成分股），
+    不合格的攻擊型資產當日動能視為 NaN。
+
+    規則與逐日迴圈版本相同：
+    - 動能整列為 NaN 的日期不配置
+    - Top N 攻擊型資產中動能 > 0 者持有本身，否則該份額轉入最佳防禦資產
+    - 開啟現金保護且最佳防禦動能 <= 0 時，該份額保留現金
+    防禦型資產在該日全為 NaN 時視同無可用防禦資產（該份額保留現金）。
+
+    volatility 為 shape (日期數, len(risky_assets)) 的年化波動率時改用波動率倒數權重：
+    Top N 名額依入選者的 1 / 波動率分配（合計仍為 1），未通過絕對動能的名額連同其權重轉入防禦資產或現金；
+    入選者中有波動率缺值的日期退回等權重。
+    """
+    values = momentum.to_numpy(dtype=float)
+    n_rows = len(momentum.index)
+
+    risky_idx = momentum.columns.get_indexer(risky_assets)
+    if (risky_idx < 0).any():
+        missing = [a for a, i in zip(risky_assets, risky_idx) if i < 0]
+        raise KeyError(f"動能資料中找不到攻擊型資產：{missing}")
+
+    out_pos = {asset: i for i, asset in enumerate(all_assets)}
+    risky_out = np.array([out_pos[a] for a in risky_assets], dtype=np.intp)
+    counts = np.zeros((n_rows, len(all_assets)), dtype=np.int64)
+
+    active = ~np.isnan(values).all(axis=1)
+    risky_mom = values[:, risky_idx]
+    if eligible is not None:
+        # 與上市前相同處理：不會被選入；合格標的不足 Top N 時，空出的份額轉入防禦資產
+        risky_mom = np.where(eligible, risky_mom, np.nan)
+    selected = _top_n_mask(risky_mom, top_n) & active[:, None]
+
+    # 絕對動能檢查：通過者持有本身
+    passed = selected & (risky_mom > 0)
+    rows, cols = np.nonzero(passed)
+    np.add.at(counts, (rows, risky_out[cols]), 1)
+
+    # 未通過者：轉入最佳防禦資產或保留現金
+    n_failed = (selected & ~(risky_mom > 0)).sum(axis=1)
+    valid_safe = [sa for sa in safe_assets if sa in momentum.columns]
+    if valid_safe:
+        safe_mom = values[:, momentum.columns.get_indexer(valid_safe)]
+        has_safe = ~np.isnan(safe_mom).all(axis=1)
+        best = np.argmax(np.where(np.isnan(safe_mom), -np.inf, safe_mom), axis=1)
+        best_val = safe_mom[np.arange(n_rows), best]
+
+        to_safe = has_safe & (n_failed > 0)
+        if cash_protection:
+            to_safe &= ~(best_val <= 0)
+        safe_out = np.array([out_pos[a] for a in valid_safe], dtype=np.intp)
+        rows = np.nonzero(to_safe)[0]
+        np.add.at(counts, (rows, safe_out[best[rows]]), n_failed[rows])
+
+    if volatility is not None:
+        return _inverse_vol_weights(selected, passed, values, momentum.columns, safe_assets, all_assets,
+                                    risky_out, volatility, cash_protection)
+
+    # 以逐次累加 weight_per_asset 的結果查表，確保與迴圈版本逐位元一致
+    weight_per_asset = 1.0 / top_n
+    table = np.zeros(int(counts.max(initial=0)) + 1)
+    for k in range(1, len(table)):
+        table[k] = table[k - 1] + weight_per_asset
+    return table[counts]
+
+
+def _inverse_vol_weights(selected: np.ndarray, passed: np.ndarray, values: np.ndarray, columns: pd.Index,
+                         safe_assets: list, all_assets: list, risky_out: np.ndarray, volatility: np.ndarray,
+                         cash_protection: bool) -> np.ndarray:
+    """_signals_from_momentum 的波動率倒數權重版本（選股與防禦資產規則相同，只有名額權重不同）。"""
+    n_rows = len(selected)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inverse = np.where(selected, 1.0 / volatility, 0.0)
+    inverse[~np.isfinite(inverse)] = np.nan
+    # 入選者有缺值（或波動率為 0）的日期退回等權重
+    fallback = np.isnan(inverse).any(axis=1)
+    inverse[fallback] = selected[fallback]
+    total = inverse.sum(axis=1, keepdims=True)
+    slot = np.divide(inverse, total, out=np.zeros_like(inverse), where=total > 0)
+
+    out = np.zeros((n_rows, len(all_assets)))
+    out[:, risky_out] = np.where(passed, slot, 0.0)
+    failed = np.where(selected & ~passed, slot, 0.0).sum(axis=1)
+
+    out_pos = {asset: i for i, asset in enumerate(all_assets)}
+    valid_safe = [sa for sa in safe_assets if sa in columns]
+    if valid_safe:
+        safe_mom = values[:, columns.get_indexer(valid_safe)]
+        has_safe = ~np.isnan(safe_mom).all(axis=1)
+        best = np.argmax(np.where(np.isnan(safe_mom), -np.inf, safe_mom), axis=1)
+        best_val = safe_mom[np.arange(n_rows), best]
+        to_safe = has_safe & (failed > 0)
+        if cash_protection:
+            to_safe &= ~(best_val <= 0)
+        safe_out = np.array([out_pos[a] for a in valid_safe], dtype=np.intp)
+        rows = np.nonzero(to_safe)[0]
+        np.add.at(out, (rows, safe_out[best[rows]]), failed[rows])
+    return out
+
+
+def _signal_dict(all_assets: list, weights_row: np.ndarray, top_n: int, equal_weight: bool = True) -> dict:
+    """
+    單期權重列轉為 {代碼: 權重}，get_latest_signal 的兩條路徑共用。
+    合計不足 1 的部分（現金保護，或沒有可用的防禦資產）一律記為 "CASH"。
+    等權重時剩餘的是整數個名額，以逐份累加 1 / top_n 表示，與持倉權重的算法逐位元一致。
+    """
+    signal = {asset: float(w) for asset, w in zip(all_assets, weights_row) if w > 0}
+    leftover = 1 - sum(signal.values())
+    if leftover > 1e-9:
+        if equal_weight:
+            slots, leftover = int(round(leftover * top_n)), 0.0
+            for _ in range(slots):
+                leftover += 1.0 / top_n
+        signal["CASH"] = leftover
+    return signal
+
+
+def composite_momentum_from_returns(returns: dict, lookbacks: list, weights: list, template: pd.DataFrame) -> pd.DataFrame:
+    """
+    由預先算好的各回顧期回報率合成複合動能，template 提供索引與欄位。
+    參數掃描時各組合共用同一份 returns，只需重做這一步加權。
+    """
+    composite_momentum = pd.DataFrame(0.0, index=template.index, columns=template.columns)
+    total_weight = sum(weights)
+
+    if total_weight == 0:
+        return composite_momentum
+
+    for lb, w in zip(lookbacks, weights):
+        # 將加權動能加入複合動能
+        # 處理潛在的 NaN？ pct_change 會在開頭產生 NaN。
+        # 如果任何成分是 NaN，複合動能可能是 NaN 或部分值。
+        # 標準做法：結果為 NaN 直到達到 max(lookbacks)。
+        composite_momentum += returns[lb] * w
+
+    # 除以總權重進行歸一化 (可選，但保持規模可解釋為「平均回報」)
+    composite_momentum /= total_weight
+    return composite_momentum
+
+
+def build_signals(momentum: pd.DataFrame, risky_assets: list, safe_assets, top_n: int = 1, cash_protection: bool = False,
+                  eligible: np.ndarray = None, volatility: np.ndarray = None, sparse: bool = False):
+    """
+    由動能矩陣產生（已 shift 一期的）持倉信號，供 generate_signals 與參數掃描共用。
+    eligible：各結算日攻擊型資產是否可選（見 _signals_from_momentum），None 表示全部可選。
+    volatility：攻擊型資產的年化波動率矩陣，傳入時改用波動率倒數權重。
+    sparse=True 時回傳 SparseHoldings（只存非零權重），內容與密集版本相同。
+    """
+    # 確保 safe_assets 是列表
+    if isinstance(safe_assets, str):
+        safe_assets = [safe_assets]
+
+    # 必須使用 sorted 確保欄位順序固定，避免每次執行結果不同。
+    all_assets = sorted(set(risky_assets + safe_assets))
+    weights_matrix = _signals_from_momentum(momentum, risky_assets, safe_assets, all_assets, top_n, cash_protection,
+                                            eligible, volatility)
+    if sparse:
+        return SparseHoldings.from_array(weights_matrix, momentum.index, all_assets).shift(1)
+    signals = pd.DataFrame(weights_matrix, index=momentum.index, columns=all_assets)
+    return signals.shift(1).fillna(0)
+
+
+class StreamingPeriodReturns:
+    """
+    邊下載邊計算：每批標的一到（DataFetcher.load_prices 的 on_ready）就先算好重新取樣的收盤價與各回顧期回報，
+    下載完成後以 prime() 放入 MomentumStrategy 的快取，產生信號時不必再對整張價格表重算。
+    重新取樣與 pct_change 都是逐欄獨立的運算，分批算完再對齊到完整的結算日，結果與整表計算逐位元相同。
+    """
+
+    def __init__(self, frequency: str = 'ME', lookbacks: list = [12], skip: int = 0):
+        self.frequency = frequency
+        self.lookbacks = list(dict.fromkeys(lookbacks))
+        self.skip = skip
+        self._resampled = []
+        self._returns = {lb: [] for lb in self.lookbacks}
+        self.columns = set()
+
+    def add(self, frame: pd.DataFrame):
+        """加入一批已確定的收盤價（欄為代碼）；同一檔標的只能加入一次。"""
+        if frame.columns.empty:
+            return
+        resampled = frame.resample(self.frequency).last()
+        self._resampled.append(resampled)
+        for lb in self.lookbacks:
+            if self.skip:
+                self._returns[lb].append(resampled.pct_change(lb - self.skip).shift(self.skip))
+            else:
+                self._returns[lb].append(resampled.pct_change(lb))
+        self.columns.update(frame.columns)
+
+    def prime(self, strategy: 'MomentumStrategy') -> bool:
+        """
+        依 strategy 價格表的結算日與欄位組合各批結果並放入快取，回傳是否成功。
+        有欄位不在已加入的批次中（例如價格來自共用矩陣、沒有經過下載）時不放入，交由策略照常計算。
+        """
+        columns = strategy.prices.columns
+        if not self._resampled or not self.columns.issuperset(columns):
+            return False
+        # 只取日期索引的結算日（各批的首末期可能較短，前後補 NaN 與整表計算相同）
+        labels = pd.Series(0, index=strategy.prices.index, dtype=np.int8).resample(self.frequency).last().index
+
+        def assemble(parts):
+            return pd.concat(parts, axis=1).reindex(index=labels, columns=columns)
+
+        strategy.prime(('resample', self.frequency), assemble(self._resampled))
+        for lb, parts in self._returns.items():
+            key = ('returns', self.frequency, lb, self.skip) if self.skip else ('returns', self.frequency, lb)
+            strategy.prime(key, assemble(parts))
+        return True
+
 
 class MomentumStrategy:
-    def __init__(self, prices: pd.DataFrame, lookback_period: int = 12):
-        self.prices = prices
+    def __init__(self, prices: pd.DataFrame, lookback_period: int = 12, cache_size: int = 32):
+        # 也接受 PriceMatrix（取零複製的 DataFrame 視圖）
+        self.prices = as_frame(prices)
         self.lookback_period = lookback_period
+        # 重新取樣結果與各回顧期回報率的 LRU 快取（同一物件內重複呼叫時共用）
+        self.cache_size = cache_size
+        self.cache_stats = {'hits': 0, 'misses': 0}
+        self._cache = OrderedDict()
+        self._cache_owner = id(self.prices)
+
+    def _cached(self, key: tuple, compute):
+        """
+        取出快取項目，不存在則計算後放入；超過 cache_size 時淘汰最久未使用的項目。
+        若 self.prices 被替換成另一個物件，整個快取失效。
+        """
+        if self._cache_owner != id(self.prices):
+            self.clear_cache()
+            self._cache_owner = id(self.prices)
+
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.cache_stats['hits'] += 1
+            count('strategy.cache.hit')
+            return self._cache[key]
+
+        self.cache_stats['misses'] += 1
+        count('strategy.cache.miss')
+        with span(f"strategy.{key[0]}", key=repr(key[1:])):
+            value = compute()
+        self.prime(key, value)
+        return value
+
+    def prime(self, key: tuple, value):
+        """放入預先算好的快取項目（例如 StreamingPeriodReturns 邊下載邊算出的結果），呼叫端之後不可就地修改。"""
+        if self._cache_owner != id(self.prices):
+            self.clear_cache()
+            self._cache_owner = id(self.prices)
+        self._cache[key] = value
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def clear_cache(self):
+        self._cache.clear()
 
-    def calculate_momentum(self, resample_freq='ME', lookbacks: list = [12], weights: list = [1.0]) -> tuple[pd.DataFrame, pd.DataFrame]:
+    @traced('strategy.calculate_momentum')
+    def calculate_momentum(self, resample_freq='ME', lookbacks: list = [12], weights: list = [1.0], skip: int = 0,
+                           ranking: str = 'return', vol_window: int = DEFAULT_VOL_WINDOW) -> tuple[pd.DataFrame, pd.DataFrame]:
         """
         根據回顧期和權重計算動能。
         複合動能 = Sum(w_i * Return_{t-lb_i}) / Sum(w_i)
+
+        skip：略過最近幾期，例如月線 lookbacks=[12]、skip=1 即經典的 12-1 動能（避開短期反轉）。
+        ranking='vol_adjusted'：複合動能再除以結算日當時 vol_window 個交易日的年化波動率，
+        正負號不變，因此絕對動能（> 0）的判斷不受影響。
         """
+        if ranking not in RANKINGS:
+            raise ValueError(f"不支援的排名方式：{ranking}（可用：{', '.join(RANKINGS)}）")
         # 重新取樣數據
         # 'ME' = 月底, 'W-FRI' = 週五
-        resampled_prices = self.prices.resample(resample_freq).last()
-        
-        # 計算複合動能
-        composite_momentum = pd.DataFrame(0.0, index=resampled_prices.index, columns=resampled_prices.columns)
-        total_weight = sum(weights)
-        
-        if total_weight == 0:
-            return composite_momentum, resampled_prices
-
-        for lb, w in zip(lookbacks, weights):
-            # 計算該回顧期的回報率
-            # 動能 = (Price_t / Price_{t-lookback}) - 1
-            mom = resampled_prices.pct_change(lb)
-            
-            # 將加權動能加入複合動能
-            # 處理潛在的 NaN？ pct_change 會在開頭產生 NaN。
-            # 如果任何成分是 NaN，複合動能可能是 NaN 或部分值。
-            # 標準做法：結果為 NaN 直到達到 max(lookbacks)。
-            composite_momentum += mom * w
-            
-        # 除以總權重進行歸一化 (可選，但保持規模可解釋為「平均回報」)
-        composite_momentum /= total_weight
-        
+        resampled_prices = self.resample(resample_freq)
+        returns = self.lookback_returns(resample_freq, lookbacks, skip)
+        composite_momentum = composite_momentum_from_returns(returns, lookbacks, weights, resampled_prices)
+        if ranking == 'vol_adjusted':
+            composite_momentum = composite_momentum / self.volatility(resample_freq, vol_window)
+        annotate(rows=len(composite_momentum), cols=len(composite_momentum.columns))
         return composite_momentum, resampled_prices
 
-    def generate_signals(self, risky_assets: list, safe_assets: list, top_n: int = 1, frequency: str = 'ME', lookbacks: list = [12], weights: list = [1.0], cash_protection: bool = False) -> pd.DataFrame:
+    def resample(self, frequency: str = 'ME') -> pd.DataFrame:
+        """取每個結算期最後一筆收盤價（已快取，呼叫端不可就地修改）。"""
+        return self._cached(('resample', frequency), lambda: self.prices.resample(frequency).last())
+
+    def lookback_returns(self, frequency: str = 'ME', lookbacks: list = [12], skip: int = 0) -> dict:
+        """
+        計算各回顧期的回報率 {lookback: DataFrame}，每個 (頻率, 回顧期, skip) 各自快取，
+        因此換權重或部分重疊的回顧期組合都能沿用先前結果。
+        動能 = (Price_{t-skip} / Price_{t-lookback}) - 1
+        """
+        if skip == 0:
+            return {
+                lb: self._cached(('returns', frequency, lb), lambda lb=lb: self.resample(frequency).pct_change(lb))
+                for lb in dict.fromkeys(lookbacks)
+            }
+        if skip < 0 or skip >= min(lookbacks):
+            raise ValueError(f"略過期數 skip={skip} 必須介於 0 與最短回顧期（{min(lookbacks)}）之間")
+        return {
+            lb: self._cached(('returns', frequency, lb, skip),
+                             lambda lb=lb: self.resample(frequency).pct_change(lb - skip).shift(skip))
+            for lb in dict.fromkeys(lookbacks)
+        }
+
+    def volatility(self, frequency: str = 'ME', window: int = DEFAULT_VOL_WINDOW) -> pd.DataFrame:
+        """
+        各結算日的年化波動率（結算日當天或之前最後一個交易日為止、window 個交易日的日報酬標準差 × √252），
+        索引與 resample(frequency) 相同。視窗內有缺值（上市未滿 window 日、停牌）時為 NaN。
+
+        整個 日 × 標的 矩陣以累積和一次算出滾動標準差（analytics.rolling_mean_std），不逐檔 rolling().std()，
+        且只取結算日所在的列相減。
+        """
+        def at_period_ends():
+            labels = self.resample(frequency).index
+            daily = self.prices.to_numpy(dtype=float)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                returns = daily[1:] / daily[:-1] - 1
+            # 結算日在日報酬矩陣中的列（日報酬比價格少第一列）；只取這些列的視窗，不展開整個滾動矩陣
+            rows = self.prices.index.searchsorted(labels, side='right') - 2
+            std = np.full((len(labels), daily.shape[1]), np.nan)
+            valid = rows >= 0
+            std[valid] = rolling_mean_std(returns, window, rows[valid])[1] * np.sqrt(252)
+            return pd.DataFrame(std, index=labels, columns=self.prices.columns)
+
+        return self._cached(('volatility', frequency, window), at_period_ends)
+
+    @traced('strategy.generate_signals')
+    def generate_signals(self, risky_assets: list, safe_assets: list, top_n: int = 1, frequency: str = 'ME', lookbacks: list = [12], weights: list = [1.0], cash_protection: bool = False, membership=None,
+                         skip: int = 0, ranking: str = 'return', weighting: str = 'equal',
+                         vol_window: int = DEFAULT_VOL_WINDOW, max_correlation: float = None,
+                         corr_window: int = DEFAULT_CORR_WINDOW, sparse: bool = False):
         """
         生成支援 Top N、複合動能和現金保護的雙動能信號。
         
@@ -51,123 +417,99 @@ class MomentumStrategy:
              - 從 safe_assets 中找出動能最高的一個。
              - 如果開啟現金保護且最佳防禦動能 <= 0 -> 持有現金 (不配置)。
              - 否則 -> 持有最佳防禦型資產。
+
+        整個動能矩陣一次向量化計算（見 _signals_from_momentum），結果與逐日迴圈逐位元一致。
+        傳入 membership（MembershipHistory）時，每個結算日只從當時的成分股中選股，避免倖存者偏差。
+        skip / ranking 見 calculate_momentum；weighting='inverse_vol' 時 Top N 名額依波動率倒數分配。
+        max_correlation：分散持倉過濾，候選標的與已入選者在結算日前 corr_window 個交易日的日報酬相關係數
+        高於此值時略過、改考慮下一名（見 _diversified_selection）；候選不足 Top N 時空出的份額轉入防禦資產。
+        sparse=True 時回傳 SparseHoldings（每期只存實際持倉），可直接交給 Backtest；需要時以 to_dense() 展開。
         """
-        momentum, resampled_prices = self.calculate_momentum(resample_freq=frequency, lookbacks=lookbacks, weights=weights)
-        
-        # 確保 safe_assets 是列表
-        if isinstance(safe_assets, str):
-            safe_assets = [safe_assets]
+        if weighting not in WEIGHTINGS:
+            raise ValueError(f"不支援的權重方式：{weighting}（可用：{', '.join(WEIGHTINGS)}）")
+        momentum, resampled_prices = self.calculate_momentum(resample_freq=frequency, lookbacks=lookbacks, weights=weights,
+                                                             skip=skip, ranking=ranking, vol_window=vol_window)
+        eligible = membership.mask(momentum.index, risky_assets) if membership is not None else None
+        if max_correlation is not None:
+            eligible = self._diversified(momentum, risky_assets, eligible, top_n, max_correlation, corr_window)
+        volatility = self._risky_volatility(frequency, vol_window, risky_assets) if weighting == 'inverse_vol' else None
+        with span('strategy.build_signals', rows=len(momentum), cols=len(risky_assets) + len(safe_assets)):
+            return build_signals(momentum, risky_assets, safe_assets, top_n, cash_protection, eligible, volatility,
+                                 sparse)
 
-        # 初始化信號 DataFrame，全為零。
-        # 必須使用 sorted 確保欄位順序固定，避免每次執行結果不同。
-        all_assets = sorted(set(risky_assets + safe_assets))
-        signals = pd.DataFrame(0.0, index=momentum.index, columns=all_assets)
-        
-        weight_per_asset = 1.0 / top_n
-        
-        for date in momentum.index:
-            # 跳過動能為 NaN 的初始日期
-            # Skip only if all data for this date is NaN
-            if momentum.loc[date].isnull().all():
-                continue
+    def _diversified(self, momentum: pd.DataFrame, risky_assets: list, eligible: np.ndarray, top_n: int,
+                     max_correlation: float, window: int) -> np.ndarray:
+        """
+        分散持倉過濾後的可選矩陣（shape (日期數, 攻擊型資產數)），已包含傳入的 eligible（例如歷史成分股）。
+        相關係數視窗與 volatility 相同，截至結算日當天或之前最後一個交易日。
+        """
+        if not -1 <= max_correlation <= 1:
+            raise ValueError(f"相關係數門檻必須介於 -1 與 1 之間（收到 {max_correlation}）")
+        risky_mom = momentum.to_numpy(dtype=float)[:, momentum.columns.get_indexer(risky_assets)]
+        if eligible is not None:
+            risky_mom = np.where(eligible, risky_mom, np.nan)
+        with span('strategy.diversify', rows=len(momentum), cols=len(risky_assets)):
+            # 只取攻擊型資產的日報酬，不複製整張價格表
+            daily = self.prices[risky_assets].to_numpy(dtype=float)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                returns = daily[1:] / daily[:-1] - 1
+            ends = np.maximum(self.prices.index.searchsorted(momentum.index, side='right') - 1, 0)
+            return _diversified_selection(risky_mom, top_n, max_correlation, RollingCovariance(returns, window), ends)
 
-            # 獲取該日期攻擊型資產的動能
-            risky_momentum = momentum.loc[date, risky_assets]
-            
-            # 找出最好的 Top N 攻擊型資產
-            best_risky_assets = risky_momentum.sort_values(ascending=False).head(top_n)
-            
-            # 獲取當前防禦型資產的動能
-            # 過濾掉不在 momentum columns 中的 (例如如果沒下載到)
-            valid_safe_assets = [sa for sa in safe_assets if sa in momentum.columns]
-            if valid_safe_assets:
-                safe_mom_series = momentum.loc[date, valid_safe_assets]
-                best_safe_asset = safe_mom_series.idxmax()
-                best_safe_mom_val = safe_mom_series.max()
-            else:
-                best_safe_asset = None
-                best_safe_mom_val = -999 # 假設無數據很差
-            
-            for asset, mom_val in best_risky_assets.items():
-                # 絕對動能檢查
-                if mom_val > 0:
-                    signals.loc[date, asset] += weight_per_asset
-                else:
-                    # 攻擊型資產表現不好。檢查防禦型體系。
-                    # 如果有現金保護，且最佳防禦資產動能 <= 0
-                    if cash_protection and best_safe_mom_val <= 0:
-                        # 全現金
-                        pass
-                    elif best_safe_asset:
-                        # 持有最佳防禦資產
-                        signals.loc[date, best_safe_asset] += weight_per_asset
-            
-        return signals.shift(1).fillna(0)
-
-    def get_latest_signal(self, risky_assets: list, safe_assets: list, top_n: int = 1, frequency: str = 'ME', lookbacks: list = [12], weights: list = [1.0], cash_protection: bool = False) -> dict:
+    def _risky_volatility(self, frequency: str, window: int, risky_assets: list) -> np.ndarray:
+        volatility = self.volatility(frequency, window)
+        return volatility.to_numpy()[:, volatility.columns.get_indexer(risky_assets)]
+
+    def live_engine(self, frequency: str = 'ME', lookbacks: list = [12], weights: list = [1.0]) -> LiveSignalEngine:
+        """以（已快取的）結算期收盤價建立增量信號引擎，之後每根新 K 線呼叫 engine.update 即可。"""
+        return LiveSignalEngine.from_period_closes(self.resample(frequency), frequency, lookbacks, weights)
+
+    @traced('strategy.get_latest_signal')
+    def get_latest_signal(self, risky_assets: list, safe_assets: list, top_n: int = 1, frequency: str = 'ME', lookbacks: list = [12], weights: list = [1.0], cash_protection: bool = False, membership=None,
+                          skip: int = 0, ranking: str = 'return', weighting: str = 'equal',
+                          vol_window: int = DEFAULT_VOL_WINDOW, max_correlation: float = None,
+                          corr_window: int = DEFAULT_CORR_WINDOW, today=None) -> dict:
         """
         根據最新「完整」結算期的動能，計算當前應持有的標的。
         
         注意：若最後一期為當月（尚未結束），則使用上一個完整月份的動能，
         確保與歷史持倉表的最後一筆（最新結算期）一致。
+
+        只讀取最後 max(lookbacks) + 2 期計算動能（見 LiveSignalEngine），不重算整段歷史。
+        使用 skip / 波動率排名 / 波動率倒數權重 / 分散持倉過濾時，改由（已快取的）完整動能矩陣取出該期，
+        選股與權重與 generate_signals 相同。
         """
-        momentum, _ = self.calculate_momentum(resample_freq=frequency, lookbacks=lookbacks, weights=weights)
-        
-        if momentum.empty:
-            return {"Error": "動能數據為空"}
-            
+        if skip == 0 and ranking == 'return' and weighting == 'equal' and max_correlation is None:
+            engine = self.live_engine(frequency, lookbacks, weights)
+            return engine.latest_signal(risky_assets, safe_assets, top_n=top_n, cash_protection=cash_protection,
+                                        today=today, membership=membership)
+
         if isinstance(safe_assets, str):
             safe_assets = [safe_assets]
-
-        # ─── 關鍵修正：判斷最後一期是否為當前未完成的結算期 ───
-        last_date = momentum.index[-1]
-        today = pd.Timestamp.today()
-        
-        # 若最後一期的年月與今天相同，代表這是「不完整的當月」
-        # 應退回使用前一個完整結算期的動能
-        if last_date.year == today.year and last_date.month == today.month:
+        momentum, _ = self.calculate_momentum(frequency, lookbacks, weights, skip=skip, ranking=ranking,
+                                              vol_window=vol_window)
+        if momentum.empty:
+            return {"Error": "動能數據為空"}
+        today = pd.Timestamp.today() if today is None else pd.Timestamp(today)
+        row = len(momentum) - 1
+        last = momentum.index[-1]
+        if last.year == today.year and last.month == today.month:
             if len(momentum) < 2:
                 return {"Error": "數據不足以計算信號（需至少兩個完整結算期）"}
-            use_mom = momentum.iloc[-2]  # 使用上一個完整月的動能
-        else:
-            use_mom = momentum.iloc[-1]  # 最後一期即為完整的結算期
-        
-        # 檢查動能是否全為 NaN
-        if use_mom.isnull().all():
+            row -= 1
+        use_mom = momentum.iloc[[row]]
+        if use_mom.isnull().all(axis=None):
             return {"Error": "動能數據不足（可能回顧期過長）"}
-
-        # ─── 計算信號邏輯（與 generate_signals 一致）───
-        # 取可用的攻擊型資產動能
-        valid_risky = [r for r in risky_assets if r in use_mom.index and pd.notna(use_mom[r])]
-        if not valid_risky:
+        # 與 signal_from_momentum_row 一致：攻擊型資產動能全為 NaN 時回報錯誤，而非持有防禦型資產或現金
+        if use_mom[[r for r in risky_assets if r in use_mom.columns]].isnull().all(axis=None):
             return {"Error": "攻擊型資產動能均為 NaN"}
-            
-        risky_momentum = use_mom[valid_risky]
-        best_risky = risky_momentum.sort_values(ascending=False).head(top_n)
-
-        # 取可用的防禦型資產動能
-        valid_safe = [s for s in safe_assets if s in use_mom.index]
-        if valid_safe:
-            safe_mom = use_mom[valid_safe]
-            best_safe_asset = safe_mom.idxmax()
-            best_safe_mom_val = safe_mom.max()
-        else:
-            best_safe_asset = None
-            best_safe_mom_val = -999
-
-        signal = {}
-        weight_per_asset = 1.0 / top_n
-        
-        for asset, mom_val in best_risky.items():
-            if pd.isna(mom_val):
-                continue
-            if mom_val > 0:
-                signal[asset] = signal.get(asset, 0) + weight_per_asset
-            else:
-                if cash_protection and best_safe_mom_val <= 0:
-                    signal["CASH"] = signal.get("CASH", 0) + weight_per_asset
-                elif best_safe_asset:
-                    signal[best_safe_asset] = signal.get(best_safe_asset, 0) + weight_per_asset
-                    
-        return signal
 
+        eligible = membership.mask(use_mom.index, risky_assets) if membership is not None else None
+        if max_correlation is not None:
+            eligible = self._diversified(use_mom, risky_assets, eligible, top_n, max_correlation, corr_window)
+        volatility = (self._risky_volatility(frequency, vol_window, risky_assets)[[row]]
+                      if weighting == 'inverse_vol' else None)
+        all_assets = sorted(set(risky_assets + safe_assets))
+        weights_row = _signals_from_momentum(use_mom, risky_assets, safe_assets, all_assets, top_n, cash_protection,
+                                             eligible, volatility)[0]
+        return _signal_dict(all_assets, weights_row, top_n, equal_weight=volatility is None)
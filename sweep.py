@@ -0,0 +1,234 @@
+import os
+import itertools
+import concurrent.futures
+
+import numpy as np
+import pandas as pd
+
+from strategy import MomentumStrategy, composite_momentum_from_returns, build_signals
+from backtest import Backtest
+
+# 工作行程共用的狀態（由 _init_worker 設定一次，避免每個組合重複傳送價格矩陣）
+_CONTEXT = None
+
+
+def build_grid(lookback_sets: list, weight_sets: list, top_ns: list, frequencies: list, cash_options: list) -> list:
+    """
+    產生參數組合清單（每個組合為 dict）。
+    回顧期與權重僅在數量相同時配對，例如 [3, 6, 9] 只會搭配三個權重的組合。
+    """
+    grid = []
+    for lookbacks, weights in itertools.product(lookback_sets, weight_sets):
+        if len(lookbacks) != len(weights):
+            continue
+        for top_n, frequency, cash_protection in itertools.product(top_ns, frequencies, cash_options):
+            grid.append({
+                'lookbacks': list(lookbacks),
+                'weights': list(weights),
+                'top_n': int(top_n),
+                'frequency': frequency,
+                'cash_protection': bool(cash_protection),
+            })
+    return grid
+
+
+def _prepare_context(prices: pd.DataFrame, risky_assets: list, safe_assets: list, grid: list,
+                     start_date=None, end_date=None, initial_capital: float = 10000.0, membership=None) -> dict:
+    """
+    每個頻率只重新取樣一次，每個 (頻率, 回顧期) 只計算一次回報率，所有組合共用。
+    傳入 membership 時，每個頻率的成分股遮罩也只查詢一次。
+    """
+    strategy = MomentumStrategy(prices)
+    lookbacks_by_freq = {}
+    for config in grid:
+        lookbacks_by_freq.setdefault(config['frequency'], set()).update(config['lookbacks'])
+
+    returns = {}
+    resampled = {}
+    eligible = {}
+    for frequency, lookbacks in lookbacks_by_freq.items():
+        resampled[frequency] = strategy.resample(frequency)
+        returns[frequency] = strategy.lookback_returns(frequency, sorted(lookbacks))
+        if membership is not None:
+            eligible[frequency] = membership.mask(resampled[frequency].index, list(risky_assets))
+
+    return {
+        'prices': prices,
+        'risky_assets': list(risky_assets),
+        'safe_assets': list(safe_assets),
+        'resampled': resampled,
+        'returns': returns,
+        'eligible': eligible,
+        'start_date': pd.Timestamp(start_date) if start_date is not None else None,
+        'end_date': pd.Timestamp(end_date) if end_date is not None else None,
+        'initial_capital': initial_capital,
+    }
+
+
+def _init_worker(context: dict):
+    global _CONTEXT
+    _CONTEXT = context
+
+
+def config_signals(config: dict, context: dict = None) -> tuple:
+    """
+    單一參數組合切片至回測期間的信號，流程與 app.py 的「開始回測」相同。
+    回傳 (signals_sliced, valid_start)。
+    """
+    ctx = context if context is not None else _CONTEXT
+    frequency = config['frequency']
+    momentum = composite_momentum_from_returns(
+        ctx['returns'][frequency], config['lookbacks'], config['weights'], ctx['resampled'][frequency]
+    )
+    signals = build_signals(
+        momentum, ctx['risky_assets'], ctx['safe_assets'],
+        top_n=config['top_n'], cash_protection=config['cash_protection'],
+        eligible=ctx['eligible'].get(frequency)
+    )
+    if signals.empty:
+        raise ValueError("信號為空")
+
+    analysis_start = ctx['start_date'] if ctx['start_date'] is not None else signals.index[0]
+    valid_start = max(analysis_start, signals.index[0])
+    signals_sliced = signals.loc[valid_start:ctx['end_date']]
+    if signals_sliced.empty:
+        raise ValueError("有效信號期間不足")
+    return signals_sliced, valid_start
+
+
+def config_results(config: dict, context: dict = None) -> tuple:
+    """單一參數組合的完整回測：信號（見 config_signals）→ Backtest。回傳 (backtest, results)。"""
+    ctx = context if context is not None else _CONTEXT
+    signals_sliced, valid_start = config_signals(config, ctx)
+    backtest = Backtest(ctx['prices'], signals_sliced, ctx['initial_capital'])
+    results = backtest.run_backtest().loc[valid_start:ctx['end_date']]
+    if len(results) < 2:
+        raise ValueError("回測期間不足")
+    return backtest, results
+
+
+def batch_results(configs: list, context: dict = None, with_signals: bool = False) -> list:
+    """
+    以 Backtest.run_many 一次回測多個組合：同頻率、同回測起點的組合共用同一個網格，
+    價格對齊只做一次。每批的信號陣列不超過 Backtest.BATCH_CELLS 個元素。
+    回傳與 configs 對齊的清單，每項為 results（同 config_results）或失敗時的例外；
+    with_signals=True 時成功項目改為 (results, signals_sliced)。
+    """
+    ctx = context if context is not None else _CONTEXT
+    out = [None] * len(configs)
+    pending = {}
+
+    def flush(key):
+        members = pending.pop(key)
+        batch = Backtest.run_many(ctx['prices'], [signals for _, signals in members], ctx['initial_capital'])
+        for k, (i, signals) in enumerate(members):
+            results = pd.DataFrame({
+                'Portfolio Returns': batch['Portfolio Returns'][k],
+                'Portfolio Value': batch['Portfolio Value'][k],
+            }).loc[key[1]:ctx['end_date']]
+            if len(results) < 2:
+                out[i] = ValueError("回測期間不足")
+            else:
+                out[i] = (results, signals) if with_signals else results
+
+    for i, config in enumerate(configs):
+        try:
+            signals, valid_start = config_signals(config, ctx)
+        except (ValueError, KeyError, ZeroDivisionError) as e:
+            out[i] = e
+            continue
+        key = (config['frequency'], valid_start)
+        pending.setdefault(key, []).append((i, signals))
+        if len(pending[key]) * signals.size >= Backtest.BATCH_CELLS:
+            flush(key)
+    for key in list(pending):
+        flush(key)
+    return out
+
+
+def config_row(config: dict) -> dict:
+    """結果表中描述參數組合的欄位。"""
+    return {
+        'lookbacks': ", ".join(str(lb) for lb in config['lookbacks']),
+        'weights': ", ".join(f"{w:g}" for w in config['weights']),
+        'top_n': config['top_n'],
+        'frequency': config['frequency'],
+        'cash_protection': config['cash_protection'],
+    }
+
+
+def _metrics_row(config: dict, results, context: dict) -> dict:
+    row = config_row(config)
+    if isinstance(results, Exception):
+        row.update({'CAGR': np.nan, 'MDD': np.nan, 'Sharpe Ratio': np.nan, 'Error': str(results)})
+        return row
+    try:
+        backtest = Backtest(context['prices'], pd.DataFrame(), context['initial_capital'])
+        row.update(backtest.calculate_metrics(results['Portfolio Value']))
+        row['Error'] = ''
+    except (ValueError, KeyError, ZeroDivisionError) as e:
+        row.update({'CAGR': np.nan, 'MDD': np.nan, 'Sharpe Ratio': np.nan, 'Error': str(e)})
+    return row
+
+
+def evaluate_config(config: dict, context: dict = None) -> dict:
+    """評估單一參數組合（見 config_results），回傳一列含 CAGR / MDD / Sharpe Ratio 的結果。"""
+    ctx = context if context is not None else _CONTEXT
+    try:
+        _, results = config_results(config, ctx)
+    except (ValueError, KeyError, ZeroDivisionError) as e:
+        results = e
+    return _metrics_row(config, results, ctx)
+
+
+def evaluate_batch(configs: list, context: dict = None) -> list:
+    """評估一批參數組合（見 batch_results），回傳與 configs 對齊的結果列。"""
+    ctx = context if context is not None else _CONTEXT
+    return [_metrics_row(config, results, ctx) for config, results in zip(configs, batch_results(configs, ctx))]
+
+
+def run_sweep(prices: pd.DataFrame, risky_assets: list, safe_assets: list, grid: list,
+              start_date=None, end_date=None, initial_capital: float = 10000.0,
+              max_workers: int = None, rank_by: str = 'Sharpe Ratio', membership=None) -> pd.DataFrame:
+    """
+    以同一份價格矩陣評估整組參數，回傳依 rank_by 由高到低排序的結果表。
+    membership：歷史成分股（MembershipHistory），每個結算日只從當時的成分股中選股。
+
+    max_workers：行程池大小，預設為 CPU 數；設為 1 則在目前行程內依序執行
+    （組合數很少時可省去啟動行程池的成本）。
+    """
+    if not grid:
+        return pd.DataFrame()
+    if isinstance(safe_assets, str):
+        safe_assets = [safe_assets]
+
+    context = _prepare_context(prices, risky_assets, safe_assets, grid, start_date, end_date, initial_capital,
+                               membership)
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(grid)))
+
+    print(f"開始參數掃描：{len(grid)} 組，{max_workers} 個行程")
+    if max_workers == 1:
+        rows = evaluate_batch(grid, context)
+    else:
+        # 依頻率分組後切塊，每塊在工作行程內批次回測；塊數約為行程數的 4 倍以平衡負載
+        order = sorted(range(len(grid)), key=lambda i: grid[i]['frequency'])
+        size = max(1, -(-len(grid) // (max_workers * 4)))
+        chunks = [order[i:i + size] for i in range(0, len(order), size)]
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers, initializer=_init_worker, initargs=(context,)
+        ) as executor:
+            chunk_rows = executor.map(evaluate_batch, [[grid[i] for i in chunk] for chunk in chunks])
+            rows = [None] * len(grid)
+            for chunk, part in zip(chunks, chunk_rows):
+                for i, row in zip(chunk, part):
+                    rows[i] = row
+
+    table = pd.DataFrame(rows)
+    # 三項指標都是越大越好（MDD 為負值，越接近 0 越好），一律由高到低排序
+    table = table.sort_values(rank_by, ascending=False, na_position='last', kind='stable').reset_index(drop=True)
+    table.index = table.index + 1
+    table.index.name = 'Rank'
+    return table
@@ -0,0 +1,119 @@
+from analytics import rolling_metrics, drawdown_stats, performance_summary, periods_per_year, rolling_sum
+from backtest import Backtest
+import pandas as pd
+import numpy as np
+import time
+
+
+def make_values(periods=240, n=5, freq='ME', seed=15):
+    index = pd.date_range('2000-01-31', periods=periods, freq=freq)
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0.008, 0.05, (periods, n))
+    returns[0] = 0
+    values = pd.DataFrame(10000 * np.cumprod(1 + returns, axis=0), index=index,
+                          columns=[f"S{i}" for i in range(n)])
+    values.iloc[:30, 1] = np.nan                               # 較晚開始的序列
+    return values
+
+
+def naive_drawdown(series):
+    """逐期迴圈的對照實作：(MDD, 最長水下天數, 最大回撤的回復天數)。"""
+    s = series.dropna()
+    peak_val, peak_date = -np.inf, None
+    worst, trough_date, trough_peak = 0.0, None, None
+    longest = 0.0
+    for date, v in s.items():
+        if v >= peak_val:
+            peak_val, peak_date = v, date
+        longest = max(longest, (date - peak_date).days)
+        if v / peak_val - 1 < worst:
+            worst, trough_date, trough_peak = v / peak_val - 1, date, peak_val
+    recovery = 0.0 if trough_date is None else np.nan
+    if trough_date is not None:
+        after = s[(s.index > trough_date) & (s >= trough_peak)]
+        if len(after):
+            recovery = (after.index[0] - trough_date).days
+    return worst, longest, recovery
+
+
+def test_rolling_matches_pandas():
+    print("Testing rolling metrics against pandas rolling windows...")
+    values = make_values()
+    returns = values.pct_change()
+    window = 24
+    rolling = rolling_metrics(returns, window)
+
+    roll = returns.rolling(window)
+    mean, std = roll.mean(), roll.std()
+    expected_cagr = np.exp(np.log1p(returns).rolling(window).sum()) ** (12 / window) - 1
+    downside = np.sqrt((returns.clip(upper=0) ** 2).rolling(window).mean())
+    assert np.allclose(rolling['Volatility'], std * np.sqrt(12), equal_nan=True)
+    assert np.allclose(rolling['Sharpe Ratio'], mean / std * np.sqrt(12), equal_nan=True)
+    assert np.allclose(rolling['Sortino Ratio'], mean / downside * np.sqrt(12), equal_nan=True)
+    assert np.allclose(rolling['CAGR'], expected_cagr, equal_nan=True)
+    # 視窗內有 NaN（晚開始的序列）時為 NaN
+    assert rolling['Sharpe Ratio']['S1'].iloc[:31 + window - 1].isna().all()
+    assert rolling['Sharpe Ratio']['S1'].iloc[31 + window - 1:].notna().all()
+
+    # Series 也可直接傳入
+    single = rolling_metrics(returns['S0'], window)
+    assert np.allclose(single['CAGR']['S0'], rolling['CAGR']['S0'], equal_nan=True)
+    assert np.isnan(rolling_sum(np.ones(3), 5)).all()
+    print("Test Passed: O(n) rolling metrics agree with pandas.")
+
+
+def test_drawdown_stats_match_loop():
+    print("Testing drawdown duration and recovery against a loop...")
+    values = make_values(n=8, seed=3)
+    stats = drawdown_stats(values)
+    for name in values.columns:
+        mdd, longest, recovery = naive_drawdown(values[name])
+        assert np.isclose(stats.loc[name, 'MDD'], mdd)
+        assert stats.loc[name, 'Max Drawdown Days'] == longest
+        assert np.isclose(stats.loc[name, 'Recovery Days'], recovery, equal_nan=True)
+
+    # 尚未回復的回撤
+    falling = pd.Series([100, 120, 90, 80, 100], index=pd.date_range('2020-01-31', periods=5, freq='ME'))
+    stats = drawdown_stats(falling.rename('x')).loc['x']
+    assert np.isnan(stats['Recovery Days'])
+    assert stats['Max Drawdown Days'] == (falling.index[-1] - falling.index[1]).days
+    print("Test Passed: drawdown statistics agree with the loop version.")
+
+
+def test_summary_annualizes_by_frequency():
+    print("Testing full metrics annualised by the actual frequency...")
+    monthly = make_values()
+    table = performance_summary(monthly)
+    for name in ('S0', 'S1'):
+        expected = Backtest(pd.DataFrame(), pd.DataFrame()).calculate_metrics(monthly[name].dropna())
+        for key in ('CAGR', 'MDD', 'Sharpe Ratio'):
+            assert np.isclose(table.loc[name, key], expected[key]), (name, key)
+
+    weekly = make_values(periods=520, freq='W-FRI')
+    assert periods_per_year(weekly.index) == 52
+    assert periods_per_year(pd.bdate_range('2020-01-01', periods=300)) == 252
+    r = weekly['S0'].pct_change().dropna()
+    expected_sharpe = r.mean() / r.std() * np.sqrt(52)
+    assert np.isclose(performance_summary(weekly).loc['S0', 'Sharpe Ratio'], expected_sharpe)
+    assert np.isclose(Backtest(pd.DataFrame(), pd.DataFrame()).calculate_metrics(weekly['S0'])['Sharpe Ratio'],
+                      expected_sharpe)
+    print("Test Passed: weekly series are annualised with 52 periods per year.")
+
+
+def test_many_series_speed():
+    print("Testing rolling metrics on 1000 series x 30 years of weeks...")
+    values = make_values(periods=1560, n=1000, freq='W-FRI', seed=1)
+    returns = values.pct_change()
+    t0 = time.perf_counter()
+    rolling_metrics(returns, 52)
+    performance_summary(values)
+    elapsed = time.perf_counter() - t0
+    assert elapsed < 3.0, elapsed
+    print(f"SUCCESS: {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    test_rolling_matches_pandas()
+    test_drawdown_stats_match_loop()
+    test_summary_annualizes_by_frequency()
+    test_many_series_speed()
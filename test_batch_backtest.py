@@ -0,0 +1,89 @@
+from strategy import MomentumStrategy
+from backtest import Backtest
+from sweep import build_grid, run_sweep
+from benchmark import random_walk_prices
+import pandas as pd
+import numpy as np
+import time
+
+
+def make_prices(n_risky=40, years=10, seed=13):
+    dates = pd.bdate_range('2012-01-01', periods=252 * years)
+    names = [f"R{i:02d}" for i in range(n_risky)] + ['TLT', 'GLD', 'SPY']
+    prices = random_walk_prices(names, dates, seed, vol=0.013)
+    prices.iloc[:500, 5] = np.nan  # 期間內上市
+    return prices
+
+
+def make_signals(prices, n=12):
+    risky = [c for c in prices.columns if c.startswith('R')]
+    strategy = MomentumStrategy(prices)
+    return [
+        strategy.generate_signals(risky, ['TLT', 'GLD'], top_n=1 + k % 4, frequency='W-FRI',
+                                  lookbacks=[4 + k, 12 + k], weights=[1, 1], cash_protection=bool(k % 2))
+        for k in range(n)
+    ]
+
+
+def test_run_many_matches_run_backtest():
+    print("Testing batched backtest against individual runs...")
+    prices = make_prices()
+    signals = make_signals(prices)
+    batch = Backtest.run_many(prices, signals, 5000.0)
+    for k, s in enumerate(signals):
+        single = Backtest(prices, s, 5000.0).run_backtest()
+        pd.testing.assert_series_equal(batch['Portfolio Value'][k], single['Portfolio Value'], check_names=False, check_freq=False)
+        pd.testing.assert_series_equal(batch['Portfolio Returns'][k], single['Portfolio Returns'], check_names=False, check_freq=False)
+
+    # 3D 陣列輸入
+    grid = np.stack([s.to_numpy() for s in signals])
+    arr = Backtest.run_many(prices, grid, 5000.0, index=signals[0].index, columns=signals[0].columns,
+                            names=[f"c{k}" for k in range(len(signals))])
+    assert list(arr['Portfolio Value'].columns) == [f"c{k}" for k in range(len(signals))]
+    np.testing.assert_array_equal(arr['Portfolio Value'].to_numpy(), batch['Portfolio Value'].to_numpy())
+
+    # 基準：全程持有 SPY 的信號矩陣 = 價格比
+    hold = pd.DataFrame(1.0, index=signals[0].index, columns=['SPY'])
+    bench = Backtest.run_many(prices, signals[:1] + [hold], 5000.0)['Portfolio Value'][1]
+    spy = prices['SPY'].reindex(bench.index)
+    np.testing.assert_allclose(bench.to_numpy(), (spy / spy.iloc[0] * 5000.0).to_numpy(), rtol=1e-10)
+
+    try:
+        Backtest.run_many(prices, grid)
+        assert False, "陣列輸入缺少 index / columns 應拋出 ValueError"
+    except ValueError:
+        pass
+    print("Test Passed: K signal matrices give the same curves as K separate backtests.")
+
+
+def test_run_many_is_faster():
+    print("Testing batched vs. looped backtests...")
+    prices = make_prices(n_risky=200)
+    signals = make_signals(prices, n=40)
+    t0 = time.perf_counter()
+    for s in signals:
+        Backtest(prices, s).run_backtest()
+    looped = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    Backtest.run_many(prices, signals)
+    batched = time.perf_counter() - t0
+    print(f"  40 runs: looped {looped:.3f}s, batched {batched:.3f}s")
+    assert batched < looped
+    print("Test Passed: one batched pass is cheaper than the loop.")
+
+
+def test_sweep_processes_match_in_process():
+    print("Testing chunked process-pool sweep against in-process sweep...")
+    prices = make_prices(n_risky=15, years=6)
+    risky = [c for c in prices.columns if c.startswith('R')]
+    grid = build_grid([[3, 6], [12]], [[1, 1], [1]], [1, 2], ['ME', 'W-FRI'], [False, True])
+    serial = run_sweep(prices, risky, ['TLT', 'GLD'], grid, max_workers=1)
+    parallel = run_sweep(prices, risky, ['TLT', 'GLD'], grid, max_workers=2)
+    pd.testing.assert_frame_equal(serial, parallel)
+    print("Test Passed: identical tables.")
+
+
+if __name__ == "__main__":
+    test_run_many_matches_run_backtest()
+    test_run_many_is_faster()
+    test_sweep_processes_match_in_process()
@@ -0,0 +1,33 @@
+from benchmark import make_synthetic_prices, run_scale, check
+import pandas as pd
+
+
+def test_synthetic_panel_is_deterministic():
+    print("Testing synthetic price generator...")
+    a = make_synthetic_prices(60, 3, seed=7)
+    b = make_synthetic_prices(60, 3, seed=7)
+    pd.testing.assert_frame_equal(a, b)
+    assert a.shape == (3 * 252, 60 + 5)
+
+    # 有部分標的在期間內才上市，且上市後不再出現 NaN
+    first_valid = a.apply(pd.Series.first_valid_index)
+    late = first_valid[first_valid > a.index[0]]
+    assert 0 < len(late) < 60
+    for ticker, start in late.items():
+        assert a.loc[start:, ticker].notna().all()
+    print("SUCCESS: Panel is reproducible with staggered IPO dates.")
+
+
+def test_run_scale_and_check():
+    rows = run_scale(20, 3, repeat=1)
+    assert [r['stage'] for r in rows] == ['fetch_data', 'fetch_data_compact', 'calculate_momentum', 'generate_signals', 'generate_signals_vol', 'generate_signals_corr', 'generate_holdings', 'run_backtest', 'run_backtest_sparse', 'run_daily', 'calculate_metrics']
+    assert check(rows, {'20x3': {'generate_signals': {'seconds': 60}}}) == []
+    assert len(check(rows, {'20x3': {'generate_signals': {'seconds': 0}}})) == 1
+
+    slower = {'results': [dict(r, seconds=r['seconds'] / 10) for r in rows]}
+    assert len(check(rows, baseline=slower, tolerance=1.5)) == len(rows)
+
+
+if __name__ == "__main__":
+    test_synthetic_panel_is_deterministic()
+    test_run_scale_and_check()
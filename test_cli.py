@@ -0,0 +1,170 @@
+from cli import run_jobs, write_outputs, expand_jobs, load_job_file, fetch_start, main
+from cache import cache_data
+from data import DataFetcher
+from providers import InMemoryProvider
+from strategy import MomentumStrategy
+from backtest import Backtest
+from benchmark import random_walk_prices
+import pandas as pd
+import numpy as np
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def make_prices(n=12, seed=16):
+    names = [f"R{i:02d}" for i in range(n)] + ['TLT', 'IEF']
+    return random_walk_prices(names, pd.bdate_range('2012-01-02', '2020-12-31'), seed)
+
+
+def make_spec(prices):
+    return {
+        'risky_assets': [c for c in prices.columns if c.startswith('R')],
+        'safe_assets': ['TLT', 'IEF'],
+        'start_date': '2015-01-01',
+        'end_date': '2020-12-31',
+        'jobs': [
+            {'name': 'm12', 'lookbacks': [12], 'weights': [1], 'top_n': 1},
+            {'name': 'blend', 'lookbacks': [3, 6], 'weights': [1, 1], 'top_n': 2, 'frequency': 'W-FRI',
+             'cash_protection': True},
+        ],
+        'grid': {'lookbacks': [[6], [9]], 'weights': [[1]], 'top_n': [1, 3]},
+    }
+
+
+def test_batch_jobs_match_app_pipeline():
+    print("Testing headless batch runner against the app pipeline...")
+    prices = make_prices()
+    spec = make_spec(prices)
+    fetcher = DataFetcher(InMemoryProvider(prices), store=None)
+
+    serial = run_jobs(spec, fetcher, max_workers=1)
+    parallel = run_jobs(spec, fetcher, max_workers=2)
+    assert len(serial['metrics']) == 6 and (serial['metrics']['Error'] == '').all()
+    pd.testing.assert_frame_equal(serial['metrics'], parallel['metrics'])
+    pd.testing.assert_frame_equal(serial['equity'], parallel['equity'])
+    pd.testing.assert_frame_equal(serial['holdings'], parallel['holdings'])
+
+    # 與 app.py「開始回測」流程相同
+    # 資料源的結束日不含當天（與 yfinance 相同）
+    fetched = prices.loc[fetch_start(spec['start_date'], 12):pd.Timestamp(spec['end_date']) - pd.Timedelta(days=1)]
+    strategy = MomentumStrategy(fetched)
+    for name, params in [('m12', dict(frequency='ME', lookbacks=[12], weights=[1], top_n=1)),
+                         ('blend', dict(frequency='W-FRI', lookbacks=[3, 6], weights=[1, 1], top_n=2,
+                                        cash_protection=True))]:
+        signals = strategy.generate_signals(spec['risky_assets'], spec['safe_assets'], **params)
+        start = max(pd.Timestamp(spec['start_date']), signals.index[0])
+        sliced = signals.loc[start:spec['end_date']]
+        backtest = Backtest(fetched, sliced)
+        expected = backtest.run_backtest().loc[start:]['Portfolio Value']
+        value = serial['equity'][name].dropna()
+        assert np.allclose(value.to_numpy(), expected.to_numpy())
+        metrics = serial['metrics'].set_index('job').loc[name]
+        assert np.isclose(metrics['CAGR'], backtest.calculate_metrics(expected)['CAGR'])
+        held = serial['holdings'][serial['holdings']['job'] == name]
+        sums = held.groupby('date')['weight'].sum()
+        assert (sums <= 1 + 1e-9).all()
+        assert name != 'm12' or np.allclose(sums, 1.0)          # 未開現金保護時永遠滿倉
+
+    with tempfile.TemporaryDirectory() as out:
+        write_outputs(serial, out)
+        assert sorted(os.listdir(out)) == ['equity.parquet', 'holdings.parquet', 'metrics.json', 'metrics.parquet',
+                                           'run.json']
+        pd.testing.assert_frame_equal(pd.read_parquet(os.path.join(out, 'equity.parquet')), serial['equity'],
+                                      check_freq=False)
+        with open(os.path.join(out, 'metrics.json'), encoding='utf-8') as f:
+            assert [row['job'] for row in json.load(f)] == list(serial['metrics']['job'])
+    print(f"SUCCESS: {len(serial['metrics'])} jobs, {len(serial['holdings'])} holding rows")
+
+
+def test_job_file_validation():
+    try:
+        expand_jobs({'jobs': [{'name': 'a'}, {'name': 'a'}]})
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("應拒絕重複的工作名稱")
+
+    for spec in ({'jobs': [{'name': 'a', 'skip': 1}]}, {'jobs': [{'name': 'a', 'lookback': [6]}]},
+                 {'grid': {'lookbacks': [[6]], 'weights': [[1]], 'ranking': ['vol_adjusted']}}):
+        try:
+            expand_jobs(spec)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"應拒絕不支援的欄位：{spec}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bad.json')
+        with open(path, 'w') as f:
+            json.dump({'risky_assets': ['A']}, f)
+        try:
+            load_job_file(path)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("應拒絕缺少欄位的工作檔")
+        assert main([path, '--output', os.path.join(tmp, 'out')]) == 1
+
+
+def test_local_cache_without_streamlit():
+    calls = []
+
+    @cache_data(ttl=0.2)
+    def load(_owner, key):
+        calls.append(key)
+        return key * 2
+
+    assert load('a', 1) == 2 and load('b', 1) == 2        # 底線參數不列入快取鍵
+    assert load('a', 2) == 4
+    assert calls == [1, 2]
+    time.sleep(0.25)
+    load('a', 1)
+    assert calls == [1, 2, 1]
+    load.clear()
+    load('a', 1)
+    assert calls == [1, 2, 1, 1]
+
+
+def test_cached_methods_require_source():
+    try:
+        @cache_data()
+        def load(_self, tickers):
+            return tickers
+    except TypeError:
+        pass
+    else:
+        raise AssertionError("以 _self 開頭、沒有 source 的快取方法應被拒絕")
+
+
+def test_fetchers_with_different_providers_in_one_process():
+    print("Testing two fetchers in one process...")
+    prices = make_prices()
+    spec = {**make_spec(prices), 'jobs': [{'name': 'm6', 'lookbacks': [6]}]}
+    del spec['grid']
+    # 第二個資料源的攻擊型資產走勢反轉，相同工作檔的結果必須不同
+    flipped = prices.copy()
+    flipped[spec['risky_assets']] = 1e4 / prices[spec['risky_assets']]
+    first = run_jobs(spec, DataFetcher(InMemoryProvider(prices), store=None), max_workers=1)
+    second = run_jobs(spec, DataFetcher(InMemoryProvider(flipped), store=None), max_workers=1)
+    assert not first['equity'].equals(second['equity'])
+    print("SUCCESS: each fetcher used its own provider's prices")
+
+
+def test_modules_import_without_streamlit():
+    code = "import sys, cli, data; print('streamlit' in sys.modules)"
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                         cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert out.stdout.strip() == 'False', out.stderr
+
+
+if __name__ == "__main__":
+    test_batch_jobs_match_app_pipeline()
+    test_job_file_validation()
+    test_local_cache_without_streamlit()
+    test_cached_methods_require_source()
+    test_fetchers_with_different_providers_in_one_process()
+    test_modules_import_without_streamlit()
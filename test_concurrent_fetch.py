@@ -0,0 +1,100 @@
+from data import DataFetcher
+from price_store import PriceStore
+from providers import InMemoryProvider
+from benchmark import random_walk_prices
+import pandas as pd
+import tempfile
+import threading
+import time
+
+
+class FlakyProvider(InMemoryProvider):
+    """每批下載耗時固定；指定代碼第一次會讓整批失敗，GHOST 永遠沒有數據。"""
+
+    def __init__(self, prices, delay=0.2, flaky=()):
+        super().__init__(prices)
+        self.delay = delay
+        self.flaky = set(flaky)
+        self.seen = set()
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def download_prices(self, tickers, start_date, end_date):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay)
+            with self._lock:
+                bad = [t for t in tickers if t in self.flaky and t not in self.seen]
+                self.seen.update(bad)
+            if bad:
+                raise ConnectionError(f"rate limited on {bad}")
+            return super().download_prices(tickers, start_date, end_date)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def make_prices(n=500):
+    names = [f"T{i:03d}" for i in range(n)]
+    return random_walk_prices(names, pd.bdate_range('2020-01-01', periods=300), seed=6, drift=0, vol=0.01)
+
+
+def test_concurrent_batches_and_retry():
+    print("Testing concurrent batch downloads with retry...")
+    prices = make_prices()
+    # 每批 0.5 秒：6 批首輪分兩波、重試一波，約 1.5 秒；逐批執行則超過 5 秒
+    provider = FlakyProvider(prices, delay=0.5, flaky=['T150'])
+    fetcher = DataFetcher(provider, store=None, max_concurrency=5)
+
+    tickers = tuple(prices.columns) + ('GHOST',)
+    t0 = time.perf_counter()
+    data, report = fetcher.load_prices(tickers, '2020-01-01', '2021-06-01', return_report=True)
+    elapsed = time.perf_counter() - t0
+
+    # 5 批並行：耗時約等於最慢一批 + 重試一輪，而非 5 批相加
+    assert provider.max_active == 5
+    assert elapsed < 4 * provider.delay, elapsed
+
+    # T150 所在整批第一次失敗，重試後補回；GHOST 始終無數據
+    assert list(data.columns) == list(prices.columns)
+    assert 'T150' in report['retried'] and 'GHOST' in report['retried']
+    assert list(report['failed']) == ['GHOST']
+    assert report['missing'] == ['GHOST']
+    assert sum(1 for b in report['batches'] if not b['ok']) == 1
+    assert report['coverage']['T000'] == ['2020-01-01', prices.index[-1].strftime('%Y-%m-%d')]
+    print(f"SUCCESS: {len(report['batches'])} batches in {elapsed:.2f}s, failed={list(report['failed'])}")
+
+
+def test_adaptive_batch_size():
+    fetcher = DataFetcher(InMemoryProvider(make_prices(10)), store=None, max_concurrency=4)
+    assert fetcher._batch_size(500) == 100
+    assert fetcher._batch_size(40) == 10
+    assert fetcher._batch_size(3) == 1
+
+
+def test_stored_ticker_empty_tail_is_retried():
+    print("Testing retry of an all-NaN tail for a stored ticker...")
+    prices = make_prices(3)
+
+    with tempfile.TemporaryDirectory() as root:
+        store = PriceStore(root)
+        store.write(prices.iloc[:100], '2020-01-01', '2020-05-20')
+        # 資料源的尾段對 T001 全為 NaN（例如暫時缺漏），其他代碼正常
+        provider = FlakyProvider(prices.assign(T001=prices['T001'].where(prices.index < '2020-05-01')), delay=0)
+        fetcher = DataFetcher(provider, store=store, max_concurrency=2)
+
+        _, report = fetcher.load_prices(tuple(prices.columns), '2020-01-01', '2021-01-01', return_report=True)
+        assert report['retried'] == ['T001'], report['retried']
+        assert list(report['failed']) == ['T001'], report['failed']
+        assert store.coverage('T001')[1] == '2020-05-20'
+
+    print("SUCCESS: Empty tail was retried, reported and left uncovered.")
+
+
+if __name__ == "__main__":
+    test_concurrent_batches_and_retry()
+    test_stored_ticker_empty_tail_is_retried()
+    test_adaptive_batch_size()
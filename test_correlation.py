@@ -0,0 +1,101 @@
+from correlation import RollingCovariance
+from strategy import MomentumStrategy
+from benchmark import random_walk_prices
+import pandas as pd
+import numpy as np
+
+
+def make_prices(seed=25):
+    """C0~C2 共用同一個強勢因子（高度相關、動能居前），其餘攻擊型資產各自獨立。"""
+    dates = pd.bdate_range('2016-01-01', '2020-12-31')
+    factor = np.random.default_rng(seed).normal(0.001, 0.012, (len(dates), 1))
+    clustered = random_walk_prices(['C0', 'C1', 'C2'], dates, seed + 1, drift=factor, vol=0.004)
+    others = random_walk_prices([f"R{i}" for i in range(9)] + ['TLT', 'GLD'], dates, seed + 2,
+                                drift=[0.0003] * 9 + [0.0001] * 2, vol=[0.012] * 9 + [0.004] * 2)
+    prices = pd.concat([clustered, others], axis=1)
+    prices.iloc[:300, 5] = np.nan      # 較晚上市
+    prices.iloc[700:703, 4] = np.nan   # 停牌數日
+    return prices
+
+
+def test_incremental_covariance_matches_pandas():
+    print("Testing incrementally updated rolling correlations...")
+    returns = make_prices().pct_change(fill_method=None).iloc[1:]
+    window = 63
+    engine = RollingCovariance(returns.to_numpy(), window)
+    # 小步推進（增量）、超過視窗的跳躍（重算）、列被捨棄後重新請求
+    for step, end in enumerate([10, 63, 64, 70, 90, 300, 301, 306, 700, 702, 760, 1000, len(returns)]):
+        engine.advance(end)
+        frame = returns.iloc[max(0, end - window):end]
+        expected = frame.corr().to_numpy().copy()
+        # 視窗未滿或含缺值時為 NaN
+        bad = frame.isna().any().to_numpy() | (end < window)
+        expected[bad, :] = np.nan
+        expected[:, bad] = np.nan
+        for asset in ((0, 4, 5) if step % 3 else (0, 2)):
+            np.testing.assert_allclose(engine.correlations(asset), expected[asset], rtol=1e-9, atol=1e-12)
+    try:
+        engine.advance(10)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("視窗往回移應拋出 ValueError")
+    print("SUCCESS: incremental rows equal DataFrame.corr() on every window")
+
+
+def test_diversified_top_n():
+    print("Testing correlation-aware Top N selection...")
+    prices = make_prices()
+    risky = [c for c in prices.columns if c not in ('TLT', 'GLD')]
+    safe = ['TLT', 'GLD']
+    params = dict(top_n=3, frequency='ME', lookbacks=[3, 6], weights=[1, 1])
+    strategy = MomentumStrategy(prices)
+    plain = strategy.generate_signals(risky, safe, **params)
+    filtered = strategy.generate_signals(risky, safe, max_correlation=0.7, corr_window=63, **params)
+    cluster = ['C0', 'C1', 'C2']
+
+    # 不過濾時經常同時持有同一群組的多檔；過濾後（視窗有效的期間）最多一檔
+    assert ((plain[cluster] > 0).sum(axis=1) >= 2).sum() > 10
+    valid = filtered.index > prices.index[63 + 1]
+    assert ((filtered.loc[valid, cluster] > 0).sum(axis=1) <= 1).all()
+    np.testing.assert_allclose(filtered.sum(axis=1), plain.sum(axis=1))
+
+    # 逐期以 DataFrame.corr() 重做貪婪選股，入選結果相同
+    momentum, _ = strategy.calculate_momentum('ME', [3, 6], [1, 1])
+    picked = strategy._diversified(momentum, risky, None, 3, 0.7, 63)
+    returns = prices[risky].pct_change(fill_method=None).iloc[1:]
+    for i, label in enumerate(momentum.index):
+        end = prices.index.searchsorted(label, side='right') - 1
+        corr = returns.iloc[max(0, end - 63):end].corr() if end >= 63 else None
+        expected = []
+        for asset in momentum.loc[label, risky].dropna().sort_values(ascending=False, kind='stable').index:
+            window = returns.iloc[max(0, end - 63):end]
+            if corr is not None and any(not window[[asset, p]].isna().any(axis=None) and corr.loc[asset, p] > 0.7
+                                        for p in expected):
+                continue
+            expected.append(asset)
+            if len(expected) == 3:
+                break
+        assert sorted(np.array(risky)[picked[i]]) == sorted(expected), label
+
+    # 門檻 1 不會略過任何候選；稀疏版本與最新信號和歷史一致
+    pd.testing.assert_frame_equal(strategy.generate_signals(risky, safe, max_correlation=1.0, **params), plain)
+    holdings = strategy.generate_signals(risky, safe, max_correlation=0.7, corr_window=63, sparse=True, **params)
+    pd.testing.assert_frame_equal(holdings.to_dense(), filtered)
+    latest = strategy.get_latest_signal(risky, safe, max_correlation=0.7, corr_window=63, today='2030-01-01',
+                                        **params)
+    expected_latest = strategy._diversified(momentum.iloc[[-1]], risky, None, 3, 0.7, 63)[0]
+    assert set(latest) <= set(np.array(risky)[expected_latest]) | set(safe)
+    assert abs(sum(latest.values()) - 1) < 1e-9
+    try:
+        strategy.generate_signals(risky, safe, max_correlation=1.5, **params)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("相關係數門檻超出範圍應拋出 ValueError")
+    print("SUCCESS: at most one name per correlated cluster")
+
+
+if __name__ == "__main__":
+    test_incremental_covariance_matches_pandas()
+    test_diversified_top_n()
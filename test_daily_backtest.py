@@ -0,0 +1,100 @@
+from backtest import Backtest
+from strategy import MomentumStrategy
+from benchmark import make_synthetic_prices, SAFE_ASSETS
+import pandas as pd
+import numpy as np
+import time
+
+
+def test_weights_drift_between_rebalances():
+    print("Testing daily mark-to-market drift...")
+    dates = pd.bdate_range('2024-01-01', periods=8)
+    prices = pd.DataFrame({
+        'A': [100, 110, 121, 110, 100, 100, 120, 120],
+        'B': [100, 100, 100, 100, 100, 90, 90, 99],
+        'C': [np.nan, np.nan, np.nan, 50, 55, 60, 66, 60],
+    }, index=dates, dtype=float)
+    # 結算日：第 0、3 天，以及晚於最後一筆價格的標籤（尚未結束的當期，錨點為最後一個交易日，第 7 天）
+    labels = pd.DatetimeIndex([dates[0], dates[3], dates[7] + pd.Timedelta(days=1)])
+    signals = pd.DataFrame({
+        'A': [0.0, 0.5, 0.0],
+        'B': [0.0, 0.25, 0.0],   # 其餘 25% 為現金
+        'C': [0.0, 0.0, 1.0],
+    }, index=labels)
+
+    result = Backtest(prices, signals, 1000.0).run_daily()
+    assert list(result.index) == list(dates)
+    value = result['Portfolio Value']
+    # 信號列 = 截至該結算日的持有期權重：第 1 ~ 3 天持有 A、B（由第 0 天收盤漂移，不逐日再平衡）
+    first = 1000.0 * (0.5 * prices['A'].iloc[:4] / 100 + 0.25 * prices['B'].iloc[:4] / 100 + 0.25)
+    assert np.allclose(value.iloc[:4], first)
+    # 第 4 ~ 7 天：第 3 天收盤全數換成 C（C 在第 3 天才有價格）
+    assert np.allclose(value.iloc[3:], first.iloc[-1] * prices['C'].iloc[3:] / 50)
+    assert result['Portfolio Returns'].iloc[0] == 0
+    assert np.allclose(result['Portfolio Returns'].iloc[1:], value.pct_change().iloc[1:])
+    # run_backtest 不列入尚未結束的當期，run_daily 則延伸到最新價格
+    assert list(Backtest(prices, signals, 1000.0).run_backtest().index) == list(labels[:2])
+
+    # 期中回撤（第 3、7 天）在結算日取樣時看不到
+    backtest = Backtest(prices, signals)
+    assert backtest.calculate_metrics(value.iloc[[0, 3, 7]])['MDD'] == 0
+    assert np.isclose(backtest.calculate_metrics(value)['MDD'], 1260 / 1386 - 1)
+    print("SUCCESS: holdings drift with daily prices until the next rebalance")
+
+
+def test_matches_period_engine_on_rebalance_dates():
+    print("Testing daily engine against run_backtest...")
+    panel = make_synthetic_prices(80, 6, seed=20)
+    risky = [c for c in panel.columns if c.startswith('T')]
+    for frequency in ('W-FRI', 'ME'):
+        signals = MomentumStrategy(panel).generate_signals(risky, SAFE_ASSETS, top_n=5, frequency=frequency,
+                                                           lookbacks=[3, 6], weights=[1, 1])
+        daily = Backtest(panel, signals, 5000.0).run_daily()
+        periodic = Backtest(panel, signals, 5000.0).run_backtest()
+        # 月底標籤常落在週末：兩個引擎都以之前最後一個交易日為錨點，在結算日應一致
+        anchors = panel.index[panel.index.searchsorted(periodic.index, side='right') - 1]
+        assert (anchors != periodic.index).any() == (frequency == 'ME')
+        assert np.allclose(daily.loc[anchors, 'Portfolio Value'], periodic['Portfolio Value'], rtol=1e-12)
+        assert daily.index.is_unique and len(daily) > len(periodic)
+
+        mdd_daily = Backtest(panel, signals).calculate_metrics(daily['Portfolio Value'])['MDD']
+        mdd_period = Backtest(panel, signals).calculate_metrics(periodic['Portfolio Value'])['MDD']
+        assert mdd_daily <= mdd_period + 1e-12
+    print(f"SUCCESS: daily MDD {mdd_daily:.2%} vs period MDD {mdd_period:.2%}")
+
+
+def test_period_engine_keeps_non_trading_labels():
+    # 月底為週六：價格取週五收盤，該期不可被略過（否則下一期的報酬會套用事後決定的權重）
+    dates = pd.bdate_range('2024-05-27', '2024-07-05')
+    prices = pd.DataFrame({'A': np.linspace(100, 130, len(dates)), 'B': np.linspace(100, 70, len(dates))}, index=dates)
+    labels = pd.DatetimeIndex(['2024-05-31', '2024-06-30', '2024-07-31'])
+    signals = pd.DataFrame({'A': [0.0, 1.0, 0.0], 'B': [0.0, 0.0, 1.0]}, index=labels)
+
+    result = Backtest(prices, signals, 100.0).run_backtest()
+    # 7/31 尚未到來（價格只到 7/5），不列入
+    assert list(result.index) == list(labels[:2])
+    june = prices.loc['2024-06-28', 'A'] / prices.loc['2024-05-31', 'A'] - 1
+    assert np.isclose(result['Portfolio Returns'].iloc[1], june)
+    many = Backtest.run_many(prices, [signals], 100.0)['Portfolio Value'][0]
+    assert np.allclose(many, result['Portfolio Value'])
+
+
+def test_large_panel_speed():
+    panel = make_synthetic_prices(500, 20, seed=1)
+    risky = [c for c in panel.columns if c.startswith('T')]
+    signals = MomentumStrategy(panel).generate_signals(risky, SAFE_ASSETS, top_n=10, frequency='W-FRI',
+                                                       lookbacks=[13, 26], weights=[1, 1])
+    backtest = Backtest(panel, signals)
+    t0 = time.perf_counter()
+    daily = backtest.run_daily()
+    elapsed = time.perf_counter() - t0
+    assert len(daily) > 4900
+    assert elapsed < 1.0, f"500 檔 × 20 年逐日回測耗時 {elapsed:.2f} 秒"
+    print(f"SUCCESS: 500 x 20y daily backtest in {elapsed:.3f}s")
+
+
+if __name__ == "__main__":
+    test_weights_drift_between_rebalances()
+    test_matches_period_engine_on_rebalance_dates()
+    test_period_engine_keeps_non_trading_labels()
+    test_large_panel_speed()
@@ -0,0 +1,73 @@
+from holdings import SparseHoldings
+from backtest import Backtest
+from strategy import MomentumStrategy
+from benchmark import make_synthetic_prices, SAFE_ASSETS
+import pandas as pd
+import numpy as np
+
+
+def test_round_trip_shift_and_slice():
+    print("Testing sparse holdings round trip...")
+    index = pd.date_range('2024-01-31', periods=5, freq='ME')
+    dense = pd.DataFrame({
+        'A': [0.5, 0.0, 0.0, 1.0, 0.0],
+        'B': [0.5, 0.0, np.nan, 0.0, 0.25],
+        'C': [0.0, 0.0, 1.0, 0.0, 0.25],
+    }, index=index)
+    holdings = SparseHoldings.from_dense(dense)
+    assert holdings.nnz == 6 and list(np.diff(holdings.indptr)) == [2, 0, 1, 1, 2]
+    pd.testing.assert_frame_equal(holdings.to_dense(), dense.fillna(0))
+    pd.testing.assert_frame_equal(holdings.shift(1).to_dense(), dense.shift(1).fillna(0))
+    pd.testing.assert_frame_equal(holdings.shift(9).to_dense(), dense.fillna(0) * 0)
+    pd.testing.assert_frame_equal(holdings.slice('2024-02-15', '2024-04-30').to_dense(),
+                                  dense.loc['2024-02-15':'2024-04-30'].fillna(0))
+    assert holdings.slice('2030-01-01').empty
+
+    assert list(holdings.held_labels()) == ['A, B', 'CASH', 'C', 'A', 'B, C']
+    assert list(holdings.held_columns()) == ['A', 'B', 'C']
+    np.testing.assert_array_equal(holdings.to_array(['C', 'X', 'A'])[:, [0, 2]], dense[['C', 'A']].fillna(0))
+    assert (holdings.to_array(['C', 'X', 'A'])[:, 1] == 0).all()
+    assert len(holdings.stack()) == 6
+    print("SUCCESS: dense -> sparse -> dense is lossless")
+
+
+def test_sparse_signals_and_backtests_match_dense():
+    print("Testing sparse signals against the dense engine...")
+    panel = make_synthetic_prices(120, 8, seed=22)
+    risky = [c for c in panel.columns if c.startswith('T')]
+    for frequency, options in (('W-FRI', {}), ('ME', dict(cash_protection=True, weighting='inverse_vol'))):
+        strategy = MomentumStrategy(panel)
+        params = dict(top_n=5, frequency=frequency, lookbacks=[3, 6], weights=[1, 1], **options)
+        dense = strategy.generate_signals(risky, SAFE_ASSETS, **params)
+        holdings = strategy.generate_signals(risky, SAFE_ASSETS, sparse=True, **params)
+        pd.testing.assert_frame_equal(holdings.to_dense(), dense)
+        assert holdings.nbytes * 5 < dense.memory_usage().sum()
+
+        # 切到有 IPO 前資產的期間，並讓第一個結算日早於價格起點
+        window = slice(panel.index[0] - pd.Timedelta(days=40), panel.index[-1])
+        sparse_result = Backtest(panel, holdings.slice(window.start, window.stop), 1000.0).run_backtest()
+        dense_result = Backtest(panel, dense.loc[window], 1000.0).run_backtest()
+        pd.testing.assert_frame_equal(sparse_result, dense_result, rtol=1e-12)
+        pd.testing.assert_frame_equal(Backtest(panel, holdings).run_daily(), Backtest(panel, dense).run_daily())
+        many = Backtest.run_many(panel, [holdings], 1000.0)['Portfolio Value'][0]
+        np.testing.assert_allclose(many, dense_result['Portfolio Value'], rtol=1e-12)
+
+        history = dense.apply(lambda row: ", ".join(a for a, w in row.items() if w > 0) or "CASH", axis=1)
+        pd.testing.assert_series_equal(holdings.held_labels(), history)
+    print(f"SUCCESS: {holdings.nbytes / 1e3:.0f} KB sparse vs {dense.memory_usage().sum() / 1e3:.0f} KB dense")
+
+
+def test_assets_missing_from_prices():
+    # 持倉中有價格表沒有的資產：回報視為 NaN → 貢獻 0，與密集版本相同
+    dates = pd.bdate_range('2024-01-01', periods=30)
+    prices = pd.DataFrame({'A': np.linspace(100, 130, 30)}, index=dates)
+    labels = dates[[0, 9, 19, 29]]
+    dense = pd.DataFrame({'A': [0.0, 0.5, 0.5, 1.0], 'Z': [0.0, 0.5, 0.5, 0.0]}, index=labels)
+    sparse_result = Backtest(prices, SparseHoldings.from_dense(dense)).run_backtest()
+    pd.testing.assert_frame_equal(sparse_result, Backtest(prices, dense).run_backtest())
+
+
+if __name__ == "__main__":
+    test_round_trip_shift_and_slice()
+    test_sparse_signals_and_backtests_match_dense()
+    test_assets_missing_from_prices()
@@ -0,0 +1,109 @@
+from strategy import MomentumStrategy
+from live_signal import LiveSignalEngine
+from price_matrix import PriceMatrix
+from benchmark import random_walk_prices
+import pandas as pd
+import numpy as np
+import time
+
+
+def make_prices(n=30, start='2015-01-01', end='2020-06-30', seed=10):
+    names = [f"R{i:02d}" for i in range(n)] + ['TLT', 'GLD']
+    prices = random_walk_prices(names, pd.bdate_range(start, end), seed)
+    prices.iloc[:400, 2] = np.nan                                       # 期間內上市
+    prices.loc['2017-03-01':'2017-04-30', 'R05'] = np.nan               # 整整兩個月無報價
+    return prices
+
+
+def reference_latest_signal(strategy, risky_assets, safe_assets, top_n, frequency, lookbacks, weights, cash_protection):
+    """原本整段重算的 get_latest_signal（最後一期為已完成的結算期時）。"""
+    momentum, _ = strategy.calculate_momentum(resample_freq=frequency, lookbacks=lookbacks, weights=weights)
+    use_mom = momentum.iloc[-1]
+    valid_risky = [r for r in risky_assets if pd.notna(use_mom[r])]
+    best_risky = use_mom[valid_risky].sort_values(ascending=False).head(top_n)
+    safe_mom = use_mom[safe_assets]
+    signal = {}
+    for asset, mom_val in best_risky.items():
+        if mom_val > 0:
+            signal[asset] = signal.get(asset, 0) + 1.0 / top_n
+        elif cash_protection and safe_mom.max() <= 0:
+            signal["CASH"] = signal.get("CASH", 0) + 1.0 / top_n
+        else:
+            signal[safe_mom.idxmax()] = signal.get(safe_mom.idxmax(), 0) + 1.0 / top_n
+    return signal
+
+
+def test_incremental_matches_batch():
+    print("Testing bar-by-bar updates against full recomputation...")
+    prices = make_prices()
+    for frequency, lookbacks, weights in [('ME', [1, 3, 6], [50, 30, 20]), ('W-FRI', [4, 13], [1.0, 1.0])]:
+        engine = LiveSignalEngine(prices.columns, frequency, lookbacks, weights)
+        checkpoints = set(prices.index[::37]) | {prices.index[-1]}
+        for date, row in prices.iterrows():
+            engine.update(date, row)
+            if date not in checkpoints:
+                continue
+            momentum, _ = MomentumStrategy(prices.loc[:date]).calculate_momentum(frequency, lookbacks, weights)
+            pd.testing.assert_series_equal(engine.momentum(), momentum.iloc[-1], check_names=False)
+            if len(momentum) > 1:
+                pd.testing.assert_series_equal(engine.momentum(1), momentum.iloc[-2], check_names=False)
+    print("Test Passed: incremental momentum equals batch momentum bit for bit.")
+
+
+def test_latest_signal_matches_reference():
+    print("Testing get_latest_signal against the full-history version...")
+    prices = make_prices()
+    risky = [c for c in prices.columns if c.startswith('R')]
+    for prices_in in (prices, PriceMatrix.from_frame(prices)):
+        strategy = MomentumStrategy(prices_in)
+        for top_n, cash in [(1, False), (3, True), (5, False)]:
+            kwargs = dict(top_n=top_n, frequency='ME', lookbacks=[1, 3, 6], weights=[50, 30, 20], cash_protection=cash)
+            expected = reference_latest_signal(strategy, risky, ['TLT', 'GLD'], **kwargs)
+            assert strategy.get_latest_signal(risky, ['TLT', 'GLD'], **kwargs) == expected
+    print("Test Passed: get_latest_signal unchanged.")
+
+
+def test_unfinished_period_and_gaps():
+    print("Testing unfinished period fallback and empty periods...")
+    prices = make_prices(end='2020-06-15')
+    engine = MomentumStrategy(prices).live_engine('ME', [3], [1.0])
+    risky = [c for c in prices.columns if c.startswith('R')]
+    # 今天與最後一期同月：使用上一個完整月
+    mid_month = engine.latest_signal(risky, ['TLT'], today='2020-06-20')
+    expected = LiveSignalEngine.from_period_closes(prices.loc[:'2020-05-31'].resample('ME').last(), 'ME', [3], [1.0])
+    assert mid_month == expected.latest_signal(risky, ['TLT'], today='2021-01-01')
+
+    # 跳過整整兩個月才收到下一根 K 線：中間補上空白期，與 resample 一致
+    engine.update('2020-09-03', prices.iloc[-1])
+    full = pd.concat([prices, prices.iloc[[-1]].set_axis([pd.Timestamp('2020-09-03')])])
+    momentum, _ = MomentumStrategy(full).calculate_momentum('ME', [3], [1.0])
+    pd.testing.assert_series_equal(engine.momentum(), momentum.iloc[-1], check_names=False)
+
+    try:
+        engine.update('2020-08-31', prices.iloc[-1])
+        assert False, "早於目前結算期的 K 線應拋出 ValueError"
+    except ValueError:
+        pass
+    print("Test Passed: fallback and gap handling match the batch path.")
+
+
+def test_update_is_fast():
+    print("Testing update cost on a wide universe...")
+    prices = make_prices(n=500, start='2010-01-01', end='2020-06-30')
+    engine = MomentumStrategy(prices).live_engine('ME', [1, 3, 6, 12], [1, 1, 1, 1])
+    bar = prices.iloc[-1]
+    t0 = time.perf_counter()
+    for day in pd.bdate_range('2020-07-01', periods=100):
+        engine.update(day, bar)
+        engine.latest_signal(list(prices.columns[:500]), ['TLT', 'GLD'], top_n=10, today='2030-01-01')
+    per_update = (time.perf_counter() - t0) / 100
+    print(f"  {per_update * 1000:.2f} ms per update + signal")
+    assert per_update < 0.05
+    print("Test Passed: each refresh takes milliseconds.")
+
+
+if __name__ == "__main__":
+    test_incremental_matches_batch()
+    test_latest_signal_matches_reference()
+    test_unfinished_period_and_gaps()
+    test_update_is_fast()
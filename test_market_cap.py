@@ -0,0 +1,86 @@
+from market_cap import MarketCapFetcher, TokenBucket, AdaptiveLimiter
+import threading
+import tempfile
+import os
+
+
+class StubProvider:
+    """本機替身：部分標的第一次查詢會失敗，BAD 永遠失敗。"""
+
+    def __init__(self, flaky=()):
+        self.flaky = set(flaky)
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, ticker):
+        with self._lock:
+            self.calls[ticker] = self.calls.get(ticker, 0) + 1
+            n = self.calls[ticker]
+        if ticker == 'BAD':
+            raise ConnectionError("404 Not Found")
+        if ticker in self.flaky and n == 1:
+            raise TimeoutError("Too Many Requests")
+        return 1e9 * (ord(ticker[0]) - 64)
+
+
+def test_retry_and_snapshot():
+    print("Testing market-cap fetcher with a stub provider...")
+    tickers = ['AAA', 'BBB', 'CCC', 'DDD', 'BAD']
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, 'caps.json')
+        stub = StubProvider(flaky=['BBB', 'DDD'])
+        fetcher = MarketCapFetcher(stub, snapshot_path=path, rate=1000, max_retries=2, backoff=0.001, today=lambda: '2025-01-02')
+
+        report = fetcher.fetch(tickers)
+        assert sorted(report['market_caps']) == ['AAA', 'BBB', 'CCC', 'DDD']
+        assert list(report['failed']) == ['BAD']
+        assert stub.calls['BBB'] == 2 and stub.calls['BAD'] == 3
+
+        # 同日再查：只重試失敗的標的
+        stub.calls.clear()
+        report = fetcher.fetch(tickers)
+        assert stub.calls == {'BAD': 3}
+        assert report['from_snapshot'] == 4
+
+        # 全部都有今日快照：不發出任何請求
+        stub.calls.clear()
+        report = fetcher.fetch(tickers[:4])
+        assert stub.calls == {} and report['queried'] == 0
+
+        # 隔日：快照過期，重新查詢
+        fetcher._today = lambda: '2025-01-03'
+        report = fetcher.fetch(tickers[:4])
+        assert report['queried'] == 4
+    print("SUCCESS: Retries, failures and snapshot reuse behave as expected.")
+
+
+def test_token_bucket_rate():
+    now = [0.0]
+    sleeps = []
+
+    def sleep(dt):
+        sleeps.append(dt)
+        now[0] += dt
+
+    bucket = TokenBucket(rate=5, capacity=5, clock=lambda: now[0], sleep=sleep)
+    for _ in range(15):
+        bucket.acquire()
+    # 前 5 次爆量不等待，之後每秒 5 次
+    assert abs(now[0] - 2.0) < 1e-9, now[0]
+
+
+def test_adaptive_limiter():
+    limiter = AdaptiveLimiter(initial=8, maximum=16)
+    limiter.acquire()
+    limiter.release(False)
+    assert limiter.limit == 4
+    for _ in range(40):
+        limiter.acquire()
+        limiter.release(True)
+    assert 4 < limiter.limit <= 16
+
+
+if __name__ == "__main__":
+    test_retry_and_snapshot()
+    test_token_bucket_rate()
+    test_adaptive_limiter()
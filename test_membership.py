@@ -0,0 +1,135 @@
+from membership import MembershipHistory
+from strategy import MomentumStrategy
+from sweep import build_grid, run_sweep
+from backtest import Backtest
+from benchmark import random_walk_prices
+import pandas as pd
+import numpy as np
+import time
+
+
+def make_events(n=60, years=20, seed=14):
+    """期初 n/2 檔為成分股，之後每季隨機剔除一檔、納入一檔。"""
+    rng = np.random.default_rng(seed)
+    names = [f"R{i:02d}" for i in range(n)]
+    start = pd.Timestamp('2000-01-03')
+    rows = [(start, t, 'add') for t in names[:n // 2]]
+    members, others = set(names[:n // 2]), set(names[n // 2:])
+    for date in pd.date_range(start, periods=years * 4, freq='QS')[1:]:
+        out = sorted(members)[rng.integers(len(members))]
+        inn = sorted(others)[rng.integers(len(others))]
+        members.remove(out); others.add(out)
+        others.remove(inn); members.add(inn)
+        rows += [(date + pd.Timedelta(days=int(rng.integers(0, 60))), out, 'remove'),
+                 (date + pd.Timedelta(days=int(rng.integers(0, 60))), inn, 'Added')]
+    return pd.DataFrame(rows, columns=['date', 'ticker', 'action']), names
+
+
+def replay(events, date, ticker):
+    """逐筆重播事件的對照實作。"""
+    member = False
+    for row in events.sort_values('date', kind='stable').itertuples():
+        if row.date > date:
+            break
+        if row.ticker == ticker:
+            member = row.action.lower().startswith('add')
+    return member
+
+
+def test_mask_matches_replay():
+    print("Testing compiled membership mask against event replay...")
+    events, names = make_events()
+    history = MembershipHistory.from_events(events)
+
+    rng = np.random.default_rng(0)
+    dates = pd.DatetimeIndex(sorted(pd.Timestamp('1999-06-01') + pd.to_timedelta(rng.integers(0, 8000, 40), 'D')))
+    tickers = names[::3] + ['NEVER']
+    mask = history.mask(dates, tickers)
+    expected = np.array([[replay(events, d, t) for t in tickers] for d in dates])
+    assert mask.shape == (len(dates), len(tickers))
+    assert (mask == expected).all()
+    assert not mask[:, -1].any()
+
+    # 單日查詢與成員清單
+    d = dates[len(dates) // 2]
+    assert history.members(d) == [t for t in history.tickers if replay(events, d, t)]
+    assert history.is_member(d, tickers[0]) == expected[len(dates) // 2, 0]
+    assert history.members('1990-01-01') == []
+    print(f"SUCCESS: {len(history.event_dates)} epochs, {history.nbytes} bytes")
+
+
+def test_bad_events_rejected():
+    for bad in (pd.DataFrame({'date': ['2020-01-01'], 'ticker': ['A']}),
+                pd.DataFrame({'date': ['2020-01-01'], 'ticker': ['A'], 'action': ['buy']})):
+        try:
+            MembershipHistory.from_events(bad)
+        except ValueError:
+            continue
+        raise AssertionError("應拒絕格式錯誤的事件表")
+
+
+def test_signals_only_select_members():
+    print("Testing that signals never hold non-members...")
+    events, names = make_events(n=40, years=12)
+    history = MembershipHistory.from_events(events)
+    dates = pd.bdate_range('2000-01-03', '2011-12-30')
+    # 讓之後才納入的代碼動能最強，未遮罩時必定被選中
+    drift = np.where(np.arange(len(names) + 1) >= 20, 0.002, 0.0003)
+    prices = random_walk_prices(names + ['TLT'], dates, seed=3, drift=drift, vol=0.01)
+
+    strategy = MomentumStrategy(prices)
+    kwargs = dict(top_n=3, frequency='ME', lookbacks=[3, 6], weights=[1.0, 1.0])
+    biased = strategy.generate_signals(names, ['TLT'], **kwargs)
+    signals = strategy.generate_signals(names, ['TLT'], membership=history, **kwargs)
+
+    # 信號已 shift 一期：第 t 列的持倉由第 t-1 個結算日的成分股決定
+    eligible = history.mask(signals.index, names)
+    held = signals[names].to_numpy() > 0
+    assert not (held[1:] & ~eligible[:-1]).any()
+    assert (biased[names].to_numpy()[1:] > 0)[~eligible[:-1]].any()
+    assert np.allclose(signals.sum(axis=1).iloc[7:], 1.0)
+
+    # 參數掃描套用相同遮罩
+    grid = build_grid([[3, 6]], [[1.0, 1.0]], [3], ['ME'], [False])
+    table = run_sweep(prices, names, ['TLT'], grid, max_workers=1, membership=history)
+    backtest = Backtest(prices, signals)
+    expected = backtest.calculate_metrics(backtest.run_backtest()['Portfolio Value'])
+    assert abs(table['CAGR'].iloc[0] - expected['CAGR']) < 1e-12
+
+    # 最新信號同樣只從當期成分股中挑選
+    latest = strategy.get_latest_signal(names, ['TLT'], membership=history, **kwargs)
+    members = set(history.members(prices.index[-1]))
+    assert all(a in members or a == 'TLT' for a in latest)
+    print(f"SUCCESS: latest signal {latest}")
+
+
+def test_lookup_speed():
+    print("Testing membership lookup at 30 years x 1000 tickers...")
+    rng = np.random.default_rng(1)
+    names = [f"T{i:04d}" for i in range(1000)]
+    days = pd.bdate_range('1995-01-02', '2024-12-31')
+    rows = [(days[0], t, 'add') for t in names[:500]]
+    for d in days[rng.choice(len(days), 3000, replace=False)]:
+        rows.append((d, names[rng.integers(1000)], 'add' if rng.random() < 0.5 else 'remove'))
+    events = pd.DataFrame(rows, columns=['date', 'ticker', 'action'])
+
+    t0 = time.perf_counter()
+    history = MembershipHistory.from_events(events)
+    compile_seconds = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    mask = history.mask(days, names)
+    lookup_seconds = time.perf_counter() - t0
+
+    assert mask.shape == (len(days), 1000)
+    assert history.nbytes < 2_000_000
+    assert lookup_seconds < 2.0, lookup_seconds
+    print(f"SUCCESS: compile {compile_seconds:.2f}s, {mask.size:,} lookups in {lookup_seconds:.2f}s, "
+          f"{history.nbytes / 1e6:.2f} MB")
+
+
+if __name__ == "__main__":
+    test_mask_matches_replay()
+    test_bad_events_rejected()
+    test_signals_only_select_members()
+    test_lookup_speed()
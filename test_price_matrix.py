@@ -0,0 +1,101 @@
+from data import DataFetcher
+from providers import InMemoryProvider
+from price_matrix import PriceMatrix
+from strategy import MomentumStrategy
+from backtest import Backtest
+from benchmark import random_walk_prices
+import pandas as pd
+import numpy as np
+import tracemalloc
+
+
+def make_prices(n=200, periods=600):
+    names = [f"T{i:03d}" for i in range(n)] + ['TLT', 'GLD']
+    prices = random_walk_prices(names, pd.bdate_range('2018-01-01', periods=periods), seed=9, drift=0.0005, vol=0.01)
+    prices.iloc[:250, 3] = np.nan    # 期間內上市
+    prices.iloc[100] = np.nan        # 休市日
+    return prices
+
+
+def test_write_compact_and_zero_copy():
+    print("Testing PriceMatrix write / compact / to_frame...")
+    index = pd.bdate_range('2024-01-01', periods=6)
+    matrix = PriceMatrix.allocate(index, ['A', 'B', 'GHOST'])
+    assert matrix.dtype == np.float32 and matrix.values.flags['F_CONTIGUOUS']
+
+    part = pd.DataFrame({'A': [1.0, 2.0, 3.0], 'ZZZ': [9.0, 9.0, 9.0]}, index=index[[0, 2, 4]])
+    assert matrix.write(part) == 0
+    weekend = pd.Series([5.0, 6.0], index=[index[1], pd.Timestamp('2024-01-06')], name='B')
+    assert matrix.write(weekend) == 1  # 週六不在日曆內，略過
+
+    matrix.compact()
+    assert list(matrix.columns) == ['A', 'B']
+    assert list(matrix.index) == list(index[[0, 1, 2, 4]])
+    assert matrix.values.flags['F_CONTIGUOUS']
+    assert matrix.coverage() == {'A': ['2024-01-01', '2024-01-05'], 'B': ['2024-01-02', '2024-01-02']}
+
+    frame = matrix.to_frame()
+    assert np.shares_memory(frame['A'].to_numpy(), matrix.values)
+    assert frame.loc[index[4], 'A'] == 3.0 and np.isnan(frame.loc[index[0], 'B'])
+    print("Test Passed: batches land in their slots, compaction keeps one contiguous buffer.")
+
+
+def test_compact_fetch_matches_frame():
+    print("Testing compact fetch_data against the DataFrame path...")
+    prices = make_prices()
+    fetcher = DataFetcher(InMemoryProvider(prices), store=None)
+    tickers = tuple(prices.columns) + ('GHOST',)
+
+    frame, report = fetcher.load_prices(tickers, '2018-01-01', '2020-12-31', return_report=True)
+    matrix, compact_report = fetcher.load_prices(tickers, '2018-01-01', '2020-12-31', return_report=True, compact=True)
+
+    assert isinstance(matrix, PriceMatrix) and matrix.dtype == np.float32
+    assert list(matrix.columns) == list(frame.columns)
+    assert matrix.index.equals(frame.index)
+    np.testing.assert_allclose(matrix.values, frame.to_numpy(), rtol=1e-6)
+    assert compact_report['coverage'] == report['coverage']
+    assert compact_report['missing'] == report['missing'] == ['GHOST']
+    print("Test Passed: compact result equals the DataFrame result in float32.")
+
+
+def test_strategy_and_backtest_accept_matrix():
+    print("Testing MomentumStrategy / Backtest on PriceMatrix...")
+    prices = make_prices()
+    matrix = PriceMatrix.from_frame(prices.dropna(how='all'))
+    risky = [c for c in prices.columns if c.startswith('T0')]
+    params = dict(top_n=3, frequency='W-FRI', lookbacks=[4, 8], weights=[50, 50])
+
+    expected = MomentumStrategy(prices).generate_signals(risky, ['TLT', 'GLD'], **params)
+    signals = MomentumStrategy(matrix).generate_signals(risky, ['TLT', 'GLD'], **params)
+    # float32 與 float64 的動能排序只可能在極接近的同分附近不同
+    assert (signals != expected).any(axis=1).mean() < 0.02
+
+    result = Backtest(matrix, signals).run_backtest()
+    reference = Backtest(prices, signals).run_backtest()
+    np.testing.assert_allclose(result['Portfolio Value'], reference['Portfolio Value'], rtol=1e-4)
+    print("Test Passed: strategy and backtest run directly on the matrix.")
+
+
+def test_compact_fetch_peak_memory():
+    print("Testing peak memory of compact fetch_data...")
+    prices = make_prices(n=500, periods=2520)
+    fetcher = DataFetcher(InMemoryProvider(prices), store=None)
+    tickers = tuple(prices.columns)
+
+    peaks = {}
+    for compact in (False, True):
+        tracemalloc.start()
+        fetcher.load_prices(tickers, '2018-01-01', '2028-01-01', compact=compact)
+        peaks[compact] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    print(f"  DataFrame: {peaks[False] / 1e6:.1f} MB, PriceMatrix: {peaks[True] / 1e6:.1f} MB")
+    assert peaks[True] < 0.55 * peaks[False]
+    print("Test Passed: compact fetch roughly halves peak memory.")
+
+
+if __name__ == "__main__":
+    test_write_compact_and_zero_copy()
+    test_compact_fetch_matches_frame()
+    test_strategy_and_backtest_accept_matrix()
+    test_compact_fetch_peak_memory()
@@ -0,0 +1,100 @@
+from data import DataFetcher
+from price_store import PriceStore
+from providers import InMemoryProvider
+from benchmark import random_walk_prices
+import pandas as pd
+import numpy as np
+import tempfile
+
+
+class CountingProvider(InMemoryProvider):
+    """以合成價格取代 yf.download，並記錄每次下載的區段。"""
+
+    def __init__(self, prices):
+        super().__init__(prices)
+        self.calls = []
+
+    def download_prices(self, tickers, start_date, end_date):
+        self.calls.append((tuple(tickers), start_date, end_date))
+        return super().download_prices(tickers, start_date, end_date)
+
+
+def make_universe():
+    prices = random_walk_prices(['SPY', 'TLT', 'UBER'], pd.bdate_range('2018-01-01', '2021-12-31'),
+                                drift=0.0005, vol=0.01)
+    prices.loc[:'2019-05-09', 'UBER'] = np.nan  # UBER 2019/5 上市
+    return prices
+
+
+def test_incremental_store():
+    print("Testing incremental price store...")
+    universe = make_universe()
+
+    with tempfile.TemporaryDirectory() as root:
+        provider = CountingProvider(universe)
+        fetcher = DataFetcher(provider, PriceStore(root))
+
+        first = fetcher.load_prices(('SPY', 'TLT', 'UBER'), '2018-01-01', '2020-01-01')
+        assert {c[1:] for c in provider.calls} == {('2018-01-01', '2020-01-01')}
+        pd.testing.assert_frame_equal(first, universe.loc[:'2019-12-31'].dropna(how='all'), check_freq=False, check_names=False)
+
+        # 子集合與較短區間：完全由本機提供
+        provider.calls.clear()
+        subset = fetcher.load_prices(('SPY',), '2018-06-01', '2019-06-01')
+        assert provider.calls == [], provider.calls
+        assert subset.index[0] >= pd.Timestamp('2018-06-01')
+        assert subset.index[-1] < pd.Timestamp('2019-06-01')
+
+        # 延長結束日：只下載尾段
+        provider.calls.clear()
+        longer = fetcher.load_prices(('SPY', 'TLT', 'UBER'), '2018-01-01', '2021-01-01')
+        segments = {c[1:] for c in provider.calls}
+        assert len(segments) == 1
+        seg_start, seg_end = segments.pop()
+        assert seg_start > '2019-12-01' and seg_end == '2021-01-01'
+        np.testing.assert_allclose(longer.values, universe.loc[:'2020-12-31'].values, equal_nan=True)
+
+        # 新增標的：只下載該標的，且上市前的頭段不會重複下載
+        provider.calls.clear()
+        fetcher.load_prices(('SPY', 'UBER'), '2018-01-01', '2021-01-01')
+        assert provider.calls == []
+
+    print("SUCCESS: Store served subsets locally and only fetched missing segments.")
+
+
+def test_empty_segments():
+    print("Testing coverage for empty head and tail segments...")
+    universe = make_universe()
+
+    with tempfile.TemporaryDirectory() as root:
+        store = PriceStore(root)
+        store.write(universe.loc['2019-01-01':'2019-12-31', ['SPY', 'UBER']], '2019-01-01', '2020-01-01')
+        empty = pd.DataFrame(np.nan, index=pd.bdate_range('2020-01-01', '2020-06-30'), columns=['SPY', 'UBER'])
+
+        # 尾段整段沒有數據：不擴充涵蓋終點，下次請求仍會補抓
+        store.write(empty, '2019-12-20', '2020-07-01', requested=['SPY', 'UBER'])
+        assert store.coverage('SPY') == ('2019-01-01', '2020-01-01')
+        assert store.plan(('SPY',), '2019-01-01', '2020-07-01') == {('2019-12-22', '2020-07-01'): ['SPY']}
+
+        # 頭段早於首筆數據（UBER 上市前）：擴充涵蓋起點；SPY 頭段應有數據卻沒有，不擴充
+        store.write(empty.iloc[:0], '2018-01-01', '2019-01-11', requested=['SPY', 'UBER'])
+        assert store.coverage('UBER') == ('2018-01-01', '2020-01-01')
+        assert store.coverage('SPY') == ('2019-01-01', '2020-01-01')
+
+    print("SUCCESS: Only pre-listing head segments extended coverage without data.")
+
+
+def test_tail_rescale():
+    print("Testing adjusted-close rebasing on tail append...")
+    old = pd.Series([10.0, 11.0, 12.0], index=pd.to_datetime(['2020-01-01', '2020-01-02', '2020-01-03']))
+    # 除息後整段價格下修 10%
+    new = pd.Series([10.8, 13.5], index=pd.to_datetime(['2020-01-03', '2020-01-06']))
+    merged = PriceStore._merge(old, new)
+    np.testing.assert_allclose(merged.values, [9.0, 9.9, 10.8, 13.5])
+    print("SUCCESS: Older history rebased onto the latest adjustment.")
+
+
+if __name__ == "__main__":
+    test_incremental_store()
+    test_empty_segments()
+    test_tail_rescale()
@@ -0,0 +1,70 @@
+from cache import clear_all
+from data import DataFetcher
+from providers import InMemoryProvider, LocalProvider, RecordingProvider
+from shared_prices import SharedPriceStore
+from benchmark import random_walk_prices
+import pandas as pd
+import numpy as np
+import tempfile
+
+
+def make_universe():
+    prices = random_walk_prices(['SPY', 'TLT', 'UBER'], pd.bdate_range('2019-01-01', '2020-12-31'), seed=5,
+                                drift=0, vol=0.01)
+    prices.loc[:'2019-05-09', 'UBER'] = np.nan
+    return prices
+
+
+def test_record_and_replay():
+    print("Testing recording provider and offline replay...")
+    universe = make_universe()
+    live = InMemoryProvider(universe, constituents=['SPY', 'UBER'], market_caps={'SPY': 5e11, 'UBER': 1e11})
+
+    with tempfile.TemporaryDirectory() as root:
+        recorder = DataFetcher(RecordingProvider(live, root))
+        recorded = recorder.load_prices(('SPY', 'TLT', 'UBER'), '2019-01-01', '2021-01-01')
+        recorder.provider.fetch_constituents()
+        for t in ['SPY', 'UBER']:
+            recorder.provider.fetch_market_cap(t)
+
+        offline = DataFetcher(LocalProvider(root))
+        assert offline.store is None
+        replayed = offline.load_prices(('SPY', 'TLT', 'UBER'), '2019-01-01', '2021-01-01')
+        pd.testing.assert_frame_equal(replayed, recorded, check_freq=False, check_names=False)
+        assert offline.provider.fetch_constituents() == ['SPY', 'UBER']
+        assert offline.provider.fetch_market_cap('UBER') == 1e11
+
+        # 子區間
+        sub = offline.load_prices(('UBER',), '2020-01-01', '2020-07-01')
+        assert sub.index[0] >= pd.Timestamp('2020-01-01') and list(sub.columns) == ['UBER']
+    print("SUCCESS: Recorded fixtures replay identically offline.")
+
+
+def test_cache_per_provider():
+    print("Testing fetch caches keyed by provider...")
+    dates = pd.bdate_range('2020-01-01', periods=50)
+    ones = pd.DataFrame(1.0, index=dates, columns=['AAA', 'BBB'])
+    with tempfile.TemporaryDirectory() as root:
+        shared = SharedPriceStore(root)
+        first = DataFetcher(InMemoryProvider(ones, market_caps={'AAA': 2e9, 'BBB': 1e9}), store=None, shared=shared)
+        second = DataFetcher(InMemoryProvider(ones * 10, constituents=['BBB'], market_caps={'BBB': 1e9}),
+                             store=None, shared=shared)
+        tickers = ('AAA', 'BBB')
+
+        # 相同代碼與期間、不同資料源：各自取得自己的資料
+        assert first.fetch_data(tickers, '2020-01-01', '2020-06-01').iloc[0, 0] == 1.0
+        assert second.fetch_data(tickers, '2020-01-01', '2020-06-01').iloc[0, 0] == 10.0
+        assert first.fetch_shared(tickers, '2020-01-01', '2020-06-01')[0].to_frame().iloc[0, 0] == 1.0
+        assert second.fetch_shared(tickers, '2020-01-01', '2020-06-01')[0].to_frame().iloc[0, 0] == 10.0
+        assert first.fetch_sp500_tickers() == ['AAA', 'BBB'] and second.fetch_sp500_tickers() == ['BBB']
+        assert first.get_top_n_by_market_cap(1)[0] == ['AAA'] and second.get_top_n_by_market_cap(1)[0] == ['BBB']
+
+        # 同一個資料源仍命中快取
+        assert first.fetch_data(tickers, '2020-01-01', '2020-06-01') is first.fetch_data(tickers, '2020-01-01', '2020-06-01')
+        clear_all()
+    print("SUCCESS: Each provider got its own cached results.")
+
+
+if __name__ == "__main__":
+    test_record_and_replay()
+    test_cache_per_provider()
@@ -0,0 +1,145 @@
+from strategy import MomentumStrategy
+from analytics import rolling_mean_std
+from benchmark import random_walk_prices
+import pandas as pd
+import numpy as np
+
+
+def make_prices(n=12, seed=21):
+    names = [f"R{i:02d}" for i in range(n)] + ['TLT', 'GLD']
+    # 各檔波動率不同，讓波動率調整與權重有區別
+    scale = np.linspace(0.005, 0.03, n + 2)
+    prices = random_walk_prices(names, pd.bdate_range('2016-01-01', '2020-12-31'), seed,
+                                drift=0.0005 * scale, vol=scale)
+    prices.iloc[:200, 2] = np.nan      # 較晚上市
+    prices.iloc[600:605, 4] = np.nan   # 停牌數日
+    return prices
+
+
+def test_volatility_matches_pandas_rolling_std():
+    print("Testing cumulative-sum rolling volatility...")
+    prices = make_prices()
+    volatility = MomentumStrategy(prices).volatility('ME', 21)
+    expected = prices.pct_change(fill_method=None).rolling(21).std() * np.sqrt(252)
+    expected = expected.iloc[prices.index.searchsorted(volatility.index, side='right') - 1]
+    np.testing.assert_allclose(volatility.to_numpy(), expected.to_numpy(), rtol=1e-9, atol=1e-12)
+    assert volatility.index.equals(MomentumStrategy(prices).resample('ME').index)
+
+    # 只取部分列的結果與完整滾動矩陣相同
+    r = prices.pct_change(fill_method=None).to_numpy()[1:]
+    rows = np.array([0, 19, 20, 21, 500, len(r) - 1])
+    full_mean, full_std = rolling_mean_std(r, 21)
+    mean, std = rolling_mean_std(r, 21, rows)
+    np.testing.assert_allclose(std, full_std[rows], equal_nan=True)
+    np.testing.assert_allclose(mean, full_mean[rows], equal_nan=True)
+    print("SUCCESS: volatility equals rolling().std() at every period end")
+
+
+def test_skip_recent_periods():
+    prices = make_prices()
+    strategy = MomentumStrategy(prices)
+    monthly = strategy.resample('ME')
+    returns = strategy.lookback_returns('ME', [12], skip=1)[12]
+    expected = monthly.shift(1) / monthly.shift(12) - 1
+    pd.testing.assert_frame_equal(returns, expected)
+    # skip=0 仍沿用原本的快取項目與結果
+    pd.testing.assert_frame_equal(strategy.lookback_returns('ME', [12])[12], monthly.pct_change(12))
+    for bad in (12, -1):
+        try:
+            strategy.lookback_returns('ME', [12], skip=bad)
+        except ValueError:
+            continue
+        raise AssertionError("skip 超出範圍應拋出 ValueError")
+
+
+def test_vol_adjusted_ranking_and_inverse_vol_weights():
+    print("Testing vol-adjusted ranking and inverse-volatility weights...")
+    prices = make_prices()
+    risky = [c for c in prices.columns if c.startswith('R')]
+    safe = ['TLT', 'GLD']
+    strategy = MomentumStrategy(prices)
+    params = dict(top_n=3, frequency='ME', lookbacks=[3, 6], weights=[1, 1], vol_window=42)
+
+    raw, _ = strategy.calculate_momentum('ME', [3, 6], [1, 1])
+    adjusted, _ = strategy.calculate_momentum('ME', [3, 6], [1, 1], ranking='vol_adjusted', vol_window=42)
+    volatility = strategy.volatility('ME', 42)
+    pd.testing.assert_frame_equal(adjusted, raw / volatility)
+
+    equal = strategy.generate_signals(risky, safe, **params)
+    by_vol = strategy.generate_signals(risky, safe, ranking='vol_adjusted', **params)
+    inverse = strategy.generate_signals(risky, safe, weighting='inverse_vol', **params)
+    assert not equal.equals(by_vol)
+    # 權重方式不影響選股與防禦資產的判斷，只改變名額的比重
+    pd.testing.assert_frame_equal(inverse > 0, equal > 0)
+    np.testing.assert_allclose(inverse.sum(axis=1), equal.sum(axis=1))
+
+    # 逐列對照：通過絕對動能的入選者權重 ∝ 1 / 波動率
+    checked = 0
+    for label in equal.index[1:]:
+        decided = equal.index[equal.index.get_loc(label) - 1]
+        vol = volatility.loc[decided, risky]
+        top = raw.loc[decided, risky].dropna().sort_values(ascending=False).head(3)
+        if len(top) < 3 or vol[top.index].isna().any():
+            continue
+        slot = (1 / vol[top.index]) / (1 / vol[top.index]).sum()
+        for asset, share in slot.items():
+            if raw.loc[decided, asset] > 0:
+                assert np.isclose(inverse.loc[label, asset], share)
+        checked += 1
+    assert checked > 20
+    print(f"SUCCESS: {checked} rebalances checked against the 1/vol reference")
+
+
+def test_latest_signal_matches_history():
+    prices = make_prices()
+    risky = [c for c in prices.columns if c.startswith('R')]
+    strategy = MomentumStrategy(prices)
+    options = dict(top_n=2, frequency='ME', lookbacks=[6, 12], weights=[1, 1], skip=1, ranking='vol_adjusted',
+                   weighting='inverse_vol', vol_window=42, cash_protection=True)
+    latest = strategy.get_latest_signal(risky, ['TLT', 'GLD'], today='2030-01-01', **options)
+
+    # 最後一期的持倉（shift 前）= 延伸一期後的信號最後一列
+    extended = prices.reindex(prices.index.append(pd.DatetimeIndex(['2021-01-29'])))
+    signals = MomentumStrategy(extended).generate_signals(risky, ['TLT', 'GLD'], **options)
+    expected = {a: w for a, w in signals.iloc[-1].items() if w > 0}
+    if sum(expected.values()) < 1 - 1e-9:
+        expected['CASH'] = 1 - sum(expected.values())
+    assert latest.keys() == expected.keys()
+    assert all(np.isclose(latest[a], expected[a]) for a in expected)
+
+
+def test_latest_signal_all_risky_nan():
+    prices = make_prices()
+    risky = [c for c in prices.columns if c.startswith('R')]
+    # 攻擊型資產最後一年停牌：動能全為 NaN，防禦型資產照常
+    prices.loc['2020-01-01':, risky] = np.nan
+    strategy = MomentumStrategy(prices)
+    options = dict(top_n=2, frequency='ME', lookbacks=[3, 6], weights=[1, 1], today='2030-01-01')
+    engine = strategy.get_latest_signal(risky, ['TLT', 'GLD'], **options)
+    full = strategy.get_latest_signal(risky, ['TLT', 'GLD'], weighting='inverse_vol', **options)
+    assert engine == full == {"Error": "攻擊型資產動能均為 NaN"}, (engine, full)
+
+
+def test_latest_signal_paths_agree_on_nan_slots():
+    prices = make_prices()
+    risky = [c for c in prices.columns if c.startswith('R')]
+    # 最後一年只剩兩檔攻擊型資產有報價：Top 4 有兩個名額沒有有效動能
+    prices.loc['2020-01-01':, risky[2:]] = np.nan
+    strategy = MomentumStrategy(prices)
+    for cash in (False, True):
+        options = dict(top_n=4, frequency='ME', lookbacks=[3, 6], weights=[1, 1], cash_protection=cash,
+                       today='2030-01-01')
+        engine = strategy.get_latest_signal(risky, ['TLT', 'GLD'], **options)
+        # max_correlation=1 不排除任何標的，但改走完整動能矩陣的路徑
+        full = strategy.get_latest_signal(risky, ['TLT', 'GLD'], max_correlation=1.0, **options)
+        assert engine == full, (engine, full)
+        assert np.isclose(sum(engine.values()), 1.0)
+
+
+if __name__ == "__main__":
+    test_volatility_matches_pandas_rolling_std()
+    test_skip_recent_periods()
+    test_vol_adjusted_ranking_and_inverse_vol_weights()
+    test_latest_signal_matches_history()
+    test_latest_signal_all_risky_nan()
+    test_latest_signal_paths_agree_on_nan_slots()
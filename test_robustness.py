@@ -0,0 +1,73 @@
+from robustness import run_robustness, block_bootstrap, start_date_subsample, path_metrics, periods_per_year
+from backtest import Backtest
+import pandas as pd
+import numpy as np
+import time
+
+
+def make_returns(periods=240, freq='ME', seed=12):
+    index = pd.date_range('2005-01-31', periods=periods, freq=freq)
+    return pd.Series(np.random.default_rng(seed).normal(0.008, 0.04, periods), index=index)
+
+
+def test_path_metrics_match_calculate_metrics():
+    print("Testing batched path metrics against calculate_metrics...")
+    returns = make_returns(periods=120)
+    metrics = path_metrics(returns.to_numpy()[None, :], periods_per_year(returns.index))
+
+    # 在最前面補上起點（與 run_backtest 相同，第一期報酬為 0），逐筆計算結果應一致
+    start = returns.index[0] - pd.offsets.MonthEnd(1)
+    values = pd.concat([pd.Series([1.0], index=[start]), (1 + returns).cumprod()])
+    expected = Backtest(pd.DataFrame(), pd.DataFrame()).calculate_metrics(values)
+    assert np.isclose(metrics['Sharpe Ratio'][0], expected['Sharpe Ratio'])
+    assert np.isclose(metrics['MDD'][0], expected['MDD'])
+    assert np.isclose(metrics['CAGR'][0], expected['CAGR'], rtol=1e-2)  # 期數年 vs 日曆年
+    assert periods_per_year(make_returns(freq='W-FRI').index) == 52
+    print("Test Passed: vectorised metrics agree with the single-path version.")
+
+
+def test_resamplers_draw_from_history():
+    print("Testing block bootstrap and start-date subsampling...")
+    values = np.arange(100, dtype=float)
+    rng = np.random.default_rng(0)
+    paths = block_bootstrap(values, 500, 12, rng)
+    assert paths.shape == (500, 100)
+    # 區塊內為連續（循環）期數
+    steps = np.diff(paths, axis=1)[:, :11]
+    assert np.isin(steps, [1, -99]).all()
+
+    windows = start_date_subsample(values, 500, 60, rng)
+    assert windows.shape == (500, 60)
+    assert (np.diff(windows, axis=1) == 1).all() and windows[:, 0].max() <= 40
+    print("Test Passed: paths are stitched from real contiguous history.")
+
+
+def test_reproducible_and_fast():
+    print("Testing 10k paths over 20 years of monthly returns...")
+    returns = make_returns()
+    t0 = time.perf_counter()
+    result = run_robustness(returns, n_paths=10000, seed=7)
+    elapsed = time.perf_counter() - t0
+    print(f"  {elapsed:.2f}s")
+    assert elapsed < 1.0
+    assert result['metrics'].shape == (10000, 3)
+    assert list(result['bands'].index) == list(returns.index)
+    assert result['bands'].diff(axis=1).iloc[:, 1:].ge(0).all().all()  # 分位數由低到高
+
+    # 與執行緒數無關、同 seed 可重現；不同 seed 不同
+    same = run_robustness(returns, n_paths=10000, seed=7, max_workers=1)
+    pd.testing.assert_frame_equal(result['metrics'], same['metrics'])
+    other = run_robustness(returns, n_paths=10000, seed=8)
+    assert not result['metrics'].equals(other['metrics'])
+
+    sub = run_robustness(returns, n_paths=2000, method='subsample', length=120)
+    assert len(sub['bands']) == 120
+    low, high = sub['summary'].loc[0.05, 'CAGR'], sub['summary'].loc[0.95, 'CAGR']
+    assert low < high
+    print("Test Passed: reproducible distributions in well under a second.")
+
+
+if __name__ == "__main__":
+    test_path_metrics_match_calculate_metrics()
+    test_resamplers_draw_from_history()
+    test_reproducible_and_fast()
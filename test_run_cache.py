@@ -0,0 +1,75 @@
+from run_cache import RunCache, fingerprint, price_fingerprint, run_key
+from price_matrix import PriceMatrix
+from holdings import SparseHoldings
+from benchmark import random_walk_prices
+import pandas as pd
+import numpy as np
+import tempfile
+import os
+import time
+
+
+def make_prices():
+    return random_walk_prices(['A', 'B', 'SPY', 'TLT'], pd.bdate_range('2020-01-01', periods=300), seed=23,
+                              drift=0.0005, vol=0.01)
+
+
+def test_keys_follow_config_and_price_content():
+    print("Testing content-addressed keys...")
+    prices = make_prices()
+    config = {'lookbacks': [3, 6], 'top_n': 2, 'frequency': 'ME', 'membership': None}
+    base = run_key(config, price_fingerprint(prices))
+    # dict 順序、同內容的另一個物件（含 PriceMatrix、欄優先陣列）得到相同的鍵
+    assert run_key(dict(reversed(list(config.items()))), price_fingerprint(prices.copy())) == base
+    matrix = PriceMatrix.from_frame(prices, dtype=np.float64)
+    assert price_fingerprint(matrix) == price_fingerprint(prices)
+    assert fingerprint(np.ascontiguousarray(matrix.values)) == fingerprint(matrix.values)
+    # 任何設定或價格的變動都得到新鍵
+    assert run_key({**config, 'top_n': 3}, price_fingerprint(prices)) != base
+    changed = prices.copy()
+    changed.iloc[-1, 0] *= 1.0000001
+    assert run_key(config, price_fingerprint(changed)) != base
+    assert run_key(config, price_fingerprint(prices.iloc[:-1])) != base
+    assert price_fingerprint(prices.rename(columns={'A': 'AA'})) != price_fingerprint(prices)
+    print("SUCCESS: keys change exactly when config or prices change")
+
+
+def test_put_get_list_and_lru_eviction():
+    print("Testing run cache storage and eviction...")
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = RunCache(tmp, max_bytes=10**9)
+        prices = make_prices()
+        holdings = SparseHoldings.from_dense(pd.DataFrame({'A': [0.0, 1.0], 'B': [0.5, 0.0]},
+                                                          index=prices.index[[0, 20]]))
+        payload = {'holdings': holdings, 'results': prices[['SPY']], 'metrics': {'CAGR': 0.1}}
+        assert cache.get('missing') is None
+
+        meta = cache.put('k1', payload, config={'top_n': 1}, summary={'CAGR': 0.1}, label='first')
+        restored = cache.get('k1')
+        pd.testing.assert_frame_equal(restored['results'], prices[['SPY']])
+        pd.testing.assert_frame_equal(restored['holdings'].to_dense(), holdings.to_dense())
+        assert cache.meta('k1')['config'] == {'top_n': 1} and meta['bytes'] > 0
+
+        # 容量只夠兩筆：寫入第三筆時淘汰最久未使用的（k2），最近讀取過的 k1 保留
+        cache.max_bytes = int(meta['bytes'] * 2.5)
+        time.sleep(0.02)
+        cache.put('k2', payload, label='second')
+        time.sleep(0.02)
+        cache.get('k1')
+        time.sleep(0.02)
+        cache.put('k3', payload, label='third')
+        assert [m['key'] for m in cache.list_runs()] == ['k3', 'k1']
+        assert cache.total_bytes() <= cache.max_bytes
+
+        # 損毀的檔案視為未命中並刪除
+        with open(os.path.join(tmp, 'k3.pkl'), 'wb') as f:
+            f.write(b'not a pickle')
+        assert cache.get('k3') is None and cache.meta('k3') is None
+        cache.clear()
+        assert cache.list_runs() == [] and not [n for n in os.listdir(tmp) if n.endswith('.tmp')]
+    print("SUCCESS: LRU eviction keeps recently used runs")
+
+
+if __name__ == "__main__":
+    test_keys_follow_config_and_price_content()
+    test_put_get_list_and_lru_eviction()
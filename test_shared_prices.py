@@ -0,0 +1,148 @@
+from shared_prices import SharedPriceStore, SharedPriceMatrix
+from data import DataFetcher
+from providers import InMemoryProvider
+from strategy import MomentumStrategy
+from backtest import Backtest
+from benchmark import random_walk_prices
+import pandas as pd
+import numpy as np
+import concurrent.futures
+import os
+import pickle
+import tempfile
+import time
+
+
+class CountingProvider(InMemoryProvider):
+    def __init__(self, prices):
+        super().__init__(prices)
+        self.calls = 0
+
+    def download_prices(self, tickers, start_date, end_date):
+        self.calls += 1
+        return super().download_prices(tickers, start_date, end_date)
+
+
+def make_prices(n=40, seed=18):
+    names = [f"R{i:02d}" for i in range(n)] + ['TLT', 'GLD']
+    prices = random_walk_prices(names, pd.bdate_range('2016-01-01', '2021-12-31'), seed)
+    prices.iloc[:300, 3] = np.nan
+    return prices
+
+
+def _column_sum(matrix, ticker):
+    return float(np.nansum(matrix.column(ticker)))
+
+
+def test_publish_attach_is_zero_copy_and_read_only():
+    print("Testing memory-mapped shared price matrix...")
+    prices = make_prices()
+    with tempfile.TemporaryDirectory() as root:
+        store = SharedPriceStore(root)
+        key = store.make_key('test', tuple(prices.columns))
+        assert store.attach(key) is None
+        store.publish(key, prices, meta={'source': 'unit'})
+
+        matrix = store.attach(key)
+        assert isinstance(matrix, SharedPriceMatrix) and matrix.meta['source'] == 'unit'
+        assert isinstance(matrix.values, np.memmap) and not matrix.values.flags.writeable
+        frame = matrix.to_frame()
+        pd.testing.assert_frame_equal(frame, prices, check_freq=False)
+        assert np.shares_memory(frame.to_numpy(), matrix.values)
+
+        for mutate in (lambda: matrix.values.__setitem__((0, 0), 1.0), lambda: matrix.write(prices.iloc[:1]),
+                       matrix.compact):
+            try:
+                mutate()
+            except ValueError:
+                continue
+            raise AssertionError("共用矩陣應為唯讀")
+
+        # pickle 只帶路徑，工作行程重新映射同一份檔案
+        payload = pickle.dumps(matrix)
+        assert len(payload) < 1000
+        with concurrent.futures.ProcessPoolExecutor(max_workers=2) as executor:
+            sums = list(executor.map(_column_sum, [matrix] * 2, ['R00', 'R03']))
+        assert np.isclose(sums[0], prices['R00'].sum()) and np.isclose(sums[1], prices['R03'].sum())
+    print(f"SUCCESS: {matrix.nbytes / 1e6:.1f} MB mapped, pickled handle {len(payload)} bytes")
+
+
+def test_atomic_swap_and_prune():
+    prices = make_prices(n=5)
+    with tempfile.TemporaryDirectory() as root:
+        store = SharedPriceStore(root)
+        store.publish('k', prices)
+        old = store.attach('k')
+        newer = prices * 2
+        store.publish('k', newer)
+
+        # 已映射的舊版本不受新版本影響；新的 attach 取得新資料
+        assert np.allclose(old.to_frame(), prices, equal_nan=True)
+        assert np.allclose(store.attach('k').to_frame(), newer, equal_nan=True)
+        assert store.prune('k', keep=1) == [old.version]
+        assert np.allclose(old.to_frame(), prices, equal_nan=True)
+
+        assert store.attach('k', max_age=-1) is None
+        store.publish('k', prices)
+        store.expire()
+        assert store.attach('k') is None
+        assert os.listdir(os.path.join(root, 'k')) == []
+
+
+def test_evict_stale_keys():
+    prices = make_prices(n=3)
+    with tempfile.TemporaryDirectory() as root:
+        store = SharedPriceStore(root)
+        store.publish('old', prices)
+        store.publish('new', prices)
+        # 把 old 鍵的所有項目改成兩天前
+        stale = time.time() - 2 * 86400
+        for dirpath, dirnames, filenames in os.walk(os.path.join(root, 'old')):
+            for name in dirnames + filenames:
+                os.utime(os.path.join(dirpath, name), (stale, stale))
+        os.utime(os.path.join(root, 'old'), (stale, stale))
+
+        assert store.evict() == ['old']
+        assert sorted(os.listdir(root)) == ['new']
+        assert store.attach('new') is not None
+
+
+def test_fetch_shared_matches_fetch_data():
+    print("Testing DataFetcher.fetch_shared against fetch_data...")
+    prices = make_prices()
+    with tempfile.TemporaryDirectory() as root:
+        provider = CountingProvider(prices)
+        fetcher = DataFetcher(provider, store=None, shared=SharedPriceStore(root))
+        tickers = tuple(prices.columns) + ('GHOST',)
+        expected, expected_report = fetcher.load_prices(tickers, '2016-01-01', '2021-06-30', return_report=True)
+
+        DataFetcher._fetch_shared.clear()
+        matrix, report = fetcher.fetch_shared(tickers, '2016-01-01', '2021-06-30')
+        pd.testing.assert_frame_equal(matrix.to_frame(), expected, check_freq=False)
+        assert report['missing'] == expected_report['missing'] == ['GHOST']
+
+        # 同一行程：同一個物件；另一個行程（快取已清空）：直接映射，不重新下載
+        assert fetcher.fetch_shared(tickers, '2016-01-01', '2021-06-30')[0] is matrix
+        DataFetcher._fetch_shared.clear()
+        calls = provider.calls
+        again, _ = fetcher.fetch_shared(tickers, '2016-01-01', '2021-06-30')
+        assert provider.calls == calls and again.version == matrix.version
+
+        # 策略與回測可直接使用共用矩陣，結果與 DataFrame 相同
+        params = dict(top_n=3, frequency='ME', lookbacks=[3, 6], weights=[1, 1])
+        risky = [c for c in expected.columns if c.startswith('R')]
+        from_shared = MomentumStrategy(matrix).generate_signals(risky, ['TLT', 'GLD'], **params)
+        from_frame = MomentumStrategy(expected).generate_signals(risky, ['TLT', 'GLD'], **params)
+        pd.testing.assert_frame_equal(from_shared, from_frame)
+        a = Backtest(matrix, from_shared).run_backtest()
+        b = Backtest(expected, from_frame).run_backtest()
+        pd.testing.assert_frame_equal(a, b)
+        DataFetcher._fetch_shared.clear()
+    print("SUCCESS: shared matrix is bit-identical to fetch_data")
+
+
+if __name__ == "__main__":
+    test_publish_attach_is_zero_copy_and_read_only()
+    test_atomic_swap_and_prune()
+    test_evict_stale_keys()
+    test_fetch_shared_matches_fetch_data()
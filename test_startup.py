@@ -0,0 +1,41 @@
+from startup_profile import (import_profile, render_profile, parse_importtime, APP_MODULES, HEAVY_MODULES,
+                             IMPORT_BUDGET_SECONDS, RENDER_BUDGET_SECONDS)
+
+
+def test_parse_importtime():
+    sample = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |     _io\n"
+        "import time:      1500 |       2300 |   pandas.core\n"
+        "import time:       400 |       2700 | pandas\n"
+    )
+    df = parse_importtime(sample)
+    assert list(df['module']) == ['_io', 'pandas.core', 'pandas']
+    assert list(df['depth']) == [2, 1, 0]
+    assert df['cumulative_ms'].iloc[-1] == 2.7
+
+
+def test_import_budget_and_lazy_dependencies():
+    print("Testing cold import of the app modules...")
+    profile = import_profile()
+    heavy = [m for m in HEAVY_MODULES if m in profile['loaded']]
+    assert not heavy, f"啟動時不應載入 {heavy}"
+    assert 'streamlit' not in profile['loaded']
+    assert all(m in profile['loaded'] for m in APP_MODULES)
+    assert profile['seconds'] < IMPORT_BUDGET_SECONDS, profile['seconds']
+    print(f"SUCCESS: {profile['seconds']:.2f}s, top packages:\n{profile['packages'].head(5)}")
+
+
+def test_first_render_budget():
+    print("Testing first render of app.py...")
+    render = render_profile()
+    assert not render['exception'], render['exception']
+    assert not render['heavy'], f"第一次渲染不應載入 {render['heavy']}"
+    assert render['seconds'] < RENDER_BUDGET_SECONDS, render['seconds']
+    print(f"SUCCESS: first render in {render['seconds']:.2f}s")
+
+
+if __name__ == "__main__":
+    test_parse_importtime()
+    test_import_budget_and_lazy_dependencies()
+    test_first_render_budget()
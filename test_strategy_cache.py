@@ -0,0 +1,44 @@
+from strategy import MomentumStrategy
+from benchmark import random_walk_prices
+import pandas as pd
+
+
+def make_prices():
+    return random_walk_prices(list('ABCDEF'), pd.bdate_range('2015-01-01', periods=1000), seed=4, drift=0, vol=0.01)
+
+
+def test_momentum_cache_reuse():
+    print("Testing memoized resampling and lookback returns...")
+    prices = make_prices()
+    strategy = MomentumStrategy(prices, cache_size=8)
+
+    first, _ = strategy.calculate_momentum('ME', [3, 6, 9], [34, 33, 33])
+    assert strategy.cache_stats['misses'] == 4  # 1 次重新取樣 + 3 個回顧期
+
+    # 相同回顧期、不同權重：全部命中
+    strategy.calculate_momentum('ME', [3, 6, 9], [1, 1, 1])
+    assert strategy.cache_stats['misses'] == 4
+
+    # 部分重疊：只新算 12
+    strategy.calculate_momentum('ME', [6, 12], [1, 1])
+    assert strategy.cache_stats['misses'] == 5
+
+    # 結果與未快取的計算一致
+    fresh, _ = MomentumStrategy(prices).calculate_momentum('ME', [3, 6, 9], [34, 33, 33])
+    pd.testing.assert_frame_equal(first, fresh)
+
+    # 超過容量時淘汰最舊項目
+    for lb in range(20, 30):
+        strategy.lookback_returns('W-FRI', [lb])
+    assert len(strategy._cache) == 8
+
+    # 換掉價格物件後快取失效
+    strategy.prices = prices * 2
+    doubled, _ = strategy.calculate_momentum('ME', [3], [1])
+    expected, _ = MomentumStrategy(prices * 2).calculate_momentum('ME', [3], [1])
+    pd.testing.assert_frame_equal(doubled, expected)
+    print("SUCCESS: Cache reused across calls and bounded in size.")
+
+
+if __name__ == "__main__":
+    test_momentum_cache_reuse()
@@ -0,0 +1,130 @@
+from data import DataFetcher
+from price_store import PriceStore
+from providers import InMemoryProvider
+from strategy import MomentumStrategy, StreamingPeriodReturns
+from benchmark import random_walk_prices
+import pandas as pd
+import numpy as np
+import tempfile
+import time
+
+
+class SlowProvider(InMemoryProvider):
+    """每批下載耗時固定；flaky 中的代碼第一次會讓整批失敗。"""
+
+    def __init__(self, prices, delay=0.1, flaky=()):
+        super().__init__(prices)
+        self.delay = delay
+        self.flaky = set(flaky)
+
+    def download_prices(self, tickers, start_date, end_date):
+        time.sleep(self.delay)
+        bad = [t for t in tickers if t in self.flaky]
+        if bad:
+            self.flaky.difference_update(bad)
+            raise ConnectionError(f"rate limited on {bad}")
+        return super().download_prices(tickers, start_date, end_date)
+
+
+def make_prices(n=40, periods=700):
+    names = [f"T{i:03d}" for i in range(n)]
+    data = random_walk_prices(names, pd.bdate_range('2019-01-01', periods=periods), seed=24, drift=0.0003, vol=0.01)
+    data.iloc[:200, 3] = np.nan  # 晚上市的標的
+    return data
+
+
+def assert_primed_matches(data, stream, frequency, lookbacks, skip):
+    primed, plain = MomentumStrategy(data), MomentumStrategy(data)
+    assert stream.prime(primed)
+    pd.testing.assert_frame_equal(primed.resample(frequency), plain.resample(frequency))
+    for lb, returns in primed.lookback_returns(frequency, lookbacks, skip).items():
+        pd.testing.assert_frame_equal(returns, plain.lookback_returns(frequency, [lb], skip)[lb])
+    # 快取已預先放入：產生信號時重新取樣與回報率全部命中
+    assert primed.cache_stats['misses'] == 0
+    risky = [c for c in data.columns if c != 'T000']
+    params = dict(top_n=3, frequency=frequency, lookbacks=lookbacks, weights=[1] * len(lookbacks), skip=skip)
+    pd.testing.assert_frame_equal(primed.generate_signals(risky, ['T000'], **params),
+                                  plain.generate_signals(risky, ['T000'], **params))
+
+
+def test_ready_batches_without_store():
+    print("Testing streamed batches without a price store...")
+    prices = make_prices()
+    for compact in (False, True):
+        fetcher = DataFetcher(SlowProvider(prices, delay=0.05, flaky=['T011']), store=None, max_concurrency=3)
+        stream = StreamingPeriodReturns('ME', [3, 6], skip=1)
+        calls = []
+
+        def on_ready(frame, progress):
+            calls.append((list(frame.columns), dict(progress)))
+            stream.add(frame)
+
+        data, report = fetcher.load_prices(tuple(prices.columns), '2019-01-01', '2022-01-01', return_report=True,
+                                           compact=compact, dtype=np.float64, on_ready=on_ready)
+        frame = data.to_frame() if compact else data
+        # 每批一次回呼；T011 所在的整批第一次失敗，重試時才交出
+        assert len(calls) == len(report['batches'])
+        assert [c[1]['batches_done'] for c in calls] == list(range(1, len(calls) + 1))
+        first_round = sum(not b['retry'] for b in report['batches'])
+        assert ['T011' in cols for cols, _ in calls].index(True) >= first_round
+        assert sorted(c for cols, _ in calls for c in cols) == list(frame.columns)
+        assert calls[-1][1]['tickers_ready'] == calls[-1][1]['tickers'] == len(prices.columns)
+        assert_primed_matches(frame, stream, 'ME', [3, 6], 1)
+    print(f"SUCCESS: {len(calls)} callbacks, streamed returns match the full-table computation")
+
+
+def test_ready_batches_with_store():
+    print("Testing streamed batches with a partially filled price store...")
+    prices = make_prices()
+    with tempfile.TemporaryDirectory() as tmp:
+        store = PriceStore(tmp)
+        # 前半已收錄到較早的日期：這些標的只補抓尾段，後半整段下載
+        DataFetcher(InMemoryProvider(prices), store=store).load_prices(
+            tuple(prices.columns[:20]), '2019-01-01', '2021-06-01')
+        fetcher = DataFetcher(SlowProvider(prices, delay=0.05), store=store, max_concurrency=2)
+        stream = StreamingPeriodReturns('W-FRI', [4, 12])
+        calls = []
+
+        def on_ready(frame, progress):
+            calls.append(dict(progress))
+            stream.add(frame)
+
+        data = fetcher.load_prices(tuple(prices.columns), '2019-01-01', '2022-01-01', compact=True,
+                                   dtype=np.float32, on_ready=on_ready)
+        assert calls[-1]['tickers_ready'] == len(data.columns) == len(prices.columns)
+        assert_primed_matches(data.to_frame(), stream, 'W-FRI', [4, 12], 0)
+
+        # 全部由本機提供時不下載，分塊交出後即完成
+        calls.clear()
+        stream = StreamingPeriodReturns('ME', [6])
+        data = fetcher.load_prices(tuple(prices.columns), '2019-01-01', '2022-01-01', compact=True,
+                                   dtype=np.float64, on_ready=on_ready)
+        assert calls and all(c['batches'] == 0 for c in calls)
+        assert_primed_matches(data.to_frame(), stream, 'ME', [6], 0)
+    print("SUCCESS: stored and downloaded tickers both stream")
+
+
+def test_compute_overlaps_downloads():
+    print("Testing pipelined download and compute...")
+    prices = make_prices(n=20)
+    delay, work = 0.2, 0.1
+
+    def on_ready(frame, progress):
+        time.sleep(work)  # 模擬每批的計算
+
+    fetcher = DataFetcher(SlowProvider(prices, delay=delay), store=None, max_concurrency=2)
+    fetcher.BATCH_SIZE = 2  # 10 批、每波 2 批並行
+    batches = len(prices.columns) // fetcher._batch_size(len(prices.columns))
+    t0 = time.perf_counter()
+    fetcher.load_prices(tuple(prices.columns), '2019-01-01', '2022-01-01', on_ready=on_ready)
+    elapsed = time.perf_counter() - t0
+    download, compute = delay * batches / 2, work * batches
+    # 計算與其他批次的下載重疊：總耗時接近 max(下載, 計算)，而非兩者相加
+    assert elapsed < 0.8 * (download + compute), elapsed
+    print(f"SUCCESS: {elapsed:.2f}s vs {download + compute:.2f}s sequential")
+
+
+if __name__ == "__main__":
+    test_ready_batches_without_store()
+    test_ready_batches_with_store()
+    test_compute_overlaps_downloads()
@@ -0,0 +1,55 @@
+from strategy import MomentumStrategy
+from backtest import Backtest
+from sweep import build_grid, run_sweep
+from benchmark import random_walk_prices
+import pandas as pd
+import time
+
+
+def make_prices(n_risky=50, years=12, seed=3):
+    names = [f"R{i:02d}" for i in range(n_risky)] + ['TLT', 'IEF', 'GLD']
+    return random_walk_prices(names, pd.bdate_range('2010-01-01', periods=252 * years), seed, vol=0.015)
+
+
+def test_sweep_matches_single_run():
+    print("Testing sweep results against a single backtest...")
+    prices = make_prices(n_risky=10, years=8)
+    risky = [c for c in prices.columns if c.startswith('R')]
+    safe = ['TLT', 'IEF']
+    grid = build_grid([[3, 6, 9], [12], [1, 3]], [[34, 33, 33], [1], [1, 1]], [1, 2], ['ME'], [False, True])
+    assert len(grid) == 3 * 2 * 2
+
+    table = run_sweep(prices, risky, safe, grid, start_date='2012-01-01', max_workers=1)
+    assert len(table) == len(grid)
+    assert table['Sharpe Ratio'].is_monotonic_decreasing
+
+    # 任取一組與 app.py 的單次回測流程比對
+    row = table[(table['lookbacks'] == '3, 6, 9') & (table['top_n'] == 2) & (table['cash_protection'])].iloc[0]
+    strategy = MomentumStrategy(prices)
+    signals = strategy.generate_signals(risky, safe, top_n=2, frequency='ME', lookbacks=[3, 6, 9], weights=[34, 33, 33], cash_protection=True)
+    start = max(pd.Timestamp('2012-01-01'), signals.index[0])
+    backtest = Backtest(prices, signals.loc[start:], 10000.0)
+    results = backtest.run_backtest().loc[start:]
+    metrics = backtest.calculate_metrics(results['Portfolio Value'])
+    assert row['CAGR'] == metrics['CAGR'] and row['Sharpe Ratio'] == metrics['Sharpe Ratio']
+    print("SUCCESS: Sweep row matches the single-run pipeline.")
+
+
+def test_sweep_process_pool():
+    prices = make_prices()
+    risky = [c for c in prices.columns if c.startswith('R')]
+    lookback_sets = [[lb] for lb in range(1, 13)] + [[a, b] for a in (1, 3) for b in (6, 9, 12)]
+    weight_sets = [[1], [1, 1], [2, 1], [1, 2]]
+    grid = build_grid(lookback_sets, weight_sets, [1, 2, 3, 5, 10], ['ME'], [False, True])
+
+    t0 = time.perf_counter()
+    table = run_sweep(prices, risky, ['TLT', 'IEF', 'GLD'], grid, start_date='2012-01-01')
+    elapsed = time.perf_counter() - t0
+    print(f"{len(grid)} configurations over {len(risky)} tickers: {elapsed:.2f}s")
+    assert len(table) == len(grid)
+    assert table['Error'].eq('').all()
+
+
+if __name__ == "__main__":
+    test_sweep_matches_single_run()
+    test_sweep_process_pool()
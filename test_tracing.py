@@ -0,0 +1,140 @@
+import tracing
+from data import DataFetcher
+from providers import InMemoryProvider
+from strategy import MomentumStrategy
+from backtest import Backtest
+from benchmark import random_walk_prices
+import pandas as pd
+import numpy as np
+import concurrent.futures
+import json
+import time
+import tracemalloc
+
+
+def make_prices(n=30, seed=19):
+    names = [f"R{i:02d}" for i in range(n)] + ['TLT', 'GLD']
+    return random_walk_prices(names, pd.bdate_range('2017-01-01', '2021-12-31'), seed)
+
+
+def _names(node):
+    yield node['name']
+    for child in node['children']:
+        yield from _names(child)
+
+
+def test_nested_spans_counters_and_threads():
+    print("Testing nested spans...")
+    # 沒有進行中的 trace：全部為空操作
+    with tracing.span('orphan') as s:
+        s.set(rows=1)
+        tracing.count('x')
+    assert tracing.current_span() is None
+
+    with tracing.trace('run') as tracer:
+        with tracing.span('outer', rows=10) as outer:
+            time.sleep(0.02)
+            with tracing.span('inner'):
+                tracing.count('hits', 2)
+                time.sleep(0.01)
+            outer.set(cols=3)
+            # 工作執行緒不繼承 context，以 parent 掛回 outer
+            parent = tracing.current_span()
+            with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+                def work(i):
+                    with tracing.span('worker', parent=parent, i=i):
+                        tracing.count('hits')
+                        time.sleep(0.01)
+                list(executor.map(work, range(3)))
+    assert tracing.current_span() is None
+
+    result = tracer.to_dict()
+    outer = result['spans']['children'][0]
+    assert [c['name'] for c in outer['children']] == ['inner', 'worker', 'worker', 'worker']
+    assert outer['attrs'] == {'rows': 10, 'cols': 3}
+    assert outer['wall'] >= 0.03 and result['spans']['wall'] >= outer['wall']
+    assert result['counters'] == {'hits': 5} and outer['children'][0]['counters'] == {'hits': 2}
+
+    table = tracing.span_table(result)
+    assert list(table['path'][:3]) == ['run', 'run/outer', 'run/outer/inner']
+    # 其他執行緒的子 span 與父 span 重疊，不從父 span 的 self 時間扣除
+    outer_row = table[table['path'] == 'run/outer'].iloc[0]
+    assert outer_row['self'] >= 0.015
+    print(f"SUCCESS: {len(table)} spans, outer {outer['wall']:.3f}s")
+
+
+def test_memory_peak():
+    with tracing.trace('mem', memory=True) as tracer:
+        with tracing.span('small'):
+            np.ones(1000)
+        with tracing.span('big'):
+            block = np.ones(2_000_000)  # 16 MB
+            del block
+        with tracing.span('after'):
+            pass
+    spans = {c['name']: c for c in tracer.to_dict()['spans']['children']}
+    assert spans['big']['peak_bytes'] > 15e6
+    assert spans['small']['peak_bytes'] < 1e6 and spans['after']['peak_bytes'] < 1e6
+    # 子 span 的峰值也計入根 span
+    assert tracer.root.peak_bytes >= spans['big']['peak_bytes']
+
+    # 工作執行緒的 span 不重設全域峰值，只記耗時
+    with tracing.trace('mem', memory=True) as tracer:
+        with tracing.span('outer') as outer:
+            block = np.ones(2_000_000)
+            del block
+
+            def work():
+                with tracing.span('worker', parent=outer):
+                    np.ones(1000)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+                executor.submit(work).result()
+    outer = tracer.to_dict()['spans']['children'][0]
+    assert outer['peak_bytes'] > 15e6 and outer['children'][0]['peak_bytes'] is None
+    assert not tracemalloc.is_tracing()
+
+
+def test_pipeline_trace_export_and_compare():
+    print("Testing instrumented fetch / strategy / backtest...")
+    prices = make_prices()
+    fetcher = DataFetcher(InMemoryProvider(prices), store=None)
+    tickers = tuple(prices.columns)
+    params = dict(top_n=2, frequency='ME', lookbacks=[3, 6, 12], weights=[1, 1, 1])
+    risky = [c for c in prices.columns if c.startswith('R')]
+
+    traces = []
+    for _ in range(2):
+        with tracing.trace('pipeline') as tracer:
+            data = fetcher.fetch_data(tickers, '2017-01-01', '2021-12-31')
+            strategy = MomentumStrategy(data)
+            signals = strategy.generate_signals(risky, ['TLT', 'GLD'], **params)
+            Backtest(data, signals).run_backtest()
+            strategy.generate_signals(risky, ['TLT', 'GLD'], **params)
+        traces.append(json.loads(tracer.to_json()))
+    DataFetcher._fetch_data.clear()
+
+    first, second = traces
+    names = set(_names(first['spans']))
+    for expected in ('fetch.load_prices', 'fetch.batch', 'fetch.assemble', 'strategy.calculate_momentum',
+                     'strategy.resample', 'strategy.returns', 'strategy.build_signals', 'backtest.run_backtest'):
+        assert expected in names, expected
+    # 第一次下載（快取未命中），第二次直接命中，不再有下載相關的 span
+    assert first['counters']['cache.fetch_data.miss'] == 1
+    assert second['counters']['cache.fetch_data.hit'] == 1 and 'fetch.load_prices' not in set(_names(second['spans']))
+    # 同一個 strategy 第二次產生信號：resample 與三個回顧期全部命中
+    assert first['counters']['strategy.cache.miss'] == 4 and first['counters']['strategy.cache.hit'] >= 4
+
+    load = next(c for c in first['spans']['children'] if c['name'] == 'fetch.load_prices')
+    assert load['attrs']['rows'] == len(data) and load['attrs']['cols'] == len(tickers)
+
+    diff = tracing.compare(first, json.dumps(second))
+    assert diff.loc['pipeline/fetch.load_prices', 'calls_before'] == 1
+    assert np.isnan(diff.loc['pipeline/fetch.load_prices', 'calls_after'])
+    assert diff.loc['pipeline/backtest.run_backtest', 'ratio'] > 0
+    print(f"SUCCESS: {len(names)} stage names, load {load['wall']:.3f}s")
+
+
+if __name__ == "__main__":
+    test_nested_spans_counters_and_threads()
+    test_memory_peak()
+    test_pipeline_trace_export_and_compare()
@@ -0,0 +1,96 @@
+from strategy import MomentumStrategy
+from benchmark import random_walk_prices
+import pandas as pd
+import numpy as np
+import time
+
+
+def reference_signals(strategy, risky_assets, safe_assets, top_n=1, frequency='ME', lookbacks=[12], weights=[1.0], cash_protection=False):
+    """原本逐日迴圈版本的 generate_signals，作為向量化版本的對照組。"""
+    momentum, _ = strategy.calculate_momentum(resample_freq=frequency, lookbacks=lookbacks, weights=weights)
+    if isinstance(safe_assets, str):
+        safe_assets = [safe_assets]
+    all_assets = sorted(set(risky_assets + safe_assets))
+    signals = pd.DataFrame(0.0, index=momentum.index, columns=all_assets)
+    weight_per_asset = 1.0 / top_n
+
+    for date in momentum.index:
+        if momentum.loc[date].isnull().all():
+            continue
+        risky_momentum = momentum.loc[date, risky_assets]
+        best_risky_assets = risky_momentum.sort_values(ascending=False).head(top_n)
+        valid_safe_assets = [sa for sa in safe_assets if sa in momentum.columns]
+        if valid_safe_assets:
+            safe_mom_series = momentum.loc[date, valid_safe_assets]
+            best_safe_asset = safe_mom_series.idxmax()
+            best_safe_mom_val = safe_mom_series.max()
+        else:
+            best_safe_asset = None
+            best_safe_mom_val = -999
+        for asset, mom_val in best_risky_assets.items():
+            if mom_val > 0:
+                signals.loc[date, asset] += weight_per_asset
+            else:
+                if cash_protection and best_safe_mom_val <= 0:
+                    pass
+                elif best_safe_asset:
+                    signals.loc[date, best_safe_asset] += weight_per_asset
+    return signals.shift(1).fillna(0)
+
+
+def make_prices(n_risky=12, n_days=1500, seed=1):
+    names = [f"R{i:02d}" for i in range(n_risky)] + ['TLT', 'IEF', 'SPY']
+    prices = random_walk_prices(names, pd.bdate_range('2012-01-02', periods=n_days), seed, drift=0.0003, vol=0.015)
+    # 交錯上市日期（類似 UBER），防禦型資產保持完整歷史
+    listing = np.random.default_rng(seed).integers(100, 900, n_risky)
+    for i in range(0, n_risky, 3):
+        prices.iloc[:listing[i], i] = np.nan
+    return prices
+
+
+def test_vectorized_matches_loop():
+    print("Testing vectorized signals against the per-date loop...")
+    prices = make_prices()
+    risky = [c for c in prices.columns if c.startswith('R')]
+    strategy = MomentumStrategy(prices)
+
+    cases = [
+        dict(top_n=1, frequency='ME', lookbacks=[12], weights=[1.0], cash_protection=False),
+        dict(top_n=3, frequency='ME', lookbacks=[3, 6, 9], weights=[34, 33, 33], cash_protection=True),
+        dict(top_n=5, frequency='W-FRI', lookbacks=[13, 26], weights=[0.5, 0.5], cash_protection=False),
+        dict(top_n=20, frequency='W-FRI', lookbacks=[4], weights=[1], cash_protection=True),
+    ]
+    for case in cases:
+        expected = reference_signals(strategy, risky, ['TLT', 'IEF'], **case)
+        actual = strategy.generate_signals(risky, ['TLT', 'IEF'], **case)
+        pd.testing.assert_frame_equal(actual, expected, check_exact=True)
+
+    # 重複代碼與單一防禦資產字串
+    dup = risky[:4] + [risky[1]]
+    expected = reference_signals(strategy, dup, 'TLT', top_n=3, lookbacks=[2])
+    actual = strategy.generate_signals(dup, 'TLT', top_n=3, lookbacks=[2])
+    pd.testing.assert_frame_equal(actual, expected, check_exact=True)
+    print("SUCCESS: Vectorized signals are bit-identical to the loop.")
+
+
+def test_vectorized_speed():
+    prices = make_prices(n_risky=200, n_days=2600, seed=2)
+    risky = [c for c in prices.columns if c.startswith('R')]
+    strategy = MomentumStrategy(prices)
+    args = dict(top_n=10, frequency='W-FRI', lookbacks=[13, 26, 39], weights=[34, 33, 33])
+
+    t0 = time.perf_counter()
+    fast = strategy.generate_signals(risky, ['TLT', 'IEF'], **args)
+    t_fast = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    slow = reference_signals(strategy, risky, ['TLT', 'IEF'], **args)
+    t_slow = time.perf_counter() - t0
+
+    pd.testing.assert_frame_equal(fast, slow, check_exact=True)
+    print(f"Loop: {t_slow:.3f}s, vectorized: {t_fast:.3f}s ({t_slow / t_fast:.0f}x)")
+    assert t_fast < t_slow
+
+
+if __name__ == "__main__":
+    test_vectorized_matches_loop()
+    test_vectorized_speed()
@@ -0,0 +1,117 @@
+from sweep import build_grid, _prepare_context, config_results
+from walk_forward import RangeStats, walk_forward
+from benchmark import random_walk_prices
+import pandas as pd
+import numpy as np
+import time
+
+
+def make_prices(n_risky=12, years=14, seed=11):
+    names = [f"R{i:02d}" for i in range(n_risky)] + ['TLT', 'IEF', 'GLD']
+    return random_walk_prices(names, pd.bdate_range('2008-01-01', periods=252 * years), seed, vol=0.014)
+
+
+GRID = build_grid([[1, 3, 6], [12], [3]], [[1, 1, 1], [1]], [1, 2], ['ME'], [False, True])
+
+
+def test_range_stats_match_calculate_metrics():
+    print("Testing prefix-sum window metrics against calculate_metrics...")
+    prices = make_prices()
+    context = _prepare_context(prices, [c for c in prices.columns if c.startswith('R')], ['TLT', 'IEF'], GRID)
+    backtest, results = config_results(GRID[0], context)
+    stats = RangeStats(results[['Portfolio Returns']])
+
+    first = np.array([1, 10, 40, 100])
+    last = np.array([30, 46, 100, len(results)])
+    windows = stats.metrics(first, last)
+    for k, (a, b) in enumerate(zip(first, last)):
+        expected = backtest.calculate_metrics(results['Portfolio Value'].iloc[a - 1:b])
+        for metric in ('CAGR', 'Sharpe Ratio'):
+            assert np.isclose(windows[metric][k, 0], expected[metric], rtol=1e-9), (metric, a, b)
+    print("Test Passed: range queries equal per-window metrics.")
+
+
+def test_walk_forward_matches_naive_selection():
+    print("Testing walk-forward selection against a naive per-window loop...")
+    prices = make_prices()
+    risky = [c for c in prices.columns if c.startswith('R')]
+    result = walk_forward(prices, risky, ['TLT', 'IEF'], GRID, in_sample_months=36, out_sample_months=12,
+                          start_date='2009-06-01')
+    windows = result['windows']
+    assert (windows['Error'] == '').all() and len(windows) >= 7
+
+    context = _prepare_context(prices, risky, ['TLT', 'IEF'], GRID, start_date='2009-06-01')
+    full = [config_results(config, context) for config in GRID]
+    for _, window in windows.iloc[[0, 3, -1]].iterrows():
+        scores = []
+        for backtest, results in full:
+            values = results['Portfolio Value']
+            start = values.index.searchsorted(window['is_start'], side='right') - 1
+            sliced = values.iloc[max(start, 0):values.index.searchsorted(window['oos_start'], side='right')]
+            scores.append(backtest.calculate_metrics(sliced)['Sharpe Ratio'])
+        best = GRID[int(np.argmax(scores))]
+        assert (window['lookbacks'], window['top_n'], window['frequency'], window['cash_protection']) == (
+            ", ".join(map(str, best['lookbacks'])), best['top_n'], best['frequency'], best['cash_protection'])
+        assert np.isclose(window['IS Sharpe Ratio'], max(scores), rtol=1e-9)
+
+    # 樣本外報酬逐段接起，權益曲線由 initial_capital 出發
+    assert result['returns'].index.is_monotonic_increasing
+    assert result['equity'].iloc[0] == 10000.0
+    assert np.isclose(result['equity'].iloc[-1] / 10000.0, np.prod(1 + windows['OOS Return']))
+    assert set(result['metrics']) == {'CAGR', 'MDD', 'Sharpe Ratio'}
+    print("Test Passed: selections and stitched curve match the naive computation.")
+
+
+def test_many_windows_cost_like_few():
+    print("Testing that window count barely affects run time...")
+    prices = make_prices()
+    risky = [c for c in prices.columns if c.startswith('R')]
+    timings = {}
+    for out_months in (12, 1):
+        t0 = time.perf_counter()
+        result = walk_forward(prices, risky, ['TLT', 'IEF'], GRID, in_sample_months=24, out_sample_months=out_months)
+        timings[out_months] = time.perf_counter() - t0
+        print(f"  {len(result['windows'])} windows: {timings[out_months]:.2f}s")
+    assert timings[1] < 2 * timings[12] + 0.5
+    print("Test Passed: monthly re-optimisation costs about the same as yearly.")
+
+
+def test_rejects_unrankable_metric():
+    try:
+        walk_forward(make_prices(years=4), ['R00', 'R01'], ['TLT'], GRID, rank_by='MDD')
+        assert False, "MDD 不能作為 walk-forward 的排序依據"
+    except ValueError:
+        pass
+
+
+def test_rejects_mixed_frequencies():
+    mixed = build_grid([[1, 3, 6]], [[1, 1, 1]], [1], ['ME', 'W-FRI'], [False])
+    try:
+        walk_forward(make_prices(years=4), ['R00', 'R01'], ['TLT'], mixed)
+        assert False, "不同頻率的樣本外報酬不能接成同一條曲線"
+    except ValueError:
+        pass
+
+
+def test_curve_starts_at_first_selected_window():
+    print("Testing that skipped leading windows do not stretch the equity curve...")
+    prices = make_prices()
+    risky = [c for c in prices.columns if c.startswith('R')]
+    weekly = build_grid([[1, 3, 6]], [[1, 1, 1]], [1, 2], ['W-FRI'], [False, True])
+    # 36 個月約 156-157 週，min_periods=157 會讓開頭幾個較短的樣本內區間被跳過
+    result = walk_forward(prices, risky, ['TLT', 'IEF'], weekly, in_sample_months=36, out_sample_months=12,
+                          min_periods=157)
+    windows = result['windows']
+    selected = windows[windows['Error'] == '']
+    assert windows['Error'].iloc[0] != '' and len(selected) > 0
+    assert result['equity'].index[0] == selected['oos_start'].iloc[0]
+    assert result['returns'].index[0] > selected['oos_start'].iloc[0]
+    print("Test Passed: the curve starts at the first window with out-of-sample returns.")
+
+if __name__ == "__main__":
+    test_range_stats_match_calculate_metrics()
+    test_walk_forward_matches_naive_selection()
+    test_many_windows_cost_like_few()
+    test_rejects_unrankable_metric()
+    test_rejects_mixed_frequencies()
+    test_curve_starts_at_first_selected_window()
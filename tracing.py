@@ -0,0 +1,296 @@
+"""
+輕量的分段追蹤：巢狀 span 記錄每個階段的牆鐘時間、（選擇性的）記憶體峰值、處理的列數 / 欄數，
+以及快取命中 / 未命中等計數器，可匯出成 JSON 並與另一次執行比較。
+
+    with tracing.trace('回測', memory=True) as tracer:
+        with tracing.span('fetch.load_prices', tickers=500) as s:
+            ...
+            s.set(rows=len(data), cols=len(data.columns))
+        tracing.count('strategy.cache.hit')
+    tracer.to_json()
+
+沒有進行中的 trace 時，span / count / annotate 都是空操作（只多一次 ContextVar 查詢），
+因此各模組可以無條件埋點。目前的 span 存在 ContextVar 中，每個 Streamlit session（各自的執行緒）互不干擾；
+ThreadPoolExecutor 的工作執行緒不繼承呼叫端的 context，需以 span(..., parent=...) 明確掛到父 span 下。
+
+記憶體峰值以 tracemalloc 量測（會讓 Python 配置變慢數倍），只在 memory=True 時開啟；
+數值為該 span 期間超出進入時用量的峰值（位元組），NumPy 陣列的配置也會被計入。
+tracemalloc 是整個行程共用的：峰值包含同時間其他執行緒的配置，且每個 span 進入時都會重設全域峰值。
+因此只有呼叫 begin 的執行緒上的 span 記錄峰值，工作執行緒的 span 只記耗時（peak_bytes 為 None）；
+多個 session 同時以 memory=True 追蹤時，彼此的重設仍會互相干擾，峰值僅供參考。
+"""
+import contextvars
+import functools
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+_CURRENT = contextvars.ContextVar('tracing_current_span', default=None)
+
+
+class Span:
+    def __init__(self, tracer, name: str, parent=None, attrs: dict = None):
+        self.tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.attrs = dict(attrs or {})
+        self.counters = {}
+        self.children = []
+        self.thread = threading.current_thread().name
+        self.start = time.perf_counter()
+        self.wall = None
+        self.peak_bytes = None
+        self._mem_start = 0
+
+    def set(self, **attrs):
+        """補記屬性（例如處理完才知道的 rows / cols）。"""
+        self.attrs.update(attrs)
+        return self
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'start': round(self.start - self.tracer.start, 6),
+            'wall': None if self.wall is None else round(self.wall, 6),
+            'peak_bytes': self.peak_bytes,
+            'thread': self.thread,
+            'attrs': {k: _jsonable(v) for k, v in self.attrs.items()},
+            'counters': dict(self.counters),
+            'children': [c.to_dict() for c in self.children],
+        }
+
+
+class _NullSpan:
+    """沒有進行中的 trace 時 span() 回傳的物件，所有操作皆無效果。"""
+
+    def set(self, **attrs):
+        return self
+
+
+_NULL = _NullSpan()
+
+
+def _jsonable(value):
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+class Tracer:
+    def __init__(self, name: str, memory: bool = False):
+        self.name = name
+        self.memory = memory
+        self.start = time.perf_counter()
+        self.started_at = time.time()
+        self.counters = {}
+        self._lock = threading.Lock()
+        self._owns_tracemalloc = False
+        self._previous = None
+        self._thread = threading.current_thread()
+        self.root = Span(self, name)
+
+    def begin(self):
+        """
+        開始記錄並成為目前 context 的 trace，回傳 self。
+        不適合用 with 包住整段流程時（例如 Streamlit 腳本）以 begin / end 成對呼叫。
+        """
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracemalloc = True
+        self._thread = threading.current_thread()
+        if self.memory:
+            self.root._mem_start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self.root.start = self.start = time.perf_counter()
+        self._previous = _CURRENT.get()
+        _CURRENT.set(self.root)
+        return self
+
+    def end(self):
+        """結束記錄：記下總耗時，恢復 begin 之前的 span，回傳 self。"""
+        _CURRENT.set(self._previous)
+        self._exit(self.root)
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+            self._owns_tracemalloc = False
+        return self
+
+    # ---- span 生命週期 ----
+
+    def _measures_memory(self) -> bool:
+        """只在 begin 的執行緒上量測：工作執行緒重設全域峰值會打亂主執行緒 span 的數值。"""
+        return self.memory and threading.current_thread() is self._thread and tracemalloc.is_tracing()
+
+    def _enter(self, span: Span):
+        if self._measures_memory():
+            current, peak = tracemalloc.get_traced_memory()
+            # 重設峰值前先把目前的峰值記到父 span，避免子 span 的重設吃掉父 span 的峰值
+            parent = span.parent
+            if parent is not None:
+                parent.peak_bytes = max(parent.peak_bytes or 0, peak - parent._mem_start)
+            tracemalloc.reset_peak()
+            span._mem_start = current
+        with self._lock:
+            span.parent.children.append(span)
+
+    def _exit(self, span: Span):
+        span.wall = time.perf_counter() - span.start
+        if self._measures_memory():
+            peak = tracemalloc.get_traced_memory()[1]
+            span.peak_bytes = max(span.peak_bytes or 0, peak - span._mem_start)
+            parent = span.parent
+            if parent is not None:
+                parent.peak_bytes = max(parent.peak_bytes or 0, span.peak_bytes + span._mem_start - parent._mem_start)
+
+    def count(self, name: str, n: int = 1, span: Span = None):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+            if span is not None:
+                span.counters[name] = span.counters.get(name, 0) + n
+
+    # ---- 結果 ----
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'started_at': self.started_at,
+            'memory': self.memory,
+            'counters': dict(self.counters),
+            'spans': self.root.to_dict(),
+        }
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False, **kwargs)
+
+    def export(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.to_json(indent=2))
+
+    def table(self) -> pd.DataFrame:
+        return span_table(self.to_dict())
+
+
+def detach():
+    """
+    清除目前 context 的 trace（例如上一次執行中途停止、沒有呼叫 end 的情況）。
+    只清除 ContextVar，不會關閉該 trace 開啟的 tracemalloc；中途可能停止的流程應以 try / finally 呼叫 end。
+    """
+    _CURRENT.set(None)
+
+
+def current_span():
+    """目前執行緒（context）中最內層的 span；沒有進行中的 trace 時回傳 None。"""
+    return _CURRENT.get()
+
+
+@contextmanager
+def trace(name: str, memory: bool = False):
+    """開始一次追蹤，yield Tracer；結束時記錄根 span 的總耗時。巢狀呼叫時建立獨立的 trace。"""
+    tracer = Tracer(name, memory).begin()
+    try:
+        yield tracer
+    finally:
+        tracer.end()
+
+
+@contextmanager
+def span(name: str, parent: Span = None, **attrs):
+    """
+    在目前（或指定的 parent）span 之下開啟子 span，yield Span（可呼叫 .set(rows=..., cols=...)）。
+    沒有進行中的 trace 時 yield 空物件。
+    """
+    parent = parent if parent is not None else _CURRENT.get()
+    if parent is None:
+        yield _NULL
+        return
+    tracer = parent.tracer
+    s = Span(tracer, name, parent, attrs)
+    tracer._enter(s)
+    token = _CURRENT.set(s)
+    try:
+        yield s
+    finally:
+        _CURRENT.reset(token)
+        tracer._exit(s)
+
+
+def traced(name: str):
+    """裝飾器：每次呼叫包在 span(name) 中；函式內可用 annotate() 補記 rows / cols。"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _CURRENT.get() is None:
+                return func(*args, **kwargs)
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name: str, n: int = 1):
+    """計數器加 n（同時記在目前的 span 與整個 trace 上）；沒有進行中的 trace 時不做任何事。"""
+    current = _CURRENT.get()
+    if current is not None:
+        current.tracer.count(name, n, current)
+
+
+def annotate(**attrs):
+    """為目前的 span 補記屬性。"""
+    current = _CURRENT.get()
+    if current is not None:
+        current.set(**attrs)
+
+
+def span_table(trace_dict: dict) -> pd.DataFrame:
+    """
+    將 trace（to_dict 或讀回的 JSON）攤平成一列一個 span 的表格：
+    path（以 / 串起的巢狀名稱）、depth、wall、self（扣除子 span 的耗時）、peak_mb、rows、cols、counters。
+    同一路徑出現多次（例如多個下載批次）時保留各自的列。
+    """
+    rows = []
+
+    def walk(node, prefix, depth):
+        path = f"{prefix}/{node['name']}" if prefix else node['name']
+        wall = node['wall'] or 0.0
+        children_wall = sum(c['wall'] or 0.0 for c in node['children'] if c['thread'] == node['thread'])
+        rows.append({
+            'path': path,
+            'depth': depth,
+            'wall': wall,
+            'self': max(wall - children_wall, 0.0),
+            'peak_mb': None if node['peak_bytes'] is None else node['peak_bytes'] / 1e6,
+            'rows': node['attrs'].get('rows'),
+            'cols': node['attrs'].get('cols'),
+            'counters': ', '.join(f"{k}={v}" for k, v in sorted(node['counters'].items())),
+        })
+        for child in node['children']:
+            walk(child, path, depth + 1)
+
+    walk(trace_dict['spans'], '', 0)
+    return pd.DataFrame(rows, columns=['path', 'depth', 'wall', 'self', 'peak_mb', 'rows', 'cols', 'counters'])
+
+
+def compare(before: dict, after: dict) -> pd.DataFrame:
+    """
+    比較兩次 trace（dict 或 JSON 字串）：依 path 彙總次數與耗時，
+    回傳 wall_before / wall_after / ratio（after ÷ before）與記憶體峰值，依 after 耗時排序。
+    只出現在其中一次的 path 以 NaN 表示。
+    """
+    def aggregate(trace_dict):
+        if isinstance(trace_dict, str):
+            trace_dict = json.loads(trace_dict)
+        table = span_table(trace_dict)
+        return table.groupby('path', sort=False).agg(
+            calls=('wall', 'size'), wall=('wall', 'sum'), peak_mb=('peak_mb', 'max'))
+
+    a, b = aggregate(before), aggregate(after)
+    merged = a.join(b, how='outer', lsuffix='_before', rsuffix='_after')
+    merged['ratio'] = merged['wall_after'] / merged['wall_before']
+    columns = ['calls_before', 'calls_after', 'wall_before', 'wall_after', 'ratio', 'peak_mb_before', 'peak_mb_after']
+    return merged[columns].sort_values('wall_after', ascending=False, na_position='last')
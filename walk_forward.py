@@ -0,0 +1,161 @@
+"""
+Walk-forward 分析：在滾動的樣本內（in-sample）區間挑出最佳參數組合，
+套用到緊接著的樣本外（out-of-sample）區間，最後把各段樣本外報酬接成一條權益曲線。
+
+每個參數組合只完整回測一次，取得逐期報酬後建立前綴和；
+之後每個區間的指標都是 O(1) 的區間查詢，數百個區間的成本與一次回測相當。
+"""
+import numpy as np
+import pandas as pd
+
+from analytics import periods_per_year
+from backtest import Backtest
+from sweep import _prepare_context, batch_results, config_row
+
+# 可由前綴和計算的排序指標（MDD 無法以區間查詢取得，只用於最終曲線）
+RANKABLE_METRICS = ('Sharpe Ratio', 'CAGR')
+
+
+class RangeStats:
+    """
+    逐期報酬矩陣（列 = 結算期，欄 = 參數組合）的前綴和。
+    metrics(first, last) 一次查詢多個區間，回傳每個區間、每個組合的指標。
+    """
+
+    def __init__(self, returns: pd.DataFrame):
+        r = returns.to_numpy(dtype=float)
+        zeros = np.zeros((1, r.shape[1]))
+        self.index = returns.index
+        self.columns = returns.columns
+        self.values = r
+        self.per_year = periods_per_year(returns.index)
+        self._sum = np.vstack([zeros, np.cumsum(r, axis=0)])
+        self._sq = np.vstack([zeros, np.cumsum(r * r, axis=0)])
+        with np.errstate(divide='ignore'):
+            self._log = np.vstack([zeros, np.cumsum(np.log1p(r), axis=0)])
+
+    def metrics(self, first: np.ndarray, last: np.ndarray) -> dict:
+        """
+        報酬 r[first:last] 的 CAGR 與 Sharpe Ratio，各為 (區間數, 組合數) 陣列。
+        與對權益曲線 value[first-1:last] 呼叫 Backtest.calculate_metrics 的結果相同
+        （權益曲線第一筆只作為起點，因此 first 至少為 1）；少於兩期報酬的區間為 NaN。
+        """
+        first = np.maximum(np.asarray(first), 1)
+        last = np.asarray(last)
+        n = (last - first).astype(float)[:, None]
+        valid = n >= 2
+        n_safe = np.where(valid, n, 2)
+
+        with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+            mean = (self._sum[last] - self._sum[first]) / n_safe
+            var = (self._sq[last] - self._sq[first] - n_safe * mean * mean) / (n_safe - 1)
+            std = np.sqrt(np.maximum(var, 0))
+            # 年化方式與 Backtest.calculate_metrics 相同
+            sharpe = np.where(std > 0, mean / std * np.sqrt(self.per_year), 0.0)
+
+            days = (self.index[np.clip(last - 1, 0, None)] - self.index[first - 1]).days.to_numpy()
+            years = (days / 365.25)[:, None]
+            growth = np.exp(self._log[last] - self._log[first])
+            cagr = growth ** (1 / years) - 1
+
+        return {
+            'Sharpe Ratio': np.where(valid, sharpe, np.nan),
+            'CAGR': np.where(valid & (years > 0), cagr, np.nan),
+        }
+
+
+def walk_forward(prices: pd.DataFrame, risky_assets: list, safe_assets: list, grid: list,
+                 in_sample_months: int = 36, out_sample_months: int = 12,
+                 start_date=None, end_date=None, initial_capital: float = 10000.0,
+                 rank_by: str = 'Sharpe Ratio', min_periods: int = 6, membership=None) -> dict:
+    """
+    以 grid 中的參數組合執行 walk-forward 分析。
+
+    每個區間：樣本內為 (t - in_sample_months, t]，樣本外為 (t, t + out_sample_months]，
+    t 每次前進 out_sample_months。樣本內少於 min_periods 期報酬的組合不參與挑選。
+    grid 中所有組合必須使用同一種再平衡頻率，否則 ValueError。
+    membership：歷史成分股（MembershipHistory），與 run_sweep 相同。
+
+    回傳 dict：
+    - windows：每個區間選中的組合、樣本內指標與樣本外報酬
+    - returns / equity：接起來的樣本外逐期報酬與權益曲線（於第一個有樣本外報酬的區間起點為 initial_capital）
+    - metrics：樣本外權益曲線的 CAGR / MDD / Sharpe Ratio
+    """
+    if rank_by not in RANKABLE_METRICS:
+        raise ValueError(f"walk-forward 只能依 {', '.join(RANKABLE_METRICS)} 挑選參數，收到：{rank_by}")
+    if isinstance(safe_assets, str):
+        safe_assets = [safe_assets]
+
+    # 各段樣本外報酬會接成一條曲線並以單一 periods_per_year 年化，混用頻率會讓指標失真
+    frequencies = {config['frequency'] for config in grid}
+    if len(frequencies) > 1:
+        raise ValueError(f"walk-forward 一次只能使用一種再平衡頻率，收到：{', '.join(sorted(frequencies))}")
+
+    # 1. 所有組合批次回測一次（同頻率的組合共用同一組結算日）
+    context = _prepare_context(prices, risky_assets, safe_assets, grid, start_date, end_date, initial_capital,
+                               membership)
+    returns = {}
+    for i, results in enumerate(batch_results(grid, context)):
+        if isinstance(results, Exception):
+            continue
+        returns[i] = results['Portfolio Returns']
+    if not returns:
+        raise ValueError("沒有可回測的參數組合")
+    rs = RangeStats(pd.DataFrame(returns).fillna(0))
+
+    # 2. 區間錨點 t
+    first_date, last_date = rs.index[0], rs.index[-1]
+    in_sample, out_sample = pd.DateOffset(months=in_sample_months), pd.DateOffset(months=out_sample_months)
+    anchors = []
+    t = first_date + in_sample
+    while t < last_date:
+        anchors.append(t)
+        t = t + out_sample
+    if not anchors:
+        raise ValueError(f"資料期間不足 {in_sample_months} 個月的樣本內區間")
+    anchors = pd.DatetimeIndex(anchors)
+
+    # 3. 所有區間 × 所有組合的樣本內指標（一次向量化查詢）
+    is_first = rs.index.searchsorted(anchors - in_sample, side='right')
+    is_last = rs.index.searchsorted(anchors, side='right')
+    scores = rs.metrics(is_first, is_last)[rank_by]
+    scores[(is_last - np.maximum(is_first, 1)) < min_periods] = np.nan
+
+    # 4. 各區間選出最佳組合，取其樣本外報酬
+    rows, pieces, curve_start = [], [], None
+    for w, t in enumerate(anchors):
+        oos_end = min(t + out_sample, last_date)
+        row = {'is_start': t - in_sample, 'oos_start': t, 'oos_end': oos_end}
+        if np.isnan(scores[w]).all():
+            row['Error'] = '樣本內期間不足'
+            rows.append(row)
+            continue
+        best = int(np.nanargmax(scores[w]))
+        config_id = rs.columns[best]
+        oos = rs.index.searchsorted([t, t + out_sample], side='right')
+        piece = pd.Series(rs.values[oos[0]:oos[1], best], index=rs.index[oos[0]:oos[1]])
+        if curve_start is None:
+            curve_start = t
+        pieces.append(piece)
+        row.update(config_row(grid[config_id]))
+        row[f"IS {rank_by}"] = scores[w, best]
+        row['OOS Return'] = float(np.prod(1 + piece.to_numpy()) - 1)
+        row['Error'] = ''
+        rows.append(row)
+
+    # 權益曲線從第一個有樣本外報酬的區間起算，前面被跳過的區間不佔時間
+    oos_returns = pd.concat(pieces) if pieces else pd.Series(dtype=float)
+    equity = pd.concat([
+        pd.Series([initial_capital], index=[curve_start if curve_start is not None else anchors[0]]),
+        initial_capital * (1 + oos_returns).cumprod(),
+    ])
+    metrics = {}
+    if len(equity) > 2:
+        metrics = Backtest(prices, pd.DataFrame(), initial_capital).calculate_metrics(equity)
+
+    return {
+        'windows': pd.DataFrame(rows),
+        'returns': oos_returns,
+        'equity': equity,
+        'metrics': metrics,
+    }